@@ -2,7 +2,7 @@
 """
 Админ-панель для управления пользователями, оборудованием и продукцией
 """
-from flask import Flask, render_template_string, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template_string, request, redirect, url_for, flash, jsonify, g
 import sys
 import os
 
@@ -12,10 +12,13 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from app.core.database import DatabaseManager, RoleEnum, engine
+# Профиль пула соединений для процесса админ-панели (см. DB_POOL_DEFAULTS)
+os.environ.setdefault('APP_PROCESS', 'admin')
+
+from app.core.database import DatabaseManager, QueryScope, RoleEnum, engine, remove_sessions
 from app.core.models import User, Equipment, Product, ProductEquipment, Workshop
 from app.core.config import ADMIN_HOST, ADMIN_PORT, ADMIN_DEBUG
-from sqlalchemy import Column, Integer, String, text
+from sqlalchemy import Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 
 # Создаем базовую модель для справочников
@@ -45,60 +48,35 @@ class Seal(DictBase):
 def init_dictionaries():
     """Создает таблицы справочников, если их нет"""
     try:
-        from app.core.database import engine
-        # Используем тот же engine, что и основное приложение
-        # Создаем таблицы через SQL напрямую, если их нет
-        with engine.connect() as conn:
-            # Проверяем и создаем таблицы
-            for table_name, table_class in [('mass_names', MassName), ('volumes', Volume), 
-                                           ('containers', Container), ('seals', Seal)]:
-                try:
-                    # Проверяем, существует ли таблица
-                    result = conn.execute(text(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'"))
-                    if not result.fetchone():
-                        # Создаем таблицу
-                        DictBase.metadata.tables[table_name].create(engine, checkfirst=True)
-                except Exception:
-                    pass
+        # Используем тот же engine, что и основное приложение.
+        # checkfirst проверяет наличие таблиц средствами диалекта (SQLite, PostgreSQL)
         DictBase.metadata.create_all(engine, checkfirst=True)
     except Exception as e:
         print(f"Ошибка при создании справочников: {e}")
-        # Пробуем создать через SQL
-        try:
-            from app.core.database import engine
-            from sqlalchemy import text
-            with engine.connect() as conn:
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS mass_names (
-                        id INTEGER PRIMARY KEY,
-                        name VARCHAR(200) NOT NULL UNIQUE
-                    )
-                """))
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS volumes (
-                        id INTEGER PRIMARY KEY,
-                        value VARCHAR(50) NOT NULL UNIQUE
-                    )
-                """))
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS containers (
-                        id INTEGER PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL UNIQUE
-                    )
-                """))
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS seals (
-                        id INTEGER PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL UNIQUE
-                    )
-                """))
-                conn.commit()
-        except Exception as e2:
-            pass
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'admin-panel-secret-key-change-in-production')
 
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Сессии потока запроса не переживают запрос (SessionLocal, ReadSessionLocal - scoped_session)"""
+    remove_sessions()
+
+
+@app.before_request
+def start_query_scope():
+    """Учет SQL-запросов эндпоинта (число, время в БД, самый медленный запрос)"""
+    g.query_scope = QueryScope(f"admin:{request.endpoint}").start()
+
+
+@app.teardown_request
+def finish_query_scope(exception=None):
+    scope = g.pop('query_scope', None)
+    if scope is not None:
+        scope.finish()
+
+
 # Инициализируем справочники
 init_dictionaries()
 
@@ -374,7 +352,8 @@ def index():
 @app.route('/equipment')
 def equipment_list():
     with DatabaseManager() as db:
-        equipment = db.db.query(Equipment).all()
+        refs = db.get_reference_data()
+        equipment = refs.equipment
         equipment_html = """
         <div class="card">
             <h2>🔧 Управление оборудованием</h2>
@@ -392,7 +371,7 @@ def equipment_list():
                 <tbody>
         """
         for item in equipment:
-            workshop = db.db.query(Workshop).filter(Workshop.id == item.workshop_id).first() if item.workshop_id else None
+            workshop = item.workshop
             equipment_html += f"""
                     <tr>
                         <td>{item.id}</td>
@@ -416,7 +395,8 @@ def equipment_list():
 @app.route('/products')
 def products_list():
     with DatabaseManager() as db:
-        products = db.db.query(Product).all()
+        refs = db.get_reference_data()
+        products = refs.products
         products_html = """
         <div class="card">
             <h2>📦 Управление продукцией</h2>
@@ -453,8 +433,10 @@ def products_list():
             
             # Получаем связанное оборудование
             equipment_list = []
-            for pe in product.product_equipment:
-                equipment_list.append(pe.equipment.name)
+            for equipment_id in product.equipment_ids:
+                equipment = refs.get_equipment_by_id(equipment_id)
+                if equipment:
+                    equipment_list.append(equipment.name)
             equipment_str = ', '.join(equipment_list) if equipment_list else '-'
             
             products_html += f"""
@@ -480,7 +462,7 @@ def products_list():
 @app.route('/workshops')
 def workshops_list():
     with DatabaseManager() as db:
-        workshops = db.db.query(Workshop).all()
+        workshops = db.get_reference_data().workshops
         workshops_html = """
         <div class="card">
             <h2>🏭 Управление участками</h2>
@@ -869,7 +851,7 @@ def add_equipment():
             return redirect(url_for('equipment_list'))
     
     with DatabaseManager() as db:
-        workshops = db.db.query(Workshop).all()
+        workshops = db.get_reference_data().get_all_workshops()
         if not workshops:
             return render_page('<div class="card"><h2>Ошибка</h2><p>Нет доступных участков. Сначала добавьте участок.</p><a href="/workshops/add" class="btn btn-success">Добавить участок</a></div>', section='equipment')
         
@@ -898,7 +880,7 @@ def edit_equipment(item_id):
             db.db.commit()
             return redirect(url_for('equipment_list'))
         
-        workshops = db.db.query(Workshop).all()
+        workshops = db.get_reference_data().get_all_workshops()
         fields = [
             {'name': 'name', 'label': 'Название', 'type': 'text', 'required': True},
             {'name': 'code', 'label': 'Код (опционально)', 'type': 'text'},
@@ -971,7 +953,7 @@ def add_product():
                 if not product_name or product_name == '':
                     # Возвращаем пользователя на форму с сообщением об ошибке
                     # Используем ту же сессию db
-                    equipment_list = db.db.query(Equipment).filter(Equipment.is_active == True).all()
+                    equipment_list = db.get_reference_data().get_all_equipment()
                     try:
                         mass_names = db.db.query(MassName).all()
                         volumes = db.db.query(Volume).all()
@@ -1133,7 +1115,7 @@ def add_product():
                 print(traceback.format_exc())
                 flash(f'Ошибка при сохранении: {error_msg}', 'error')
                 # Возвращаем форму с данными
-                equipment_list = db.db.query(Equipment).filter(Equipment.is_active == True).all()
+                equipment_list = db.get_reference_data().get_all_equipment()
                 try:
                     mass_names = db.db.query(MassName).all()
                     volumes = db.db.query(Volume).all()
@@ -1215,7 +1197,7 @@ def add_product():
                                  message_type='error')
     
     with DatabaseManager() as db:
-        equipment_list = db.db.query(Equipment).filter(Equipment.is_active == True).all()
+        equipment_list = db.get_reference_data().get_all_equipment()
         
         # Получаем данные для выпадающих списков
         mass_names = db.db.query(MassName).all()
@@ -1383,7 +1365,7 @@ def edit_product(product_id):
         # Получаем текущее связанное оборудование
         current_equipment_ids = [str(pe.equipment_id) for pe in product.product_equipment]
         
-        equipment_list = db.db.query(Equipment).filter(Equipment.is_active == True).all()
+        equipment_list = db.get_reference_data().get_all_equipment()
         
         # Получаем данные для выпадающих списков
         try:
@@ -1500,29 +1482,42 @@ def delete_product(product_id):
             db.db.commit()
     return redirect(url_for('products_list'))
 
+# Названия ролей в сообщениях пользователям
+ROLE_NAMES = {RoleEnum.EMPLOYEE: 'сотрудник', RoleEnum.MANAGER: 'начальник', RoleEnum.ADMIN: 'администратор'}
+
 # API для обновления роли пользователя
 @app.route('/api/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     data = request.json
     
-    with DatabaseManager() as db:
+    # Изменение пользователя и сообщение ему в Telegram (outbox) - одна транзакция
+    with DatabaseManager(unit_of_work=True) as db:
         user = db.db.query(User).filter(User.id == user_id).first()
         if not user:
             return jsonify({'error': 'Пользователь не найден'}), 404
         
+        messages = []
         if 'role' in data:
             try:
-                user.role = RoleEnum(data['role'])
+                role = RoleEnum(data['role'])
             except ValueError:
                 return jsonify({'error': f"Неверная роль. Доступные: {[r.value for r in RoleEnum]}"}), 400
+            if role != user.role:
+                user.role = role
+                messages.append(f"👤 Ваша роль изменена: {ROLE_NAMES[role]}. Отправьте /start, чтобы обновить меню.")
         
         if 'is_active' in data:
+            if data['is_active'] != user.is_active:
+                messages.append("✅ Доступ к боту открыт. Отправьте /start." if data['is_active']
+                                else "⛔ Доступ к боту закрыт администратором.")
             user.is_active = data['is_active']
         
         if 'full_name' in data:
             user.full_name = data['full_name']
         
-        db.db.commit()
+        for message in messages:
+            db.enqueue_message(user.telegram_id, message)
+        db.commit()
         
         return jsonify({
             'id': user.id,
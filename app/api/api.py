@@ -1,15 +1,26 @@
 """
 REST API для работы с системой управления заданиями
 """
-from flask import Flask, jsonify, request
+import os
+
+# Профиль пула соединений для процесса API (см. DB_POOL_DEFAULTS)
+os.environ.setdefault('APP_PROCESS', 'api')
+
+from flask import Flask, Response, g, jsonify, request
 from flask_restx import Api, Resource, fields, Namespace
 from datetime import datetime, date
-from app.core.database import DatabaseManager, RoleEnum, ShiftEnum, TaskStatusEnum
+from app.core.database import (
+    DatabaseManager, RoleEnum, ShiftEnum, TaskStatusEnum, TaskValidationError,
+    QueryScope, get_lock_metrics, get_query_stats, render_prometheus_metrics, decode_task_cursor, remove_sessions,
+    task_assigned_message
+)
 from app.core.models import User, Task, Equipment, Product
-from app.core.config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG
+from app.core.config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG, API_MAX_PAGE_SIZE
 from app.core.utils import logger, generate_csv_report, generate_pdf_report
 
 app = Flask(__name__)
+# Ответ 404 от api.abort - только текст ошибки, без подсказки Flask-RESTX о похожих URL
+app.config['ERROR_404_HELP'] = False
 api = Api(
     app,
     version='1.0',
@@ -18,6 +29,25 @@ api = Api(
     doc='/swagger/'
 )
 
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Сессии потока запроса не переживают запрос (SessionLocal, ReadSessionLocal - scoped_session)"""
+    remove_sessions()
+
+
+@app.before_request
+def start_query_scope():
+    """Учет SQL-запросов эндпоинта (число, время в БД, самый медленный запрос)"""
+    g.query_scope = QueryScope(f"api:{request.endpoint}").start()
+
+
+@app.teardown_request
+def finish_query_scope(exception=None):
+    scope = g.pop('query_scope', None)
+    if scope is not None:
+        scope.finish()
+
 # Namespace для задач
 tasks_ns = Namespace('tasks', description='Операции с заданиями')
 api.add_namespace(tasks_ns)
@@ -59,9 +89,28 @@ task_create_model = api.model('TaskCreate', {
     'notes': fields.String(description='Примечания')
 })
 
+task_bulk_item_model = api.model('TaskBulkItem', {
+    'employee_id': fields.Integer(required=True, description='ID сотрудника'),
+    'equipment_id': fields.Integer(required=True, description='ID оборудования'),
+    'product_id': fields.Integer(required=True, description='ID продукции'),
+    'planned_quantity': fields.Float(required=True, description='Плановое количество'),
+    'shift': fields.Integer(description='Смена (1 или 2); по умолчанию - общая смена запроса'),
+    'task_date': fields.String(description='Дата задания (YYYY-MM-DD); по умолчанию - общая дата запроса'),
+    'notes': fields.String(description='Примечания')
+})
+
+task_bulk_create_model = api.model('TaskBulkCreate', {
+    'manager_id': fields.Integer(required=True, description='ID начальника'),
+    'shift': fields.Integer(description='Смена (1 или 2) для всех заданий'),
+    'task_date': fields.String(description='Дата (YYYY-MM-DD) для всех заданий'),
+    'notify': fields.Boolean(description='Создать уведомления сотрудникам (по умолчанию true)'),
+    'tasks': fields.List(fields.Nested(task_bulk_item_model), required=True, description='Задания')
+})
+
 task_update_model = api.model('TaskUpdate', {
     'status': fields.String(description='Статус задания'),
-    'actual_quantity': fields.Float(description='Фактическое количество')
+    'actual_quantity': fields.Float(description='Фактическое количество'),
+    'expected_status': fields.String(description='Обновить, только если текущий статус такой (иначе 409)')
 })
 
 user_model = api.model('User', {
@@ -83,20 +132,42 @@ class TaskList(Resource):
     @api.param('manager_id', 'ID начальника')
     @api.param('employee_id', 'ID сотрудника')
     @api.param('status', 'Статус задания')
+    @api.param('limit', f'Размер страницы от 1 до {API_MAX_PAGE_SIZE} (с manager_id или employee_id); '
+                        'курсор следующей страницы - в заголовке X-Next-Cursor')
+    @api.param('cursor', 'Курсор страницы из заголовка X-Next-Cursor предыдущего ответа')
     @api.marshal_list_with(task_model)
     def get(self):
         """Получить список заданий"""
         manager_id = request.args.get('manager_id', type=int)
         employee_id = request.args.get('employee_id', type=int)
         status = request.args.get('status')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        # abort, а не return: ответ с ошибкой не должен проходить marshal_list_with
+        if 'limit' in request.args and (limit is None or limit < 1):
+            api.abort(400, 'limit должен быть целым числом не меньше 1')
+        if limit:
+            limit = min(limit, API_MAX_PAGE_SIZE)
+        if cursor:
+            try:
+                decode_task_cursor(cursor)
+            except ValueError:
+                api.abort(400, 'Неверный курсор страницы')
         
-        with DatabaseManager() as db:
+        next_cursor = None
+        with DatabaseManager(readonly=True) as db:
             if manager_id:
                 status_enum = TaskStatusEnum(status) if status else None
-                tasks = db.get_tasks_by_manager(manager_id, status_enum)
+                if limit:
+                    tasks, next_cursor = db.get_tasks_page_by_manager(manager_id, status_enum, limit=limit, cursor=cursor)
+                else:
+                    tasks = db.get_tasks_by_manager(manager_id, status_enum)
             elif employee_id:
                 status_enum = TaskStatusEnum(status) if status else None
-                tasks = db.get_tasks_by_employee(employee_id, status_enum)
+                if limit:
+                    tasks, next_cursor = db.get_tasks_page_by_employee(employee_id, status_enum, limit=limit, cursor=cursor)
+                else:
+                    tasks = db.get_tasks_by_employee(employee_id, status_enum)
             else:
                 tasks = db.db.query(Task).all()
             
@@ -119,6 +190,8 @@ class TaskList(Resource):
                     'notes': task.notes
                 })
             
+            if next_cursor:
+                return result, 200, {'X-Next-Cursor': next_cursor}
             return result
     
     @api.doc('create_task')
@@ -132,7 +205,8 @@ class TaskList(Resource):
             task_date = datetime.strptime(data['task_date'], '%Y-%m-%d').date()
             shift = ShiftEnum(data['shift'])
             
-            with DatabaseManager() as db:
+            # Одна транзакция на запрос: commit при выходе из with
+            with DatabaseManager(unit_of_work=True) as db:
                 task = db.create_task(
                     manager_id=data['manager_id'],
                     employee_id=data['employee_id'],
@@ -143,6 +217,15 @@ class TaskList(Resource):
                     task_date=datetime.combine(task_date, datetime.min.time()),
                     notes=data.get('notes')
                 )
+                # Уведомление сотруднику пишется в той же транзакции, в Telegram его отправит бот
+                employee = db.get_user_by_id(task.employee_id)
+                refs = db.get_reference_data()
+                equipment = refs.get_equipment_by_id(task.equipment_id)
+                product = refs.get_product_by_id(task.product_id)
+                if employee and equipment and product:
+                    db.notify_user(employee, task.id, task_assigned_message(
+                        task.id, equipment.name, product.name, task.planned_quantity, task.shift, task.task_date
+                    ))
                 
                 return {
                     'id': task.id,
@@ -163,6 +246,38 @@ class TaskList(Resource):
             return {'error': str(e)}, 400
 
 
+@tasks_ns.route('/bulk')
+class TaskBulkCreate(Resource):
+    """Массовое создание заданий (план смены)"""
+    
+    @api.doc('create_tasks_bulk')
+    @api.expect(task_bulk_create_model)
+    def post(self):
+        """Создать задания одной транзакцией
+        
+        Все строки проверяются до записи; при ошибках не создается ни одно задание,
+        а в ответе 400 перечислены номера строк (с 0) и причины.
+        """
+        data = request.json or {}
+        if not data.get('manager_id') or not isinstance(data.get('tasks'), list):
+            return {'error': 'Нужны manager_id и список tasks'}, 400
+        
+        # Общие смена и дата запроса подставляются в строки без своих значений
+        defaults = {key: data[key] for key in ('shift', 'task_date') if data.get(key) is not None}
+        tasks = [{**defaults, **task} if isinstance(task, dict) else {} for task in data['tasks']]
+        
+        try:
+            with DatabaseManager() as db:
+                task_ids = db.create_tasks_bulk(data['manager_id'], tasks, notify=data.get('notify', True))
+        except TaskValidationError as e:
+            return {
+                'error': str(e),
+                'errors': [{'index': index, 'error': message} for index, message in e.errors]
+            }, 400
+        
+        return {'created': len(task_ids), 'task_ids': task_ids}, 201
+
+
 @tasks_ns.route('/<int:task_id>')
 @api.param('task_id', 'ID задания')
 class TaskDetail(Resource):
@@ -194,26 +309,42 @@ class TaskDetail(Resource):
                 'notes': task.notes
             }
     
-    @api.doc('update_task')
+    @api.doc('update_task', responses={404: 'Задание не найдено или в архиве', 409: 'Статус задания изменился'})
     @api.expect(task_update_model)
     @api.marshal_with(task_model)
     def put(self, task_id):
         """Обновить задание"""
-        data = request.json
+        data = request.json or {}
+        try:
+            status = TaskStatusEnum(data['status']) if 'status' in data else None
+            expected_status = TaskStatusEnum(data['expected_status']) if data.get('expected_status') else None
+        except ValueError:
+            api.abort(400, 'Неверный статус задания')
         
-        with DatabaseManager() as db:
-            task = db.get_task_by_id(task_id)
-            if not task:
-                return {'error': 'Задание не найдено'}, 404
+        # Одна транзакция на запрос: commit при выходе из with, откат при abort
+        with DatabaseManager(unit_of_work=True) as db:
+            # Обновления возвращают новую строку задания (UPDATE ... RETURNING)
+            # или None, если условный UPDATE не изменил ни одной строки
+            task = None
+            updated = True
+            if status is not None:
+                task = db.update_task_status(task_id, status, expected_status)
+                updated = task is not None
+                expected_status = status
             
-            if 'status' in data:
-                status = TaskStatusEnum(data['status'])
-                db.update_task_status(task_id, status)
+            if updated and 'actual_quantity' in data:
+                task = db.update_task_actual_quantity(task_id, data['actual_quantity'], expected_status)
+                updated = task is not None
             
-            if 'actual_quantity' in data:
-                db.update_task_actual_quantity(task_id, data['actual_quantity'])
-            
-            task = db.get_task_by_id(task_id)
+            if not updated:
+                # abort, а не return: ответ с ошибкой не должен проходить marshal_with
+                if db.get_task_by_id(task_id, include_archive=False) is None:
+                    api.abort(404, 'Задание не найдено или перенесено в архив (архив не изменяется)')
+                api.abort(409, 'Статус задания изменился, обновление не применено')
+            if task is None:
+                task = db.get_task_by_id(task_id)
+            if not task:
+                api.abort(404, 'Задание не найдено')
             return {
                 'id': task.id,
                 'manager_id': task.manager_id,
@@ -244,7 +375,7 @@ class UserList(Resource):
         try:
             role = request.args.get('role')
             
-            with DatabaseManager() as db:
+            with DatabaseManager(readonly=True) as db:
                 if role:
                     try:
                         role_enum = RoleEnum(role.lower())  # Приводим к нижнему регистру
@@ -288,7 +419,7 @@ class UserDetail(Resource):
     def get(self, user_id):
         """Получить пользователя по ID"""
         with DatabaseManager() as db:
-            user = db.db.query(User).filter(User.id == user_id).first()
+            user = db.get_user_by_id(user_id)
             if not user:
                 return {'error': 'Пользователь не найден'}, 404
             
@@ -322,17 +453,15 @@ class ReportGenerate(Resource):
         if not manager_id:
             return {'error': 'manager_id обязателен'}, 400
         
-        with DatabaseManager() as db:
-            tasks = db.get_tasks_by_manager(manager_id)
-            
-            # Фильтрация по датам
-            if date_from:
-                date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-                tasks = [t for t in tasks if t.task_date >= date_from_obj]
-            
-            if date_to:
-                date_to_obj = datetime.strptime(date_to, '%Y-%m-%d')
-                tasks = [t for t in tasks if t.task_date <= date_to_obj]
+        # Отчет читает через движок чтения и не конкурирует с записью заданий
+        with DatabaseManager(readonly=True) as db:
+            # Фильтрация по датам выполняется в запросе
+            tasks = db.get_tasks_by_manager(
+                manager_id,
+                date_from=datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None,
+                date_to=datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None,
+                load='joined'
+            )
             
             if not tasks:
                 return {'error': 'Нет заданий для отчета'}, 404
@@ -358,6 +487,49 @@ class ReportGenerate(Resource):
             }
 
 
+@reports_ns.route('/summary')
+class ReportSummary(Resource):
+    """Сводка план/факт из дневных итогов"""
+    
+    @api.doc('report_summary')
+    @api.param('manager_id', 'ID начальника', required=True)
+    @api.param('date_from', 'Дата начала (YYYY-MM-DD)', required=False)
+    @api.param('date_to', 'Дата окончания (YYYY-MM-DD)', required=False)
+    @api.param('group_by', 'Группировка через запятую: task_date, shift, employee_id, equipment_id, product_id',
+               required=False, default='task_date')
+    def get(self):
+        """Сводка начальника за период: план, факт и число заданий по статусам"""
+        manager_id = request.args.get('manager_id', type=int)
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        group_by = tuple(request.args.get('group_by', 'task_date').split(','))
+        
+        if not manager_id:
+            return {'error': 'manager_id обязателен'}, 400
+        
+        # Сводка читает task_daily_agg (строка на день/смену/сотрудника/...), а не задания
+        with DatabaseManager(readonly=True) as db:
+            try:
+                rows = db.get_daily_summary(
+                    manager_id,
+                    date_from=datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None,
+                    date_to=datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None,
+                    group_by=group_by
+                )
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            
+            result = []
+            for row in rows:
+                item = row._asdict()
+                if 'task_date' in item:
+                    item['task_date'] = item['task_date'].date().isoformat()
+                if 'shift' in item:
+                    item['shift'] = item['shift'].value
+                result.append(item)
+            return result
+
+
 @api.route('/equipment')
 class EquipmentList(Resource):
     """Список оборудования"""
@@ -368,8 +540,8 @@ class EquipmentList(Resource):
         """Получить список оборудования"""
         workshop_id = request.args.get('workshop_id', type=int)
         
-        with DatabaseManager() as db:
-            equipment_list = db.get_all_equipment(workshop_id)
+        with DatabaseManager(readonly=True) as db:
+            equipment_list = db.get_reference_data().get_all_equipment(workshop_id)
             
             result = []
             for eq in equipment_list:
@@ -392,8 +564,8 @@ class ProductList(Resource):
     @api.doc('list_products')
     def get(self):
         """Получить список продукции"""
-        with DatabaseManager() as db:
-            products = db.get_all_products()
+        with DatabaseManager(readonly=True) as db:
+            products = db.get_reference_data().get_all_products()
             
             result = []
             for product in products:
@@ -411,7 +583,23 @@ class ProductList(Resource):
 @app.route('/health')
 def health_check():
     """Проверка здоровья API"""
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()}), 200
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'db_locks': get_lock_metrics()
+    }), 200
+
+
+@app.route('/metrics')
+def metrics():
+    """Метрики запросов и блокировок БД процесса API (формат Prometheus)"""
+    return Response(render_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics/queries')
+def metrics_queries():
+    """Счетчики запросов по эндпоинтам с самым медленным запросом каждого"""
+    return jsonify(get_query_stats()), 200
 
 
 if __name__ == '__main__':
@@ -10,21 +10,39 @@ project_root = Path(__file__).resolve().parent.parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
+# Профиль пула соединений для процесса бота (см. DB_POOL_DEFAULTS)
+os.environ.setdefault('APP_PROCESS', 'bot')
+
+import functools
 import logging
 from datetime import datetime, date, timedelta
 from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler, MessageHandler,
+    Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler,
     ContextTypes, ConversationHandler, filters
 )
 from telegram.constants import ParseMode
-from telegram.error import Conflict, NetworkError, TimedOut
+from telegram.error import Conflict, NetworkError, TelegramError, TimedOut
 
-from app.core.config import TELEGRAM_BOT_TOKEN, Roles, Shifts
-from app.core.database import DatabaseManager, RoleEnum, ShiftEnum, TaskStatusEnum
-from app.core.models import User
-from app.core.utils import logger, generate_csv_report, generate_pdf_report, get_period_dates, get_now_utc3, get_today_utc3
+from app.core.config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, BOT_METRICS_HOST, BOT_METRICS_PORT, BOT_CONVERSATION_TIMEOUT,
+    BOT_MODE, BOT_WEBHOOK_URL, BOT_WEBHOOK_LISTEN, BOT_WEBHOOK_PORT, BOT_WEBHOOK_PATH, BOT_WEBHOOK_SECRET,
+    BOT_WEBHOOK_MAX_CONNECTIONS, BOT_UPDATE_QUEUE_SIZE, BOT_CONCURRENT_UPDATES, Roles, Shifts
+)
+from app.core.database import (
+    AsyncDatabaseManager, RoleEnum, ShiftEnum, TaskStatusEnum, TaskValidationError, shift_name, task_assigned_message
+)
+from app.core.utils import logger, task_report_row, get_period_dates, get_now_utc3, get_today_utc3
+from app.bot.update_processor import SessionUpdateProcessor, UpdateQueue, instrument_handlers
+from app.bot.outbox import start_outbox_dispatcher, stop_outbox_dispatcher
+from app.bot.rate_limiter import SendRateLimiter
+from app.bot.report_pool import report_pool, ReportQueueFull
+from app.bot.persistence import SQLitePersistence, evict_idle_users, EVICT_INTERVAL_SECONDS
+from app.bot.picker import (
+    PICKER_RESET, parse_picker_callback, picker_keyboard, picker_text, reset_search_row,
+    clean_query, send_picker
+)
 
 # Состояния для ConversationHandler
 SELECTING_TASK_DATE, SELECTING_SHIFT, SELECTING_EQUIPMENT, SELECTING_PRODUCT, ENTERING_QUANTITY, SELECTING_EMPLOYEE, CONFIRMING_TASK, HANDLING_ERROR = range(8)
@@ -34,9 +52,14 @@ SELECTING_REPORT_PERIOD = 11  # Состояние для выбора пери
 SELECTING_REPORT_FORMAT = 12  # Состояние для выбора формата отчета
 ENTERING_REPORT_DATE_FROM = 13  # Состояние для ввода даты начала кастомного периода
 ENTERING_REPORT_DATE_TO = 14  # Состояние для ввода даты конца кастомного периода
+PLANNING_DATE, PLANNING_SHIFT, PLANNING_CONFIRM = range(15, 18)  # Состояния планирования смены
+
+TASKS_PAGE_SIZE = 15  # Заданий на странице списка
+TASKS_PICKER_SIZE = 10  # Заданий в кнопках выбора задания
 
-# Глобальные переменные для хранения данных при создании задания
-task_data = {}
+# Черновик создаваемого задания хранится в context.user_data[TASK_DRAFT_KEY]:
+# user_data сохраняется в SQLitePersistence и переживает перезапуск бота
+TASK_DRAFT_KEY = 'task_draft'
 
 
 class Command:
@@ -51,12 +74,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
     
-    with DatabaseManager() as db:
-        db_user = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        db_user = await db.get_identity(user.id)
         
         if not db_user:
             # Регистрация нового пользователя
-            db_user = db.create_user(
+            db_user = await db.create_user(
                 telegram_id=user.id,
                 username=user.username,
                 full_name=user.full_name or user.username or f"User {user.id}",
@@ -72,21 +95,50 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Пользователь {user.id} выполнил команду /start")
 
 
+# Кнопки главной клавиатуры по ролям
+MANAGER_MENU = [
+    ["📋 Создать задание", "📊 Мои задания"],
+    ["📈 Отчет", "🔔 Уведомления"],
+    ["📅 План смены"],
+]
+EMPLOYEE_MENU = [
+    ["📋 Мои задания", "✅ Подтвердить задание"],
+    ["📝 Отчитаться", "🔔 Уведомления"],
+]
+# Нажатие кнопки главной клавиатуры
+MAIN_MENU_FILTER = filters.Text([text for menu in (MANAGER_MENU, EMPLOYEE_MENU) for row in menu for text in row])
+
+
 def get_main_keyboard(role: str):
     """Получить главную клавиатуру в зависимости от роли"""
-    if role in ['admin', 'manager']:
-        buttons = [
-            [KeyboardButton("📋 Создать задание"), KeyboardButton("📊 Мои задания")],
-            [KeyboardButton("📈 Отчет"), KeyboardButton("🔔 Уведомления")]
-        ]
-    else:
-        buttons = [
-            [KeyboardButton("📋 Мои задания"), KeyboardButton("✅ Подтвердить задание")],
-            [KeyboardButton("📝 Отчитаться"), KeyboardButton("🔔 Уведомления")]
-        ]
+    menu = MANAGER_MENU if role in ['admin', 'manager'] else EMPLOYEE_MENU
+    buttons = [[KeyboardButton(text) for text in row] for row in menu]
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
 
 
+# Кнопки выбора статуса заданий
+STATUS_BUTTONS = [
+    (TaskStatusEnum.CREATED, "🆕 Созданные"),
+    (TaskStatusEnum.RECEIVED, "✅ Полученные"),
+    (TaskStatusEnum.COMPLETED, "✔️ Завершенные"),
+    (TaskStatusEnum.CLOSED, "🔒 Закрытые"),
+]
+
+
+def get_status_keyboard(prefix: str, counts: dict):
+    """Клавиатура выбора статуса заданий с количеством заданий на кнопках
+    
+    Args:
+        prefix: префикс callback_data ("mgr_status_" или "status_")
+        counts: {TaskStatusEnum: количество} из count_tasks_by_status
+    """
+    keyboard = [[InlineKeyboardButton(f"📋 Все задания ({sum(counts.values())})", callback_data=f"{prefix}all")]]
+    for status, label in STATUS_BUTTONS:
+        keyboard.append([InlineKeyboardButton(f"{label} ({counts[status]})", callback_data=f"{prefix}{status.value}")])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=f"{prefix}cancel")])
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def show_error_choice(update_or_query, error_message: str, previous_state, context: ContextTypes.DEFAULT_TYPE):
     """Показать выбор действия при ошибке: вернуться назад или отменить"""
     keyboard = [
@@ -124,7 +176,7 @@ async def handle_error_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if query.data == "error_cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
     elif query.data == "error_back":
@@ -155,7 +207,7 @@ async def handle_error_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
                 [InlineKeyboardButton("2-я смена (20:00-8:00)", callback_data="shift_2")],
                 [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
             ]
-            task_date = task_data.get(update.effective_user.id, {}).get('task_date')
+            task_date = context.user_data.get(TASK_DRAFT_KEY, {}).get('task_date')
             task_date_str = task_date.strftime('%d.%m.%Y') if task_date else "не указана"
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(
@@ -164,71 +216,14 @@ async def handle_error_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
                 reply_markup=reply_markup
             )
             return SELECTING_SHIFT
-        elif previous_state == SELECTING_EQUIPMENT:
-            with DatabaseManager() as db:
-                equipment_list = db.get_all_equipment()
-                keyboard = []
-                for eq in equipment_list:
-                    workshop_name = eq.workshop.name if eq.workshop else "Без участка"
-                    keyboard.append([InlineKeyboardButton(
-                        f"{eq.name} ({workshop_name})",
-                        callback_data=f"eq_{eq.id}"
-                    )])
-                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-                
-                shift = task_data.get(update.effective_user.id, {}).get('shift')
-                shift_name = "1-я смена (8:00-20:00)" if shift and shift.value == 1 else "2-я смена (20:00-8:00)"
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(
-                    f"✅ Смена: {shift_name}\n\n"
-                    "Выберите оборудование:",
-                    reply_markup=reply_markup
-                )
-            return SELECTING_EQUIPMENT
-        elif previous_state == SELECTING_PRODUCT:
-            # Возвращаемся к выбору оборудования, чтобы можно было выбрать другое
-            with DatabaseManager() as db:
-                equipment_list = db.get_all_equipment()
-                keyboard = []
-                for eq in equipment_list:
-                    workshop_name = eq.workshop.name if eq.workshop else "Без участка"
-                    keyboard.append([InlineKeyboardButton(
-                        f"{eq.name} ({workshop_name})",
-                        callback_data=f"eq_{eq.id}"
-                    )])
-                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-                
-                shift = task_data.get(update.effective_user.id, {}).get('shift')
-                shift_name = "1-я смена (8:00-20:00)" if shift and shift.value == 1 else "2-я смена (20:00-8:00)"
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(
-                    f"✅ Смена: {shift_name}\n\n"
-                    "Выберите оборудование:",
-                    reply_markup=reply_markup
-                )
-            return SELECTING_EQUIPMENT
+        elif previous_state in (SELECTING_EQUIPMENT, SELECTING_PRODUCT):
+            # С выбора продукции возвращаемся к выбору оборудования, чтобы можно было выбрать другое
+            picker_state(context, reset=True)
+            return await show_equipment_picker(query.edit_message_text, context)
         elif previous_state == ENTERING_QUANTITY:
             # Возвращаемся к выбору продукции
-            equipment_id = task_data.get(update.effective_user.id, {}).get('equipment_id')
-            with DatabaseManager() as db:
-                products = db.get_all_products()
-                available_products = []
-                for product in products:
-                    equipment_for_product = db.get_equipment_for_product(product.id)
-                    if any(eq.id == equipment_id for eq in equipment_for_product) or product.default_equipment_id == equipment_id:
-                        available_products.append(product)
-                
-                keyboard = []
-                for product in available_products:
-                    keyboard.append([InlineKeyboardButton(product.name, callback_data=f"prod_{product.id}")])
-                keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(
-                    "Выберите продукцию:",
-                    reply_markup=reply_markup
-                )
-            return SELECTING_PRODUCT
+            picker_state(context, reset=True)
+            return await show_product_picker(query.edit_message_text, context)
         elif previous_state == SELECTING_EMPLOYEE:
             # Возвращаемся к вводу количества
             await query.edit_message_text("Введите количество продукции (число):")
@@ -238,13 +233,18 @@ async def handle_error_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 
 def role_required(required_roles: list):
-    """Декоратор для проверки роли пользователя"""
+    """Декоратор для проверки роли пользователя
+    
+    Роль и активность берутся из кэша пользователей (identity_cache), поэтому
+    повторные обновления от того же пользователя не обращаются к БД.
+    """
     def decorator(func):
+        @functools.wraps(func)
         async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
             user = update.effective_user
-            with DatabaseManager() as db:
-                db_user = db.get_user_by_telegram_id(user.id)
-                if not db_user or db_user.role.value not in required_roles:
+            async with AsyncDatabaseManager() as db:
+                identity = await db.get_identity(user.id)
+                if not identity or not identity.is_active or identity.role.value not in required_roles:
                     await update.message.reply_text("❌ У вас нет доступа к этой команде.")
                     return
             return await func(update, context, *args, **kwargs)
@@ -255,8 +255,7 @@ def role_required(required_roles: list):
 @role_required(['admin', 'manager'])
 async def create_task_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало создания задания (только для начальника) - выбор даты"""
-    global task_data
-    task_data[update.effective_user.id] = {}
+    context.user_data[TASK_DRAFT_KEY] = {}
     
     # Запрашиваем дату задания с кнопками быстрого выбора
     today = get_today_utc3()
@@ -305,13 +304,13 @@ async def select_task_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return SELECTING_TASK_DATE
         elif query.data == "cancel":
             await query.edit_message_text("❌ Создание задания отменено.")
-            task_data.pop(update.effective_user.id, None)
+            context.user_data.pop(TASK_DRAFT_KEY, None)
             return ConversationHandler.END
         else:
             return SELECTING_TASK_DATE
         
         # Сохраняем дату
-        task_data[update.effective_user.id]['task_date'] = task_date
+        context.user_data[TASK_DRAFT_KEY]['task_date'] = task_date
         
         # Предлагаем выбрать смену
         keyboard = [
@@ -389,7 +388,7 @@ async def select_task_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return HANDLING_ERROR
             
             # Сохраняем дату
-            task_data[update.effective_user.id]['task_date'] = task_date
+            context.user_data[TASK_DRAFT_KEY]['task_date'] = task_date
             context.user_data.pop('waiting_custom_date', None)  # Убираем флаг
             
             # Предлагаем выбрать смену
@@ -418,6 +417,137 @@ async def select_task_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
 
+# === Выбор оборудования, продукции и сотрудника: страницы и поиск ===
+# Состояние выбора (поисковый запрос, участок) - в черновике задания, ключ 'picker'.
+# Записи берутся из снимков кэшей процесса, смена страницы и поиск не читают БД.
+
+# Текст, который в шагах выбора считается поисковым запросом. Кнопки главной
+# клавиатуры не поиск: их обрабатывают свои обработчики ("📋 Создать задание" -
+# начинает создание заново)
+PICKER_SEARCH_FILTER = filters.TEXT & ~filters.COMMAND & ~filters.Regex("^❌ Отмена$") & ~MAIN_MENU_FILTER
+
+
+def picker_state(context: ContextTypes.DEFAULT_TYPE, reset: bool = False) -> dict:
+    """Состояние текущего выбора в черновике задания; reset - начать выбор заново"""
+    draft = context.user_data.setdefault(TASK_DRAFT_KEY, {})
+    if reset or 'picker' not in draft:
+        draft['picker'] = {}
+    return draft['picker']
+
+
+def shift_title(shift) -> str:
+    """Название смены для сообщений создания задания"""
+    return "1-я смена (8:00-20:00)" if shift and shift.value == 1 else "2-я смена (20:00-8:00)"
+
+
+async def show_equipment_picker(send, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Выбор оборудования: сначала участок, затем оборудование участка или найденное поиском"""
+    state = picker_state(context)
+    search_query = state.get('query')
+    async with AsyncDatabaseManager() as db:
+        refs = await db.get_reference_data()
+    groups = refs.get_equipment_groups()
+    title = f"✅ Смена: {shift_title(context.user_data[TASK_DRAFT_KEY].get('shift'))}"
+    hint = "начало названия или кода оборудования"
+    
+    if state.get('workshop') is None and not search_query and len(groups) > 1:
+        options = [
+            (workshop.id if workshop else 0, f"🏭 {workshop.name if workshop else 'Без участка'} ({count})")
+            for workshop, count in groups
+        ]
+        reply_markup = picker_keyboard('eqws', options, page)
+        await send_picker(send, picker_text(f"{title}\n\nВыберите участок:", len(options), hint=hint), reply_markup)
+        return SELECTING_EQUIPMENT
+    
+    workshop_id = state.get('workshop')
+    equipment_list = refs.search_equipment(search_query or '', workshop_id)
+    options = []
+    for eq in equipment_list:
+        workshop_name = eq.workshop.name if eq.workshop else "Без участка"
+        options.append((eq.id, f"{eq.name} ({workshop_name})"))
+    extra_rows = reset_search_row(search_query)
+    if len(groups) > 1:
+        extra_rows.append([InlineKeyboardButton("🏭 К участкам", callback_data="eqwspg_0")])
+    if workshop_id is not None:
+        workshop = refs.get_workshop_by_id(workshop_id)
+        title += f"\nУчасток: {workshop.name if workshop else 'Без участка'}"
+    reply_markup = picker_keyboard('eq', options, page, extra_rows)
+    await send_picker(
+        send, picker_text(f"{title}\n\nВыберите оборудование:", len(options), search_query, hint), reply_markup
+    )
+    return SELECTING_EQUIPMENT
+
+
+async def show_product_picker(send, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Выбор продукции, доступной для выбранного оборудования"""
+    state = picker_state(context)
+    search_query = state.get('query')
+    equipment_id = context.user_data[TASK_DRAFT_KEY].get('equipment_id')
+    async with AsyncDatabaseManager() as db:
+        refs = await db.get_reference_data()
+    equipment = refs.get_equipment_by_id(equipment_id)
+    options = [(product.id, product.name) for product in refs.search_products(search_query or '', equipment_id)]
+    reply_markup = picker_keyboard('prod', options, page, reset_search_row(search_query))
+    title = f"✅ Оборудование: {equipment.name if equipment else equipment_id}\n\nВыберите продукцию:"
+    await send_picker(
+        send, picker_text(title, len(options), search_query, "начало названия или кода продукции"), reply_markup
+    )
+    return SELECTING_PRODUCT
+
+
+async def show_employee_picker(send, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Выбор ответственного сотрудника"""
+    state = picker_state(context)
+    search_query = state.get('query')
+    async with AsyncDatabaseManager() as db:
+        directory = await db.get_employee_directory()
+    options = [(employee.id, employee.display_name) for employee in directory.search(search_query or '')]
+    reply_markup = picker_keyboard('emp', options, page, reset_search_row(search_query))
+    await send_picker(
+        send, picker_text("Выберите ответственного сотрудника:", len(options), search_query, "начало имени или фамилии"),
+        reply_markup
+    )
+    return SELECTING_EMPLOYEE
+
+
+async def picker_action(query, context: ContextTypes.DEFAULT_TYPE, prefix: str, show, current_state):
+    """
+    Кнопки выбора с префиксом prefix
+    
+    Навигация (страница, сброс поиска, номер страницы) и кнопки чужих
+    сообщений обрабатываются здесь: (следующее состояние, None). Выбор
+    записи - (None, ID записи).
+    """
+    if query.data == PICKER_RESET:
+        picker_state(context).pop('query', None)
+        return await show(query.edit_message_text, context), None
+    parsed = parse_picker_callback(query.data)
+    if parsed is None or parsed[0] != prefix:
+        return current_state, None
+    _, is_page, number = parsed
+    if is_page:
+        return await show(query.edit_message_text, context, number), None
+    return None, number
+
+
+async def search_equipment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск оборудования по началу названия или кода"""
+    picker_state(context)['query'] = clean_query(update.message.text)
+    return await show_equipment_picker(update.message.reply_text, context)
+
+
+async def search_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск продукции по началу названия или кода"""
+    picker_state(context)['query'] = clean_query(update.message.text)
+    return await show_product_picker(update.message.reply_text, context)
+
+
+async def search_employee(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск сотрудника по началу имени или фамилии"""
+    picker_state(context)['query'] = clean_query(update.message.text)
+    return await show_employee_picker(update.message.reply_text, context)
+
+
 async def select_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора смены"""
     query = update.callback_query
@@ -425,15 +555,16 @@ async def select_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
     shift = int(query.data.split("_")[1])
-    task_data[update.effective_user.id]['shift'] = ShiftEnum(shift)
+    context.user_data[TASK_DRAFT_KEY]['shift'] = ShiftEnum(shift)
     
     # Теперь выбираем оборудование
-    with DatabaseManager() as db:
-        workshops = db.get_all_workshops()
+    async with AsyncDatabaseManager() as db:
+        refs = await db.get_reference_data()
+        workshops = refs.get_all_workshops()
         if not workshops:
             return await show_error_choice(
                 query,
@@ -443,7 +574,7 @@ async def select_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         
         # Получаем оборудование
-        equipment_list = db.get_all_equipment()
+        equipment_list = refs.get_all_equipment()
         if not equipment_list:
             return await show_error_choice(
                 query,
@@ -451,25 +582,9 @@ async def select_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 SELECTING_SHIFT,
                 context
             )
-        
-        # Создаем клавиатуру с оборудованием
-        keyboard = []
-        for eq in equipment_list:
-            workshop_name = eq.workshop.name if eq.workshop else "Без участка"
-            keyboard.append([InlineKeyboardButton(
-                f"{eq.name} ({workshop_name})",
-                callback_data=f"eq_{eq.id}"
-            )])
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-        
-        shift_name = "1-я смена (8:00-20:00)" if shift == 1 else "2-я смена (20:00-8:00)"
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            f"✅ Смена: {shift_name}\n\n"
-            "Выберите оборудование:",
-            reply_markup=reply_markup
-        )
-        return SELECTING_EQUIPMENT
+    
+    picker_state(context, reset=True)
+    return await show_equipment_picker(query.edit_message_text, context)
 
 
 async def select_equipment(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -479,48 +594,44 @@ async def select_equipment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
-    equipment_id = int(query.data.split("_")[1])
-    task_data[update.effective_user.id]['equipment_id'] = equipment_id
-    
-    with DatabaseManager() as db:
-        products = db.get_all_products()
-        if not products:
-            return await show_error_choice(
-                query,
-                "❌ В системе нет продукции. Обратитесь к администратору.",
-                SELECTING_EQUIPMENT,
-                context
-            )
-        
-        # Фильтруем продукцию, доступную для выбранного оборудования
-        available_products = []
-        for product in products:
-            equipment_for_product = db.get_equipment_for_product(product.id)
-            if any(eq.id == equipment_id for eq in equipment_for_product) or product.default_equipment_id == equipment_id:
-                available_products.append(product)
+    parsed = parse_picker_callback(query.data)
+    if parsed and parsed[0] == 'eqws':
+        # Участок выбран или возврат к списку участков (eqwspg_<страница>)
+        _, is_page, number = parsed
+        state = picker_state(context, reset=True)
+        if not is_page:
+            state['workshop'] = number
+        return await show_equipment_picker(query.edit_message_text, context, number if is_page else 0)
+    next_state, equipment_id = await picker_action(query, context, 'eq', show_equipment_picker, SELECTING_EQUIPMENT)
+    if equipment_id is None:
+        return next_state
+    context.user_data[TASK_DRAFT_KEY]['equipment_id'] = equipment_id
+    
+    async with AsyncDatabaseManager() as db:
+        # Продукция, доступная для выбранного оборудования
+        refs = await db.get_reference_data()
+        available_products = refs.get_products_for_equipment(equipment_id)
         
         if not available_products:
+            if not refs.get_all_products():
+                return await show_error_choice(
+                    query,
+                    "❌ В системе нет продукции. Обратитесь к администратору.",
+                    SELECTING_EQUIPMENT,
+                    context
+                )
             return await show_error_choice(
                 query,
                 "❌ Для выбранного оборудования нет доступной продукции.",
                 SELECTING_EQUIPMENT,
                 context
             )
-        
-        keyboard = []
-        for product in available_products:
-            keyboard.append([InlineKeyboardButton(product.name, callback_data=f"prod_{product.id}")])
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "Выберите продукцию:",
-            reply_markup=reply_markup
-        )
-        return SELECTING_PRODUCT
+    
+    picker_state(context, reset=True)
+    return await show_product_picker(query.edit_message_text, context)
 
 
 async def select_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -530,11 +641,14 @@ async def select_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
-    product_id = int(query.data.split("_")[1])
-    task_data[update.effective_user.id]['product_id'] = product_id
+    next_state, product_id = await picker_action(query, context, 'prod', show_product_picker, SELECTING_PRODUCT)
+    if product_id is None:
+        return next_state
+    context.user_data[TASK_DRAFT_KEY]['product_id'] = product_id
+    context.user_data[TASK_DRAFT_KEY].pop('picker', None)
     
     await query.edit_message_text("Введите количество продукции (число):")
     return ENTERING_QUANTITY
@@ -558,32 +672,20 @@ async def enter_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return HANDLING_ERROR
         
-        task_data[update.effective_user.id]['planned_quantity'] = quantity
+        context.user_data[TASK_DRAFT_KEY]['planned_quantity'] = quantity
         
-        with DatabaseManager() as db:
-            employees = db.get_all_employees()
-            if not employees:
-                return await show_error_choice(
-                    update,
-                    "❌ В системе нет сотрудников. Обратитесь к администратору.",
-                    ENTERING_QUANTITY,
-                    context
-                )
-            
-            keyboard = []
-            for emp in employees:
-                keyboard.append([InlineKeyboardButton(
-                    emp.full_name or f"ID: {emp.telegram_id}",
-                    callback_data=f"emp_{emp.id}"
-                )])
-            keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Выберите ответственного сотрудника:",
-                reply_markup=reply_markup
+        async with AsyncDatabaseManager() as db:
+            directory = await db.get_employee_directory()
+        if not len(directory):
+            return await show_error_choice(
+                update,
+                "❌ В системе нет сотрудников. Обратитесь к администратору.",
+                ENTERING_QUANTITY,
+                context
             )
-            return SELECTING_EMPLOYEE
+        
+        picker_state(context, reset=True)
+        return await show_employee_picker(update.message.reply_text, context)
     except ValueError:
         keyboard = [
             [InlineKeyboardButton("◀️ Вернуться назад", callback_data="error_back")],
@@ -606,28 +708,32 @@ async def select_employee(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
-    employee_id = int(query.data.split("_")[1])
-    task_data[update.effective_user.id]['employee_id'] = employee_id
+    next_state, employee_id = await picker_action(query, context, 'emp', show_employee_picker, SELECTING_EMPLOYEE)
+    if employee_id is None:
+        return next_state
+    context.user_data[TASK_DRAFT_KEY]['employee_id'] = employee_id
+    context.user_data[TASK_DRAFT_KEY].pop('picker', None)
     
     # Формируем подтверждение
-    with DatabaseManager() as db:
-        equipment = db.get_equipment_by_id(task_data[update.effective_user.id]['equipment_id'])
-        product = db.get_product_by_id(task_data[update.effective_user.id]['product_id'])
-        employee = db.db.query(User).filter(User.id == employee_id).first()
+    async with AsyncDatabaseManager() as db:
+        refs = await db.get_reference_data()
+        equipment = refs.get_equipment_by_id(context.user_data[TASK_DRAFT_KEY]['equipment_id'])
+        product = refs.get_product_by_id(context.user_data[TASK_DRAFT_KEY]['product_id'])
+        employee = await db.get_user_by_id(employee_id)
         
-        shift = task_data[update.effective_user.id]['shift']
+        shift = context.user_data[TASK_DRAFT_KEY]['shift']
         shift_name = "1-я смена (8:00-20:00)" if shift.value == 1 else "2-я смена (20:00-8:00)"
-        task_date = task_data[update.effective_user.id]['task_date']
+        task_date = context.user_data[TASK_DRAFT_KEY]['task_date']
         
         message = f"📋 Подтвердите создание задания:\n\n"
         message += f"Дата: {task_date.strftime('%d.%m.%Y')}\n"
         message += f"Смена: {shift_name}\n"
         message += f"Оборудование: {equipment.name}\n"
         message += f"Продукция: {product.name}\n"
-        message += f"Количество: {task_data[update.effective_user.id]['planned_quantity']}\n"
+        message += f"Количество: {context.user_data[TASK_DRAFT_KEY]['planned_quantity']}\n"
         message += f"Сотрудник: {employee.full_name or f'ID: {employee.telegram_id}'}"
         
         keyboard = [
@@ -646,11 +752,11 @@ async def confirm_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "cancel":
         await query.edit_message_text("❌ Создание задания отменено.")
-        task_data.pop(update.effective_user.id, None)
+        context.user_data.pop(TASK_DRAFT_KEY, None)
         return ConversationHandler.END
     
     user_id = update.effective_user.id
-    data = task_data.get(user_id, {})
+    data = context.user_data.get(TASK_DRAFT_KEY, {})
     
     if not all(k in data for k in ['equipment_id', 'product_id', 'planned_quantity', 'employee_id', 'shift', 'task_date']):
         return await show_error_choice(
@@ -660,11 +766,12 @@ async def confirm_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context
         )
     
-    with DatabaseManager() as db:
-        manager = db.get_user_by_telegram_id(user_id)
+    # Задание и уведомление фиксируются одной транзакцией
+    async with AsyncDatabaseManager(unit_of_work=True) as db:
+        manager = await db.get_identity(user_id)
         
         # Создаем задание
-        task = db.create_task(
+        task = await db.create_task(
             manager_id=manager.id,
             employee_id=data['employee_id'],
             equipment_id=data['equipment_id'],
@@ -675,36 +782,149 @@ async def confirm_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
             notes=None
         )
         
-        # Отправляем уведомление сотруднику
-        employee = db.db.query(User).filter(User.id == data['employee_id']).first()
+        # Уведомление сотруднику: сообщение в Telegram отправит диспетчер outbox
+        employee = await db.get_user_by_id(data['employee_id'])
         if employee:
-            equipment = db.get_equipment_by_id(data['equipment_id'])
-            product = db.get_product_by_id(data['product_id'])
-            shift_name = "1-я смена (8:00-20:00)" if data['shift'].value == 1 else "2-я смена (20:00-8:00)"
-            
-            notification_msg = f"📋 Вам назначено новое задание №{task.id}\n\n"
-            notification_msg += f"Оборудование: {equipment.name}\n"
-            notification_msg += f"Продукция: {product.name}\n"
-            notification_msg += f"Количество: {data['planned_quantity']}\n"
-            notification_msg += f"Смена: {shift_name}\n"
-            notification_msg += f"Дата: {data['task_date'].strftime('%d.%m.%Y')}"
-            
-            db.create_notification(employee.id, task.id, notification_msg)
-            
-            # Отправляем уведомление сотруднику в Telegram
-            try:
-                await context.bot.send_message(
-                    chat_id=employee.telegram_id,
-                    text=f"🔔 {notification_msg}",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления сотруднику: {e}")
+            refs = await db.get_reference_data()
+            notification_msg = task_assigned_message(
+                task.id, refs.get_equipment_by_id(data['equipment_id']).name,
+                refs.get_product_by_id(data['product_id']).name,
+                data['planned_quantity'], data['shift'], data['task_date']
+            )
+            await db.notify_user(employee, task.id, notification_msg)
+        await db.commit()
         
         await query.edit_message_text(f"✅ Задание №{task.id} успешно создано и отправлено сотруднику!")
-        task_data.pop(user_id, None)
-        logger.info(f"Создано задание {task.id} менеджером {manager.telegram_id}")
+        context.user_data.pop(TASK_DRAFT_KEY, None)
+        logger.info(f"Создано задание {task.id} менеджером {user_id}")
+    
+    return ConversationHandler.END
+
+
+# === Планирование смены: копия последнего плана одной транзакцией ===
+
+@role_required(['admin', 'manager'])
+async def plan_shift_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начало планирования смены - выбор даты"""
+    today = get_today_utc3()
+    tomorrow = today + timedelta(days=1)
+    keyboard = [
+        [InlineKeyboardButton(f"📅 Сегодня ({today.strftime('%d.%m.%Y')})", callback_data="plan_date_today")],
+        [InlineKeyboardButton(f"📅 Завтра ({tomorrow.strftime('%d.%m.%Y')})", callback_data="plan_date_tomorrow")],
+        [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
+    ]
+    await update.message.reply_text(
+        "📅 План смены\n\n"
+        "Задания последней такой же смены будут скопированы на выбранную дату.\n"
+        "Выберите дату:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return PLANNING_DATE
+
+
+async def plan_select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор даты плана смены"""
+    query = update.callback_query
+    await query.answer()
+    
+    if query.data == "cancel":
+        await query.edit_message_text("❌ Планирование смены отменено.")
+        context.user_data.pop('shift_plan', None)
+        return ConversationHandler.END
+    
+    plan_date = get_today_utc3()
+    if query.data == "plan_date_tomorrow":
+        plan_date += timedelta(days=1)
+    context.user_data['shift_plan'] = {'task_date': plan_date}
+    
+    keyboard = [
+        [InlineKeyboardButton(shift_name(ShiftEnum.FIRST), callback_data="plan_shift_1")],
+        [InlineKeyboardButton(shift_name(ShiftEnum.SECOND), callback_data="plan_shift_2")],
+        [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
+    ]
+    await query.edit_message_text(
+        f"✅ Дата: {plan_date.strftime('%d.%m.%Y')}\n\nВыберите смену:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return PLANNING_SHIFT
+
+
+async def plan_select_shift(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор смены: показываем последний план этой смены для копирования"""
+    query = update.callback_query
+    await query.answer()
+    
+    plan = context.user_data.get('shift_plan')
+    if query.data == "cancel" or not plan:
+        await query.edit_message_text("❌ Планирование смены отменено.")
+        context.user_data.pop('shift_plan', None)
+        return ConversationHandler.END
+    
+    shift = ShiftEnum(int(query.data.split("_")[-1]))
+    async with AsyncDatabaseManager() as db:
+        manager = await db.get_identity(update.effective_user.id)
+        source_date, source_tasks = await db.get_last_shift_plan(manager.id, shift, plan['task_date'])
+    
+    if not source_tasks:
+        await query.edit_message_text(
+            f"📋 Нет предыдущих заданий на {shift_name(shift)}.\n"
+            "Создайте задания через «📋 Создать задание» или API (POST /tasks/bulk)."
+        )
+        context.user_data.pop('shift_plan', None)
+        return ConversationHandler.END
+    
+    plan['shift'] = shift
+    plan['tasks'] = [
+        {
+            'employee_id': task.employee_id,
+            'equipment_id': task.equipment_id,
+            'product_id': task.product_id,
+            'planned_quantity': task.planned_quantity,
+            'shift': shift,
+            'task_date': plan['task_date'],
+        }
+        for task in source_tasks
+    ]
+    employees = len({task.employee_id for task in source_tasks})
+    keyboard = [
+        [InlineKeyboardButton(f"✅ Создать заданий: {len(source_tasks)}", callback_data="plan_confirm")],
+        [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
+    ]
+    await query.edit_message_text(
+        f"📅 План на {plan['task_date'].strftime('%d.%m.%Y')}, {shift_name(shift)}\n\n"
+        f"Копия плана за {source_date.strftime('%d.%m.%Y')}\n"
+        f"Заданий: {len(source_tasks)}, сотрудников: {employees}\n\n"
+        "Создать задания и отправить уведомления сотрудникам?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return PLANNING_CONFIRM
+
+
+async def plan_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Создание заданий плана смены одной транзакцией и рассылка сотрудникам"""
+    query = update.callback_query
+    await query.answer()
+    
+    plan = context.user_data.pop('shift_plan', None)
+    if query.data == "cancel" or not plan or 'tasks' not in plan:
+        await query.edit_message_text("❌ Планирование смены отменено.")
+        return ConversationHandler.END
     
+    # Задания, уведомления и сообщения сотрудникам (по одному на сотрудника) - одна транзакция
+    async with AsyncDatabaseManager() as db:
+        manager = await db.get_identity(update.effective_user.id)
+        try:
+            task_ids = await db.create_tasks_bulk(manager.id, plan['tasks'])
+        except TaskValidationError as e:
+            await query.edit_message_text(f"❌ {e}\n\nИсправьте справочники или сотрудников и повторите.")
+            return ConversationHandler.END
+    
+    employees = {task['employee_id'] for task in plan['tasks']}
+    await query.edit_message_text(
+        f"✅ Создано заданий: {len(task_ids)} на {plan['task_date'].strftime('%d.%m.%Y')}, "
+        f"{shift_name(plan['shift'])}.\nУведомления отправлены сотрудникам: {len(employees)}."
+    )
+    logger.info(f"План смены: {len(task_ids)} заданий создано менеджером {update.effective_user.id}")
     return ConversationHandler.END
 
 
@@ -712,29 +932,20 @@ async def confirm_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def my_tasks_manager(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало просмотра заданий начальника с выбором статуса"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        manager = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        manager = await db.get_identity(user.id)
         if not manager:
             await update.message.reply_text("❌ Пользователь не найден.")
             return ConversationHandler.END
         
-        # Проверяем, есть ли вообще задания
-        all_tasks = db.get_tasks_by_manager(manager.id)
-        if not all_tasks:
+        # Количество заданий по статусам: и проверка на пустоту, и подписи кнопок
+        counts = await db.count_tasks_by_status(manager.id, RoleEnum.MANAGER)
+        if not any(counts.values()):
             await update.message.reply_text("📋 У вас пока нет созданных заданий.")
             return ConversationHandler.END
         
         # Показываем клавиатуру для выбора статуса
-        keyboard = [
-            [InlineKeyboardButton("📋 Все задания", callback_data="mgr_status_all")],
-            [InlineKeyboardButton("🆕 Созданные (новые)", callback_data="mgr_status_created")],
-            [InlineKeyboardButton("✅ Полученные (в работе)", callback_data="mgr_status_received")],
-            [InlineKeyboardButton("✔️ Завершенные", callback_data="mgr_status_completed")],
-            [InlineKeyboardButton("🔒 Закрытые", callback_data="mgr_status_closed")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="mgr_status_cancel")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = get_status_keyboard("mgr_status_", counts)
         await update.message.reply_text(
             "📋 Выберите статус заданий для просмотра:",
             reply_markup=reply_markup
@@ -753,10 +964,14 @@ async def show_manager_tasks_by_status(update: Update, context: ContextTypes.DEF
         return ConversationHandler.END
     
     user = update.effective_user
-    status_param = query.data.replace("mgr_status_", "")
+    # mgr_status_<статус> - первая страница, mgr_page_<статус>_<курсор> - следующие
+    if query.data.startswith("mgr_page_"):
+        status_param, _, cursor = query.data.replace("mgr_page_", "").partition("_")
+    else:
+        status_param, cursor = query.data.replace("mgr_status_", ""), None
     
-    with DatabaseManager() as db:
-        manager = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        manager = await db.get_identity(user.id)
         if not manager:
             await query.edit_message_text("❌ Пользователь не найден.")
             return ConversationHandler.END
@@ -778,7 +993,9 @@ async def show_manager_tasks_by_status(update: Update, context: ContextTypes.DEF
                 status_filter = None
         
         # Получаем задания с фильтром
-        tasks = db.get_tasks_by_manager(manager.id, status=status_filter)
+        tasks, next_cursor = await db.get_tasks_page_by_manager(
+            manager.id, status=status_filter, limit=TASKS_PAGE_SIZE, cursor=cursor, load='joined'
+        )
         
         if not tasks:
             status_text = f"📋 У вас нет заданий со статусом '{status_name}'."
@@ -789,7 +1006,7 @@ async def show_manager_tasks_by_status(update: Update, context: ContextTypes.DEF
         message = f"📋 Ваши задания ({status_name}):\n\n"
         status_emoji = {"created": "🆕", "received": "✅", "completed": "✔️", "closed": "🔒"}
         
-        for task in tasks[:15]:  # Показываем до 15 заданий
+        for task in tasks:
             emoji = status_emoji.get(task.status.value, '❓')
             message += f"{emoji} Задание №{task.id}\n"
             message += f"   Сотрудник: {task.employee.full_name if task.employee else 'N/A'}\n"
@@ -802,39 +1019,34 @@ async def show_manager_tasks_by_status(update: Update, context: ContextTypes.DEF
             message += f"   Статус: {task.status.value}\n"
             message += f"   Дата: {task.task_date.strftime('%d.%m.%Y') if task.task_date else 'N/A'}\n\n"
         
-        if len(tasks) > 15:
-            message += f"\n... и еще {len(tasks) - 15} заданий"
+        # Кнопка следующей страницы (курсор - последнее показанное задание)
+        reply_markup = None
+        if next_cursor:
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(
+                "➡️ Следующие задания", callback_data=f"mgr_page_{status_param}_{next_cursor}"
+            )]])
         
-        await query.edit_message_text(message)
+        await query.edit_message_text(message, reply_markup=reply_markup)
         return ConversationHandler.END
 
 
 async def my_tasks_employee(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало просмотра заданий сотрудника с выбором статуса"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        employee = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        employee = await db.get_identity(user.id)
         if not employee:
             await update.message.reply_text("❌ Пользователь не найден.")
             return ConversationHandler.END
         
-        # Проверяем, есть ли вообще задания
-        all_tasks = db.get_tasks_by_employee(employee.id)
-        if not all_tasks:
+        # Количество заданий по статусам: и проверка на пустоту, и подписи кнопок
+        counts = await db.count_tasks_by_status(employee.id, RoleEnum.EMPLOYEE)
+        if not any(counts.values()):
             await update.message.reply_text("📋 У вас нет заданий.")
             return ConversationHandler.END
         
         # Показываем клавиатуру для выбора статуса
-        keyboard = [
-            [InlineKeyboardButton("📋 Все задания", callback_data="status_all")],
-            [InlineKeyboardButton("🆕 Созданные (новые)", callback_data="status_created")],
-            [InlineKeyboardButton("✅ Полученные (в работе)", callback_data="status_received")],
-            [InlineKeyboardButton("✔️ Завершенные", callback_data="status_completed")],
-            [InlineKeyboardButton("🔒 Закрытые", callback_data="status_closed")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="status_cancel")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = get_status_keyboard("status_", counts)
         await update.message.reply_text(
             "📋 Выберите статус заданий для просмотра:",
             reply_markup=reply_markup
@@ -852,10 +1064,14 @@ async def show_tasks_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
     
     user = update.effective_user
-    status_param = query.data.replace("status_", "")
+    # status_<статус> - первая страница, emp_page_<статус>_<курсор> - следующие
+    if query.data.startswith("emp_page_"):
+        status_param, _, cursor = query.data.replace("emp_page_", "").partition("_")
+    else:
+        status_param, cursor = query.data.replace("status_", ""), None
     
-    with DatabaseManager() as db:
-        employee = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        employee = await db.get_identity(user.id)
         if not employee:
             await query.edit_message_text("❌ Пользователь не найден.")
             return ConversationHandler.END
@@ -877,7 +1093,9 @@ async def show_tasks_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
                 status_filter = None
         
         # Получаем задания с фильтром
-        tasks = db.get_tasks_by_employee(employee.id, status=status_filter)
+        tasks, next_cursor = await db.get_tasks_page_by_employee(
+            employee.id, status=status_filter, limit=TASKS_PAGE_SIZE, cursor=cursor, load='joined'
+        )
         
         if not tasks:
             status_text = f"📋 У вас нет заданий со статусом '{status_name}'."
@@ -888,7 +1106,7 @@ async def show_tasks_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
         message = f"📋 Ваши задания ({status_name}):\n\n"
         status_emoji = {"created": "🆕", "received": "✅", "completed": "✔️", "closed": "🔒"}
         
-        for task in tasks[:15]:  # Показываем до 15 заданий
+        for task in tasks:
             emoji = status_emoji.get(task.status.value, '❓')
             message += f"{emoji} Задание №{task.id}\n"
             message += f"   Оборудование: {task.equipment.name if task.equipment else 'N/A'}\n"
@@ -900,30 +1118,36 @@ async def show_tasks_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
             message += f"   Статус: {task.status.value}\n"
             message += f"   Дата: {task.task_date.strftime('%d.%m.%Y') if task.task_date else 'N/A'}\n\n"
         
-        if len(tasks) > 15:
-            message += f"\n... и еще {len(tasks) - 15} заданий"
+        # Кнопка следующей страницы (курсор - последнее показанное задание)
+        reply_markup = None
+        if next_cursor:
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(
+                "➡️ Следующие задания", callback_data=f"emp_page_{status_param}_{next_cursor}"
+            )]])
         
-        await query.edit_message_text(message)
+        await query.edit_message_text(message, reply_markup=reply_markup)
         return ConversationHandler.END
 
 
 async def confirm_task_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало подтверждения задания сотрудником"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        employee = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        employee = await db.get_identity(user.id)
         if not employee:
             await update.message.reply_text("❌ Пользователь не найден.")
             return
         
-        tasks = db.get_tasks_by_employee(employee.id, status=TaskStatusEnum.CREATED)
+        tasks, _ = await db.get_tasks_page_by_employee(
+            employee.id, status=TaskStatusEnum.CREATED, limit=TASKS_PICKER_SIZE, load='joined'
+        )
         
         if not tasks:
             await update.message.reply_text("📋 У вас нет новых заданий для подтверждения.")
             return
         
         keyboard = []
-        for task in tasks[:10]:
+        for task in tasks:
             keyboard.append([InlineKeyboardButton(
                 f"Задание №{task.id} - {task.product.name if task.product else 'N/A'}",
                 callback_data=f"confirm_task_{task.id}"
@@ -943,34 +1167,24 @@ async def confirm_task_received(update: Update, context: ContextTypes.DEFAULT_TY
     
     task_id = int(query.data.split("_")[-1])
     
-    with DatabaseManager() as db:
-        task = db.get_task_by_id(task_id)
+    # Смена статуса и уведомление фиксируются одной транзакцией
+    async with AsyncDatabaseManager(unit_of_work=True) as db:
+        # Статус меняется, только если задание еще не получено: повторное нажатие ничего не изменит
+        task = await db.update_task_status(task_id, TaskStatusEnum.RECEIVED, expected_status=TaskStatusEnum.CREATED)
         if not task:
-            await query.edit_message_text("❌ Задание не найдено.")
-            return
-        
-        if task.status != TaskStatusEnum.CREATED:
-            await query.edit_message_text("❌ Это задание уже обработано.")
+            if not await db.get_task_by_id(task_id):
+                await query.edit_message_text("❌ Задание не найдено.")
+            else:
+                await query.edit_message_text("❌ Это задание уже обработано.")
             return
         
-        # Обновляем статус
-        db.update_task_status(task_id, TaskStatusEnum.RECEIVED)
-        
         # Создаем уведомление для начальника
-        manager = db.db.query(User).filter(User.id == task.manager_id).first()
+        manager = await db.get_user_by_id(task.manager_id)
         if manager:
-            notification_msg = f"✅ Сотрудник {task.employee.full_name or 'N/A'} подтвердил получение задания №{task.id}"
-            db.create_notification(manager.id, task.id, notification_msg)
-            
-            # Отправляем уведомление начальнику
-            try:
-                await context.bot.send_message(
-                    chat_id=manager.telegram_id,
-                    text=f"🔔 {notification_msg}",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления начальнику: {e}")
+            employee = await db.get_user_by_id(task.employee_id)
+            notification_msg = f"✅ Сотрудник {employee.full_name or 'N/A'} подтвердил получение задания №{task.id}"
+            await db.notify_user(manager, task.id, notification_msg)
+        await db.commit()
         
         await query.edit_message_text(f"✅ Задание №{task_id} подтверждено!")
 
@@ -978,22 +1192,23 @@ async def confirm_task_received(update: Update, context: ContextTypes.DEFAULT_TY
 async def report_work_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало процесса отчета о выполненной работе"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        employee = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        employee = await db.get_identity(user.id)
         if not employee:
             await update.message.reply_text("❌ Пользователь не найден.")
             return
         
         # Получаем задания, которые можно закрыть (полученные, но не завершенные)
-        tasks = db.get_tasks_by_employee(employee.id)
-        available_tasks = [t for t in tasks if t.status == TaskStatusEnum.RECEIVED]
+        available_tasks, _ = await db.get_tasks_page_by_employee(
+            employee.id, status=TaskStatusEnum.RECEIVED, limit=TASKS_PICKER_SIZE
+        )
         
         if not available_tasks:
             await update.message.reply_text("📋 У вас нет заданий для отчета.")
             return
         
         keyboard = []
-        for task in available_tasks[:10]:
+        for task in available_tasks:
             keyboard.append([InlineKeyboardButton(
                 f"Задание №{task.id} - План: {task.planned_quantity}",
                 callback_data=f"report_{task.id}"
@@ -1032,32 +1247,26 @@ async def enter_actual_quantity(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text("❌ Ошибка: задание не выбрано.")
             return ConversationHandler.END
         
-        with DatabaseManager() as db:
-            task = db.get_task_by_id(task_id)
+        # Отчет и уведомление фиксируются одной транзакцией
+        async with AsyncDatabaseManager(unit_of_work=True) as db:
+            # Отчитаться можно только по полученному заданию и только один раз
+            task = await db.update_task_actual_quantity(task_id, quantity, expected_status=TaskStatusEnum.RECEIVED)
             if not task:
-                await update.message.reply_text("❌ Задание не найдено.")
+                if not await db.get_task_by_id(task_id):
+                    await update.message.reply_text("❌ Задание не найдено.")
+                else:
+                    await update.message.reply_text("❌ По этому заданию уже отчитались.")
                 return ConversationHandler.END
             
-            # Обновляем фактическое количество
-            db.update_task_actual_quantity(task_id, quantity)
-            
             # Создаем уведомление для начальника
-            manager = db.db.query(User).filter(User.id == task.manager_id).first()
+            manager = await db.get_user_by_id(task.manager_id)
             if manager:
-                notification_msg = f"📝 Сотрудник {task.employee.full_name or 'N/A'} отчитался по заданию №{task.id}:\n"
+                employee = await db.get_user_by_id(task.employee_id)
+                notification_msg = f"📝 Сотрудник {employee.full_name or 'N/A'} отчитался по заданию №{task.id}:\n"
                 notification_msg += f"План: {task.planned_quantity} | Факт: {quantity}"
                 
-                db.create_notification(manager.id, task.id, notification_msg)
-                
-                # Отправляем уведомление начальнику
-                try:
-                    await context.bot.send_message(
-                        chat_id=manager.telegram_id,
-                        text=f"🔔 {notification_msg}",
-                        parse_mode=ParseMode.HTML
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления начальнику: {e}")
+                await db.notify_user(manager, task.id, notification_msg)
+            await db.commit()
             
             await update.message.reply_text(f"✅ Отчет по заданию №{task_id} принят!\nФактическое количество: {quantity}")
             context.user_data.pop('reporting_task_id', None)
@@ -1073,9 +1282,9 @@ async def enter_actual_quantity(update: Update, context: ContextTypes.DEFAULT_TY
 async def generate_report_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало генерации отчета для начальника - выбор периода"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        manager = db.get_user_by_telegram_id(user.id)
-        tasks = db.get_tasks_by_manager(manager.id)
+    async with AsyncDatabaseManager() as db:
+        manager = await db.get_identity(user.id)
+        tasks, _ = await db.get_tasks_page_by_manager(manager.id, limit=1)
         
         if not tasks:
             await update.message.reply_text("📊 У вас нет заданий для отчета.")
@@ -1310,86 +1519,106 @@ async def generate_and_send_report(update: Update, context: ContextTypes.DEFAULT
     await query.edit_message_text(f"⏳ Генерирую отчет за период '{period_name}'... Пожалуйста, подождите.")
     
     try:
-        with DatabaseManager() as db:
-            manager = db.get_user_by_telegram_id(user.id)
+        # Отчет читает через движок чтения и не конкурирует с подтверждениями заданий
+        async with AsyncDatabaseManager(readonly=True) as db:
+            manager = await db.get_identity(user.id)
             if not manager:
                 await query.edit_message_text("❌ Пользователь не найден.")
                 context.user_data.pop('report_period', None)
                 return ConversationHandler.END
             
             # Получаем задания за выбранный период
-            tasks = db.get_tasks_by_manager(manager.id, date_from=period_from, date_to=period_to)
-            
-            if not tasks:
-                period_text = period_from.strftime('%d.%m.%Y')
-                if period_from != period_to:
-                    period_text = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
-                await query.edit_message_text(f"📊 У вас нет заданий за период {period_text}.")
-                context.user_data.pop('report_period', None)
-                return ConversationHandler.END
-            
-            timestamp = get_now_utc3().strftime("%Y%m%d_%H%M%S")
-            report_time = get_now_utc3().strftime('%d.%m.%Y %H:%M')
-            
-            # Формируем название периода для заголовка
-            if period_from == period_to:
-                period_title = period_from.strftime('%d.%m.%Y')
+            tasks = await db.get_tasks_by_manager(
+                manager.id, date_from=period_from, date_to=period_to, load='joined'
+            )
+            # Строки отчета без объектов сессии: отчет строится в другом процессе,
+            # а сессия закрывается до ожидания в очереди
+            rows = [task_report_row(task) for task in tasks]
+        
+        if not rows:
+            period_text = period_from.strftime('%d.%m.%Y')
+            if period_from != period_to:
+                period_text = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
+            await query.edit_message_text(f"📊 У вас нет заданий за период {period_text}.")
+            context.user_data.pop('report_period', None)
+            return ConversationHandler.END
+        
+        timestamp = get_now_utc3().strftime("%Y%m%d_%H%M%S")
+        report_time = get_now_utc3().strftime('%d.%m.%Y %H:%M')
+        
+        # Формируем название периода для заголовка
+        if period_from == period_to:
+            period_title = period_from.strftime('%d.%m.%Y')
+        else:
+            period_title = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
+        
+        async def show_queue_position(position):
+            if position:
+                text = (f"⏳ Отчет за период '{period_name}' в очереди: {position}-й.\n"
+                        f"Генерация начнется автоматически.")
             else:
-                period_title = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
-            
-            # Генерируем отчет выбранного формата
-            if format_type == "pdf":
-                file_path = generate_pdf_report(
-                    tasks, 
-                    f'reports/report_manager_{manager.id}_{timestamp}.pdf',
-                    title='Отчет по заданиям',
-                    period_from=period_from,
-                    period_to=period_to
-                )
-                file_caption = f"📑 Отчет по заданиям (PDF)\n\nПериод: {period_title}\nВсего заданий: {len(tasks)}\nСгенерировано: {report_time}"
-            else:  # csv
-                file_path = generate_csv_report(
-                    tasks,
-                    f'reports/report_manager_{manager.id}_{timestamp}.csv',
-                    period_from=period_from,
-                    period_to=period_to
-                )
-                file_caption = f"📄 Отчет по заданиям (CSV)\n\nПериод: {period_title}\nВсего заданий: {len(tasks)}\nСгенерировано: {report_time}"
-            
-            # Отправляем файл пользователю
+                text = f"⏳ Генерирую отчет за период '{period_name}'... Пожалуйста, подождите."
             try:
-                with open(file_path, 'rb') as report_file:
-                    await context.bot.send_document(
-                        chat_id=user.id,
-                        document=report_file,
-                        caption=file_caption,
-                        filename=os.path.basename(file_path)
-                    )
-                
-                period_text = period_from.strftime('%d.%m.%Y')
-                if period_from != period_to:
-                    period_text = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
-                
-                await query.edit_message_text(
-                    f"✅ Отчет успешно сгенерирован и отправлен!\n\n"
-                    f"Период: {period_text}\n"
-                    f"Формат: {format_type.upper()}\n"
-                    f"Заданий в отчете: {len(tasks)}\n\n"
-                    f"💾 Файл доступен в ваших загрузках Telegram."
-                )
-                logger.info(f"Отчет {file_path} отправлен пользователю {user.id}")
-                context.user_data.pop('report_period', None)
-                context.user_data.pop('report_date_from', None)
-                context.user_data.pop('report_date_to', None)
-            except Exception as e:
-                logger.error(f"Ошибка отправки файла отчета: {e}")
-                await query.edit_message_text(
-                    f"❌ Ошибка при отправке файла: {str(e)}\n\n"
-                    f"Файл сгенерирован по пути: {file_path}"
+                await query.edit_message_text(text)
+            except TelegramError as e:
+                logger.warning(f"Не удалось показать место в очереди отчетов: {e}")
+        
+        # Генерируем отчет выбранного формата в пуле процессов (event loop не блокируется)
+        try:
+            file_path = await report_pool.render(
+                format_type,
+                rows,
+                f'reports/report_manager_{manager.id}_{timestamp}.{format_type}',
+                on_position=show_queue_position,
+                title='Отчет по заданиям',
+                period_from=period_from,
+                period_to=period_to
+            )
+        except ReportQueueFull:
+            await query.edit_message_text("⏳ Сейчас формируется слишком много отчетов. Попробуйте через несколько минут.")
+            context.user_data.pop('report_period', None)
+            context.user_data.pop('report_date_from', None)
+            context.user_data.pop('report_date_to', None)
+            return ConversationHandler.END
+        if format_type == "pdf":
+            file_caption = f"📑 Отчет по заданиям (PDF)\n\nПериод: {period_title}\nВсего заданий: {len(rows)}\nСгенерировано: {report_time}"
+        else:  # csv
+            file_caption = f"📄 Отчет по заданиям (CSV)\n\nПериод: {period_title}\nВсего заданий: {len(rows)}\nСгенерировано: {report_time}"
+        
+        # Отправляем файл пользователю
+        try:
+            with open(file_path, 'rb') as report_file:
+                await context.bot.send_document(
+                    chat_id=user.id,
+                    document=report_file,
+                    caption=file_caption,
+                    filename=os.path.basename(file_path)
                 )
-                context.user_data.pop('report_period', None)
-                context.user_data.pop('report_date_from', None)
-                context.user_data.pop('report_date_to', None)
+            
+            period_text = period_from.strftime('%d.%m.%Y')
+            if period_from != period_to:
+                period_text = f"{period_from.strftime('%d.%m.%Y')} - {period_to.strftime('%d.%m.%Y')}"
+            
+            await query.edit_message_text(
+                f"✅ Отчет успешно сгенерирован и отправлен!\n\n"
+                f"Период: {period_text}\n"
+                f"Формат: {format_type.upper()}\n"
+                f"Заданий в отчете: {len(rows)}\n\n"
+                f"💾 Файл доступен в ваших загрузках Telegram."
+            )
+            logger.info(f"Отчет {file_path} отправлен пользователю {user.id}")
+            context.user_data.pop('report_period', None)
+            context.user_data.pop('report_date_from', None)
+            context.user_data.pop('report_date_to', None)
+        except Exception as e:
+            logger.error(f"Ошибка отправки файла отчета: {e}")
+            await query.edit_message_text(
+                f"❌ Ошибка при отправке файла: {str(e)}\n\n"
+                f"Файл сгенерирован по пути: {file_path}"
+            )
+            context.user_data.pop('report_period', None)
+            context.user_data.pop('report_date_from', None)
+            context.user_data.pop('report_date_to', None)
         
         return ConversationHandler.END
     except Exception as e:
@@ -1404,13 +1633,13 @@ async def generate_and_send_report(update: Update, context: ContextTypes.DEFAULT
 async def show_notifications(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать уведомления"""
     user = update.effective_user
-    with DatabaseManager() as db:
-        db_user = db.get_user_by_telegram_id(user.id)
+    async with AsyncDatabaseManager() as db:
+        db_user = await db.get_identity(user.id)
         if not db_user:
             await update.message.reply_text("❌ Пользователь не найден.")
             return
         
-        notifications = db.get_unread_notifications(db_user.id)
+        notifications = await db.get_unread_notifications(db_user.id)
         
         if not notifications:
             await update.message.reply_text("🔔 У вас нет новых уведомлений.")
@@ -1426,7 +1655,7 @@ async def show_notifications(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена текущей операции"""
-    task_data.pop(update.effective_user.id, None)
+    context.user_data.pop(TASK_DRAFT_KEY, None)
     # Очищаем данные отчета, если они есть
     context.user_data.pop('report_period', None)
     context.user_data.pop('report_date_from', None)
@@ -1437,6 +1666,32 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def conversation_options(name: str, application: Application) -> dict:
+    """Общие параметры ConversationHandler: имя, сохранение состояния, таймаут"""
+    return {
+        'name': name,
+        # Состояние диалогов сохраняется, если приложению задано хранилище
+        'persistent': application.persistence is not None,
+        'conversation_timeout': BOT_CONVERSATION_TIMEOUT,
+    }
+
+
+def timeout_state(*user_data_keys) -> dict:
+    """Состояние TIMEOUT диалога: удалить данные диалога из user_data и сообщить пользователю
+    
+    Удаляются только ключи этого диалога - черновики других диалогов остаются.
+    """
+    async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        for key in user_data_keys:
+            context.user_data.pop(key, None)
+        if update.effective_chat:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text="⌛ Диалог завершен: долго не было ответа. Начните заново из меню."
+            )
+    return {ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)]}
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок для логирования и уведомления пользователей"""
     error = context.error
@@ -1479,21 +1734,8 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Error while sending error message to user: {e}", exc_info=e)
 
 
-def main():
-    """Главная функция запуска бота"""
-    if not TELEGRAM_BOT_TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN не установлен в переменных окружения!")
-        return
-    
-    # Инициализация БД
-    from app.core.database import init_db, init_sample_data
-    init_db()
-    # Раскомментируйте следующую строку для создания тестовых данных
-    # init_sample_data()
-    
-    # Создание приложения
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    
+def register_handlers(application: Application):
+    """Регистрация обработчиков бота в приложении"""
     # Обработчик команды /start
     application.add_handler(CommandHandler("start", start))
     
@@ -1506,14 +1748,28 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, select_task_date)
             ],
             SELECTING_SHIFT: [CallbackQueryHandler(select_shift)],
-            SELECTING_EQUIPMENT: [CallbackQueryHandler(select_equipment)],
-            SELECTING_PRODUCT: [CallbackQueryHandler(select_product)],
+            # Шаги выбора: кнопки (запись, страница, участок) и текстовый поиск
+            SELECTING_EQUIPMENT: [
+                CallbackQueryHandler(select_equipment),
+                MessageHandler(PICKER_SEARCH_FILTER, search_equipment)
+            ],
+            SELECTING_PRODUCT: [
+                CallbackQueryHandler(select_product),
+                MessageHandler(PICKER_SEARCH_FILTER, search_product)
+            ],
             ENTERING_QUANTITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_quantity)],
-            SELECTING_EMPLOYEE: [CallbackQueryHandler(select_employee)],
+            SELECTING_EMPLOYEE: [
+                CallbackQueryHandler(select_employee),
+                MessageHandler(PICKER_SEARCH_FILTER, search_employee)
+            ],
             CONFIRMING_TASK: [CallbackQueryHandler(confirm_task)],
             HANDLING_ERROR: [CallbackQueryHandler(handle_error_choice, pattern="^error_")],
+            **timeout_state(TASK_DRAFT_KEY, 'error_previous_state', 'waiting_custom_date'),
         },
         fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        # "📋 Создать задание" посреди создания начинает его заново
+        allow_reentry=True,
+        **conversation_options('create_task', application),
     )
     application.add_handler(create_task_handler)
     
@@ -1524,6 +1780,7 @@ def main():
             SELECTING_STATUS: [CallbackQueryHandler(show_manager_tasks_by_status, pattern="^mgr_status_")],
         },
         fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        **conversation_options('my_tasks_manager', application),
     )
     application.add_handler(my_tasks_manager_handler)
     
@@ -1534,9 +1791,14 @@ def main():
             SELECTING_STATUS: [CallbackQueryHandler(show_tasks_by_status, pattern="^status_")],
         },
         fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        **conversation_options('my_tasks_employee', application),
     )
     application.add_handler(my_tasks_handler)
     
+    # Следующие страницы списков заданий (кнопка остается в сообщении после завершения диалога)
+    application.add_handler(CallbackQueryHandler(show_manager_tasks_by_status, pattern="^mgr_page_"))
+    application.add_handler(CallbackQueryHandler(show_tasks_by_status, pattern="^emp_page_"))
+    
     # Обработчик подтверждения задания сотрудником
     application.add_handler(MessageHandler(filters.Regex("^✅ Подтвердить задание$"), confirm_task_start))
     application.add_handler(CallbackQueryHandler(confirm_task_received, pattern="^confirm_task_"))
@@ -1547,8 +1809,10 @@ def main():
         states={
             SELECTING_TASK_FOR_CONFIRM: [CallbackQueryHandler(select_task_for_report, pattern="^report_")],
             ENTERING_ACTUAL_QUANTITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_actual_quantity)],
+            **timeout_state('reporting_task_id'),
         },
         fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        **conversation_options('report_work', application),
     )
     application.add_handler(report_handler)
     
@@ -1560,26 +1824,122 @@ def main():
             ENTERING_REPORT_DATE_FROM: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_report_date_from)],
             ENTERING_REPORT_DATE_TO: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_report_date_to)],
             SELECTING_REPORT_FORMAT: [CallbackQueryHandler(generate_and_send_report, pattern="^report_format_")],
+            **timeout_state('report_period', 'report_date_from', 'report_date_to'),
         },
         fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        **conversation_options('report_generation', application),
     )
     application.add_handler(report_generation_handler)
     
+    # Обработчик планирования смены (для начальника)
+    plan_shift_handler = ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex("^📅 План смены$"), plan_shift_start)],
+        states={
+            PLANNING_DATE: [CallbackQueryHandler(plan_select_date, pattern="^(plan_date_|cancel)")],
+            PLANNING_SHIFT: [CallbackQueryHandler(plan_select_shift, pattern="^(plan_shift_|cancel)")],
+            PLANNING_CONFIRM: [CallbackQueryHandler(plan_confirm, pattern="^(plan_confirm|cancel)")],
+            **timeout_state('shift_plan'),
+        },
+        fallbacks=[CommandHandler("cancel", cancel), MessageHandler(filters.Regex("^❌ Отмена$"), cancel)],
+        **conversation_options('plan_shift', application),
+    )
+    application.add_handler(plan_shift_handler)
+    
     # Обработчик уведомлений
     application.add_handler(MessageHandler(filters.Regex("^🔔 Уведомления$"), show_notifications))
     
     # Регистрация обработчика ошибок
     application.add_error_handler(error_handler)
     
-    logger.info("Бот запущен и готов к работе")
+    # Число запросов и время в БД по обработчикам (метрики и лог медленных запросов)
+    instrument_handlers(application)
+
+
+async def stop_background(application):
+    """post_stop приложения: остановить диспетчер outbox и пул отчетов"""
+    await stop_outbox_dispatcher(application)
+    report_pool.shutdown()
+
+
+def main():
+    """Главная функция запуска бота"""
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN не установлен в переменных окружения!")
+        return
+    if BOT_MODE not in ('polling', 'webhook'):
+        logger.error(f"Неизвестный BOT_MODE={BOT_MODE}: ожидается polling или webhook")
+        return
+    if BOT_MODE == 'webhook' and not (BOT_WEBHOOK_URL and BOT_WEBHOOK_SECRET):
+        logger.error("Для BOT_MODE=webhook нужны BOT_WEBHOOK_URL и BOT_WEBHOOK_SECRET")
+        return
+    if BOT_CONCURRENT_UPDATES < 1:
+        logger.error(f"BOT_CONCURRENT_UPDATES={BOT_CONCURRENT_UPDATES}: нужно число не меньше 1")
+        return
+    
+    # Инициализация БД
+    from app.core.database import init_db, init_sample_data
+    init_db()
+    # Раскомментируйте следующую строку для создания тестовых данных
+    # init_sample_data()
+    
+    # Создание приложения
+    # Каждое обновление обрабатывается со своей сессией БД
+    rate_limiter = SendRateLimiter()
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if TELEGRAM_API_URL:
+        api_url = TELEGRAM_API_URL.rstrip('/')
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    application = (
+        builder
+        # Очередь обновлений между приемом (getUpdates или вебхук) и обработкой;
+        # ограничение действует и на обновления, уже переданные в обработку
+        .update_queue(UpdateQueue(
+            maxsize=BOT_UPDATE_QUEUE_SIZE,
+            in_flight=BOT_UPDATE_QUEUE_SIZE + BOT_CONCURRENT_UPDATES if BOT_UPDATE_QUEUE_SIZE else 0,
+        ))
+        # Разные пользователи - одновременно, один пользователь - по порядку
+        .concurrent_updates(SessionUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        # Отправки ждут лимитов Telegram в очереди вместо ошибки RetryAfter
+        .rate_limiter(rate_limiter)
+        # Шаги диалогов и черновики заданий переживают перезапуск бота
+        .persistence(SQLitePersistence())
+        # Сообщения из outbox отправляет фоновый диспетчер
+        .post_init(start_outbox_dispatcher)
+        .post_stop(stop_background)
+        .build()
+    )
+    
+    register_handlers(application)
+    # Состояние неактивных пользователей удаляется, память ограничена
+    application.job_queue.run_repeating(evict_idle_users, interval=EVICT_INTERVAL_SECONDS, name='evict_idle_users')
+    
+    if BOT_METRICS_PORT:
+        from app.core.database import start_metrics_server
+        start_metrics_server(BOT_METRICS_HOST, BOT_METRICS_PORT, rate_limiter.metrics.render_prometheus)
+    
+    logger.info(f"Бот запущен и готов к работе (режим {BOT_MODE})")
     
     try:
         # Запуск бота
-        # run_polling автоматически обрабатывает KeyboardInterrupt и корректно завершает работу
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        # run_polling и run_webhook автоматически обрабатывают KeyboardInterrupt и корректно завершают работу
+        if BOT_MODE == 'webhook':
+            # Обновления принимает встроенный сервер PTB; запросы без заголовка
+            # X-Telegram-Bot-Api-Secret-Token с BOT_WEBHOOK_SECRET получают 403
+            application.run_webhook(
+                listen=BOT_WEBHOOK_LISTEN,
+                port=BOT_WEBHOOK_PORT,
+                url_path=BOT_WEBHOOK_PATH,
+                webhook_url=f"{BOT_WEBHOOK_URL.rstrip('/')}/{BOT_WEBHOOK_PATH}",
+                secret_token=BOT_WEBHOOK_SECRET,
+                max_connections=BOT_WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
+        else:
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
     except KeyboardInterrupt:
         # run_polling уже корректно обработал остановку
         logger.info("Бот остановлен пользователем (Ctrl+C)")
@@ -0,0 +1,121 @@
+"""
+Диспетчер outbox: отправка сообщений Telegram из таблицы outbox
+
+Обработчики бота, API и админ-панель не отправляют сообщения сами, а пишут их
+в outbox в транзакции изменения (DatabaseManager.notify_user, enqueue_message,
+create_tasks_bulk). Диспетчер работает в процессе бота: раз в
+OUTBOX_POLL_SECONDS забирает пачку сообщений, которые пора отправить,
+отправляет их и одной транзакцией удаляет отправленные, а неудачные переносит
+на следующую попытку с экспоненциальной задержкой. Забранные сообщения
+(DatabaseManager.claim_due_messages) на OUTBOX_LEASE_SECONDS скрыты от
+диспетчеров других процессов бота, поэтому при нескольких процессах
+(webhook) сообщение отправляется один раз.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from app.core.config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_MAX_ATTEMPTS
+from app.core.database import AsyncDatabaseManager, outbox_retry_delay
+from app.core.utils import logger
+
+
+class OutboxDispatcher:
+    """Фоновая задача бота, которая отправляет сообщения из outbox"""
+
+    def __init__(self, bot, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        # Пауза после ответа Telegram "слишком много запросов", секунды
+        self._flood_wait = 0.0
+        self._task = None
+
+    def start(self):
+        """Запустить цикл диспетчера в текущем event loop"""
+        self._task = asyncio.create_task(self._run(), name='outbox-dispatcher')
+
+    async def stop(self):
+        """Остановить цикл диспетчера (неотправленные сообщения остаются в outbox)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Диспетчер outbox: ошибка пачки: {e}", exc_info=e)
+                processed = 0
+            if self._flood_wait:
+                await asyncio.sleep(self._flood_wait)
+                self._flood_wait = 0.0
+            elif processed < self.batch_size:
+                # Неполная пачка - очередь разобрана, ждем новых сообщений
+                await asyncio.sleep(self.poll_seconds)
+
+    def _retry_at(self, attempts: int):
+        """Время следующей попытки или None, если попытки исчерпаны"""
+        if attempts + 1 >= self.max_attempts:
+            return None
+        return datetime.utcnow() + timedelta(seconds=outbox_retry_delay(attempts))
+
+    async def _send(self, message):
+        """Отправить сообщение; None или (id, ошибка, время повтора или None)"""
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, text=message.text, parse_mode=message.parse_mode)
+            return None
+        except RetryAfter as e:
+            # Ограничитель исчерпал повторы: сообщение ждет конца паузы
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            self._flood_wait = max(self._flood_wait, seconds)
+            return message.id, e, datetime.utcnow() + timedelta(seconds=seconds)
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован, чат не найден или неверная разметка - повтор не поможет
+            logger.warning(f"Outbox: сообщение {message.id} не будет доставлено: {e}")
+            return message.id, e, None
+        except Exception as e:
+            retry_at = self._retry_at(message.attempts)
+            if retry_at is None:
+                logger.error(f"Outbox: сообщение {message.id} не отправлено за {self.max_attempts} попыток: {e}")
+            return message.id, e, retry_at
+
+    async def dispatch_once(self) -> int:
+        """Отправить одну пачку сообщений; число обработанных сообщений"""
+        async with AsyncDatabaseManager() as db:
+            messages = await db.claim_due_messages(self.batch_size)
+        if not messages:
+            return 0
+
+        # Пачка отправляется одновременно: темп задает ограничитель отправок
+        # бота (SendRateLimiter), и медленный чат не задерживает остальные
+        results = await asyncio.gather(*(self._send(message) for message in messages))
+        sent = [message.id for message, failure in zip(messages, results) if failure is None]
+        failures = [failure for failure in results if failure is not None]
+
+        async with AsyncDatabaseManager() as db:
+            await db.complete_messages(sent, failures)
+        if failures:
+            logger.warning(f"Outbox: отправлено {len(sent)}, с ошибкой {len(failures)}")
+        return len(sent) + len(failures)
+
+
+async def start_outbox_dispatcher(application):
+    """post_init приложения: запустить диспетчер outbox"""
+    dispatcher = OutboxDispatcher(application.bot)
+    dispatcher.start()
+    application.bot_data['outbox_dispatcher'] = dispatcher
+
+
+async def stop_outbox_dispatcher(application):
+    """post_stop приложения: остановить диспетчер outbox"""
+    dispatcher = application.bot_data.pop('outbox_dispatcher', None)
+    if dispatcher:
+        await dispatcher.stop()
@@ -0,0 +1,180 @@
+"""
+Хранение состояния диалогов бота в SQLite
+
+SQLitePersistence - BasePersistence для Application: user_data пользователей
+(черновик задания, выбранный период отчета) и шаги ConversationHandler
+записываются в отдельную SQLite-базу BOT_STATE_DB, поэтому незавершенный
+диалог переживает перезапуск бота. Application передает в хранилище только
+изменившихся пользователей - раз в BOT_STATE_FLUSH_SECONDS и при остановке.
+
+Память ограничена: диалоги завершаются через BOT_CONVERSATION_TIMEOUT, а
+задача evict_idle_users удаляет состояние пользователей без обновлений дольше
+BOT_STATE_TTL_SECONDS и самых давних сверх BOT_STATE_MAX_USERS. При запуске
+загружаются только записи моложе BOT_STATE_TTL_SECONDS.
+"""
+import json
+import pickle
+import time
+import aiosqlite
+from telegram.ext import BasePersistence, PersistenceInput
+from app.core.config import BOT_STATE_DB, BOT_STATE_FLUSH_SECONDS, BOT_STATE_TTL_SECONDS, BOT_STATE_MAX_USERS
+from app.core.utils import logger
+
+# Как часто evict_idle_users проверяет состояние пользователей, секунды
+EVICT_INTERVAL_SECONDS = 300
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS user_data ('
+    'user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS conversations ('
+    'name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, updated_at REAL NOT NULL, '
+    'PRIMARY KEY (name, key))',
+)
+
+
+class SQLitePersistence(BasePersistence):
+    """user_data и состояния ConversationHandler в SQLite (chat_data и bot_data не хранятся)"""
+
+    def __init__(self, path: str = BOT_STATE_DB, ttl_seconds: float = BOT_STATE_TTL_SECONDS,
+                 max_users: int = BOT_STATE_MAX_USERS, update_interval: float = BOT_STATE_FLUSH_SECONDS):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        # user_id -> время последнего обновления пользователя (time.time())
+        self.last_seen = {}
+        self._conn = None
+
+    async def _db(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            self._conn = await aiosqlite.connect(self.path)
+            await self._conn.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                await self._conn.execute(statement)
+            await self._conn.commit()
+        return self._conn
+
+    async def _write(self, sql: str, params: tuple):
+        db = await self._db()
+        await db.execute(sql, params)
+        await db.commit()
+
+    # === user_data ===
+
+    async def get_user_data(self) -> dict:
+        db = await self._db()
+        horizon = time.time() - self.ttl_seconds
+        await db.execute('DELETE FROM user_data WHERE updated_at < ?', (horizon,))
+        await db.commit()
+        async with db.execute(
+            'SELECT user_id, data, updated_at FROM user_data ORDER BY updated_at DESC LIMIT ?', (self.max_users,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        self.last_seen = {user_id: updated_at for user_id, _, updated_at in rows}
+        logger.info(f"Состояние диалогов: загружено пользователей {len(rows)} из {self.path}")
+        return {user_id: pickle.loads(data) for user_id, data, _ in rows}
+
+    async def update_user_data(self, user_id: int, data: dict):
+        if not data:
+            # Пустой user_data (диалог завершен) хранить незачем
+            await self._write('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+            return
+        await self._write(
+            'INSERT OR REPLACE INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)',
+            (user_id, pickle.dumps(data), time.time()),
+        )
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        # Вызывается перед каждым обработчиком пользователя - отметка активности
+        self.last_seen[user_id] = time.time()
+
+    async def drop_user_data(self, user_id: int):
+        self.last_seen.pop(user_id, None)
+        await self._write('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+
+    # === ConversationHandler ===
+
+    async def get_conversations(self, name: str) -> dict:
+        db = await self._db()
+        horizon = time.time() - self.ttl_seconds
+        await db.execute('DELETE FROM conversations WHERE name = ? AND updated_at < ?', (name, horizon))
+        await db.commit()
+        async with db.execute('SELECT key, state FROM conversations WHERE name = ?', (name,)) as cursor:
+            rows = await cursor.fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        if new_state is None:
+            await self._write(
+                'DELETE FROM conversations WHERE name = ? AND key = ?', (name, json.dumps(list(key)))
+            )
+            return
+        await self._write(
+            'INSERT OR REPLACE INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)',
+            (name, json.dumps(list(key)), pickle.dumps(new_state), time.time()),
+        )
+
+    # === Не хранится ===
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Остановка приложения: записи уже зафиксированы, соединение закрывается"""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+async def evict_idle_users(context):
+    """Задача JobQueue: удалить из памяти и хранилища состояние неактивных пользователей
+
+    Удаляются пользователи без обновлений дольше ttl_seconds (их диалоги уже
+    завершены по таймауту), а сверх max_users - самые давние.
+    """
+    application = context.application
+    persistence = application.persistence
+    now = time.time()
+    seen = {user_id: persistence.last_seen.setdefault(user_id, now) for user_id in application.user_data}
+    evict = [user_id for user_id, last in seen.items() if now - last > persistence.ttl_seconds]
+    active = sorted((last, user_id) for user_id, last in seen.items() if now - last <= persistence.ttl_seconds)
+    overflow = len(active) - persistence.max_users
+    if overflow > 0:
+        evict += [user_id for _, user_id in active[:overflow]]
+        logger.warning(f"Состояние диалогов: пользователей больше {persistence.max_users}, "
+                       f"удаляется состояние {overflow} самых давних")
+    for user_id in evict:
+        application.drop_user_data(user_id)
+        persistence.last_seen.pop(user_id, None)
+    # Пользователи, чьих данных уже нет в приложении
+    for user_id in persistence.last_seen.keys() - seen.keys():
+        persistence.last_seen.pop(user_id, None)
+    if evict:
+        logger.info(f"Состояние диалогов: удалено неактивных пользователей {len(evict)}")
@@ -0,0 +1,95 @@
+"""
+Постраничный выбор из длинного списка в inline-клавиатуре
+
+Кнопка на каждую запись (оборудование, продукцию, сотрудника) при сотнях
+записей выходит за ограничения Telegram на клавиатуру и делает каждое
+редактирование сообщения огромным. picker_keyboard() показывает одну
+страницу из PICKER_PAGE_SIZE записей с кнопками перехода; записи страницы
+берутся из снимков кэшей процесса (ReferenceData, EmployeeDirectory), поэтому
+смена страницы и поиск не обращаются к БД.
+
+Callback-данные: "<prefix>_<id>" - выбор записи, "<prefix>pg_<n>" - страница
+n, PICKER_RESET - сброс поиска, PICKER_NOOP - кнопка с номером страницы.
+Поиск - текстовое сообщение с началом названия; состояние выбора (запрос,
+участок) хранит вызывающий код.
+"""
+import math
+import re
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+PICKER_PAGE_SIZE = 8  # Записей на странице выбора
+PICKER_QUERY_MAX = 50  # Наибольшая длина поискового запроса
+PICKER_RESET = 'picker_reset'
+PICKER_NOOP = 'picker_noop'  # Кнопка с номером страницы
+
+_CALLBACK = re.compile(r'([a-z]+?)(pg)?_(\d+)')
+
+
+def parse_picker_callback(data: str):
+    """(prefix, страница?, число) из callback-данных выбора или None"""
+    match = _CALLBACK.fullmatch(data or '')
+    if match is None:
+        return None
+    return match.group(1), match.group(2) is not None, int(match.group(3))
+
+
+def picker_keyboard(prefix: str, options: list, page: int, extra_rows=(), page_size: int = PICKER_PAGE_SIZE):
+    """
+    Клавиатура страницы page выбора
+
+    options - [(id, подпись)] всех подходящих записей. Номер страницы
+    ограничивается диапазоном (список мог измениться). extra_rows добавляются
+    перед кнопкой отмены.
+    """
+    pages = max(1, math.ceil(len(options) / page_size))
+    page = min(max(page, 0), pages - 1)
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"{prefix}_{option_id}")]
+        for option_id, label in options[page * page_size:(page + 1) * page_size]
+    ]
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"{prefix}pg_{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=PICKER_NOOP))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"{prefix}pg_{page + 1}"))
+        keyboard.append(navigation)
+    keyboard.extend(extra_rows)
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def picker_text(title: str, found: int, search_query: str = None, hint: str = "начало названия") -> str:
+    """Текст сообщения выбора: заголовок, результат поиска и подсказка"""
+    lines = [title]
+    if search_query:
+        lines.append(f"🔍 «{search_query}»: найдено {found}" if found else f"🔍 «{search_query}»: ничего не найдено")
+    lines.append(f"Для поиска отправьте {hint}.")
+    return "\n\n".join(lines)
+
+
+def reset_search_row(search_query: str = None) -> list:
+    """Строка с кнопкой сброса поиска (пустая, если поиска нет)"""
+    if not search_query:
+        return []
+    return [[InlineKeyboardButton("✖️ Сбросить поиск", callback_data=PICKER_RESET)]]
+
+
+def clean_query(text: str) -> str:
+    """Поисковый запрос из сообщения пользователя"""
+    return (text or '').strip()[:PICKER_QUERY_MAX]
+
+
+async def send_picker(send, text: str, reply_markup):
+    """Отправить или отредактировать сообщение выбора
+
+    send - message.reply_text или query.edit_message_text. Повторное нажатие
+    (та же страница) не меняет сообщение - ошибку Telegram об этом пропускаем.
+    """
+    try:
+        await send(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if 'not modified' not in str(e).lower():
+            raise
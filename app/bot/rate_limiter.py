@@ -0,0 +1,197 @@
+"""
+Ограничение частоты отправки сообщений бота (token bucket)
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного в
+секунду в один чат; сверх этого Bot API отвечает RetryAfter. SendRateLimiter
+подключается к Application (rate_limiter) и получает все запросы Bot API.
+Методы отправки (sendMessage, sendDocument и другие send*) ждут токен в общем
+ведре и в ведре своего чата - запросы выстраиваются в очередь, а не падают.
+RetryAfter приостанавливает все отправки на указанное время, после чего запрос
+повторяется. Остальные методы (редактирование, ответы на нажатия кнопок)
+проходят без ожидания.
+"""
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from app.core.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_RETRY_AFTER_RETRIES
+)
+from app.core.utils import logger
+
+# Больше ведер чатов - полные (простаивающие) ведра удаляются
+CHAT_BUCKETS_MAX = 1000
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity
+
+    Ожидающие получают токены по очереди (asyncio.Lock отдает блокировку в
+    порядке ожидания).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class SendMetrics:
+    """Очередь и ожидание отправок (читаются из потока сервера метрик)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0             # запросы, ожидающие токена сейчас (без запросов к API)
+        self.queued_max = 0
+        self.sends = 0              # успешные отправки
+        self.send_errors = 0        # отправки, завершившиеся ошибкой
+        self.retry_after = 0        # ответы RetryAfter от Telegram
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def enter(self):
+        """Запрос встал в ожидание токена"""
+        with self._lock:
+            self.queued += 1
+            self.queued_max = max(self.queued_max, self.queued)
+
+    def leave(self, waited: float):
+        """Запрос получил токен (или ожидание прервано) и вышел из очереди"""
+        with self._lock:
+            self.queued -= 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_send(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.sends += 1
+            else:
+                self.send_errors += 1
+
+    def record_retry_after(self):
+        with self._lock:
+            self.retry_after += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'queue_depth': self.queued,
+                'queue_depth_max': self.queued_max,
+                'sends': self.sends,
+                'send_errors': self.send_errors,
+                'retry_after': self.retry_after,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+            }
+
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus (дополняют метрики БД бота)"""
+        lines = []
+        for key, value in self.snapshot().items():
+            metric = f"bot_send_{key}"
+            if key == 'queue_depth' or key.endswith('_max'):
+                kind = 'gauge'
+            else:
+                metric += '_total' if not key.endswith('_total') else ''
+                kind = 'counter'
+            lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+class SendRateLimiter(BaseRateLimiter):
+    """Общее ведро бота и ведра чатов для методов отправки Bot API"""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST, max_retries: int = TELEGRAM_RETRY_AFTER_RETRIES):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.metrics = SendMetrics()
+        self._global = None
+        self._chats = {}
+        self._paused_until = 0.0
+
+    async def initialize(self):
+        # Ведра создаются в event loop приложения
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._chats = {}
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_MAX:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_full()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _wait_pause(self):
+        """Дождаться конца паузы после RetryAfter"""
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, chat_id):
+        await self._wait_pause()
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self._global.acquire()
+        # Пауза могла начаться, пока запрос ждал токен
+        await self._wait_pause()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith('send'):
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get('chat_id')
+        ok = False
+        try:
+            attempt = 0
+            while True:
+                # В очереди запрос только пока ждет токен; вызов API в глубину очереди не входит
+                started = time.monotonic()
+                self.metrics.enter()
+                try:
+                    await self._acquire(chat_id)
+                finally:
+                    self.metrics.leave(time.monotonic() - started)
+                try:
+                    result = await callback(*args, **kwargs)
+                    ok = True
+                    return result
+                except RetryAfter as e:
+                    self.metrics.record_retry_after()
+                    if attempt >= self.max_retries:
+                        raise
+                    retry_after = e.retry_after
+                    seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                    self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+                    logger.warning(f"Telegram RetryAfter {seconds} с ({endpoint}), отправки приостановлены")
+                    attempt += 1
+        finally:
+            self.metrics.record_send(ok)
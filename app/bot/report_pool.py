@@ -0,0 +1,122 @@
+"""
+Пул процессов для построения отчетов бота
+
+Отчет PDF с тысячами строк строится секундами процессорного времени; в
+обработчике бота это останавливает event loop и ответы всем пользователям.
+ReportPool выполняет render_report в ProcessPoolExecutor не более чем в
+REPORT_WORKERS процессах одновременно. Остальные запросы ждут в очереди
+(FIFO, не больше REPORT_QUEUE_MAX), и запросившему сообщается его место.
+Процессы запускаются через spawn - без копии потоков и соединений бота - и с
+пониженным приоритетом, чтобы на машине с одним-двумя ядрами отчеты не
+отнимали процессор у обработчиков.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from app.core.config import REPORT_WORKERS, REPORT_QUEUE_MAX
+from app.core.utils import render_report
+
+
+def _init_worker():
+    """Инициализация процесса пула: пониженный приоритет планировщика ОС"""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+class ReportQueueFull(Exception):
+    """Очередь отчетов заполнена"""
+
+
+class ReportPool:
+    """Ограниченный пул процессов отчетов с очередью ожидания"""
+
+    def __init__(self, workers: int = REPORT_WORKERS, queue_max: int = REPORT_QUEUE_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.running = 0
+        self._waiting = deque()
+        self._moved = None
+        self._executor = None
+
+    @property
+    def queued(self) -> int:
+        """Отчетов в очереди (ожидают свободного процесса)"""
+        return len(self._waiting)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def _notify(self):
+        """Разбудить ожидающих: очередь сдвинулась или процесс освободился"""
+        if self._moved is not None:
+            self._moved.set()
+        self._moved = asyncio.Event()
+
+    def _can_start(self, ticket) -> bool:
+        return self.running < self.workers and self._waiting[0] is ticket
+
+    async def _wait_turn(self, on_position) -> bool:
+        """Дождаться свободного процесса по очереди; True, если отчет ждал в очереди"""
+        ticket = object()
+        self._waiting.append(ticket)
+        if self._moved is None:
+            self._moved = asyncio.Event()
+        reported = None
+        try:
+            while not self._can_start(ticket):
+                position = self._waiting.index(ticket) + 1
+                if on_position and position != reported:
+                    reported = position
+                    await on_position(position)
+                    # Пока сообщение отправлялось, очередь могла сдвинуться
+                    continue
+                await self._moved.wait()
+        except BaseException:
+            self._waiting.remove(ticket)
+            self._notify()
+            raise
+        self._waiting.popleft()
+        self.running += 1
+        self._notify()
+        return reported is not None
+
+    async def render(self, format_type: str, rows: list, output_path: str, on_position=None, **kwargs) -> str:
+        """
+        Построить отчет в процессе пула; путь к файлу
+
+        rows - строки task_report_row (без объектов сессии БД). on_position(n)
+        вызывается, когда отчет ждет в очереди на n-м месте, и с n=0, когда
+        ожидавший отчет начал строиться. ReportQueueFull - очередь заполнена.
+        """
+        if self.running >= self.workers and len(self._waiting) >= self.queue_max:
+            raise ReportQueueFull()
+        queued = await self._wait_turn(on_position)
+        try:
+            if queued:
+                await on_position(0)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(render_report, format_type, rows, output_path, **kwargs),
+            )
+        finally:
+            self.running -= 1
+            self._notify()
+
+    def shutdown(self):
+        """Остановить процессы пула (отчеты в очереди не строятся)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Пул отчетов процесса бота
+report_pool = ReportPool()
@@ -0,0 +1,137 @@
+"""
+Обработка обновлений бота с сессией БД на обновление
+
+Application передает каждое обновление процессору; процессор выполняет его
+внутри update_session_scope(), поэтому все AsyncDatabaseManager проверки прав
+и обработчика делят одну AsyncSession, а после обновления она закрывается и
+ее объекты не накапливаются между обновлениями.
+
+Обновления разных пользователей обрабатываются одновременно (не больше
+max_concurrent_updates), а обновления одного пользователя - по одному, в
+порядке поступления: шаги ConversationHandler и черновик в user_data не
+обгоняют друг друга. UpdateQueue сохраняет ограничение очереди обновлений
+при одновременной обработке.
+
+instrument_handlers() добавляет учет SQL-запросов по обработчикам.
+"""
+import asyncio
+import functools
+from itertools import chain
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor, ConversationHandler
+from app.core.database import QueryScope, update_session_scope
+
+
+def _order_key(update):
+    """Ключ очередности: пользователь, иначе чат; None - без ограничения"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class SessionUpdateProcessor(BaseUpdateProcessor):
+    """Процессор обновлений: одна сессия БД на обновление, по одному на пользователя
+
+    max_concurrent_updates=1 - последовательная обработка.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # ключ очередности -> [asyncio.Lock, число ожидающих и выполняемых обновлений]
+        self._order_locks = {}
+
+    async def process_update(self, update, coroutine):
+        # Очередность пользователя проверяется до общего ограничения: обновления,
+        # ждущие предыдущего обновления того же пользователя, не занимают слоты
+        # обработки других пользователей. asyncio.Lock пропускает ожидающих в
+        # порядке очереди, а Application запускает обновления в порядке поступления.
+        key = _order_key(update)
+        if key is None or self.max_concurrent_updates == 1:
+            await super().process_update(update, coroutine)
+            return
+        entry = self._order_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._order_locks[key]
+
+    @property
+    def ordered_keys(self) -> int:
+        """Пользователей (чатов) с обновлениями в обработке или ожидании"""
+        return len(self._order_locks)
+
+    async def do_process_update(self, update, coroutine):
+        async with update_session_scope():
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class UpdateQueue(asyncio.Queue):
+    """Очередь обновлений Application с ограничением обновлений в обработке
+
+    При max_concurrent_updates > 1 Application забирает обновления из очереди
+    сразу, не дожидаясь обработки, и maxsize перестает сдерживать прием. Здесь
+    get() ждет, пока принятых в обработку (еще не завершенных) обновлений
+    меньше in_flight; task_done() освобождает место. in_flight=0 - без ограничения.
+    """
+
+    def __init__(self, maxsize: int = 0, in_flight: int = 0):
+        super().__init__(maxsize)
+        self._in_flight = asyncio.Semaphore(in_flight) if in_flight > 0 else None
+
+    async def get(self):
+        if self._in_flight is None:
+            return await super().get()
+        await self._in_flight.acquire()
+        try:
+            return await super().get()
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    def task_done(self):
+        super().task_done()
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+
+def instrument_handlers(application):
+    """Учет SQL-запросов по обработчикам бота
+    
+    Каждый callback (и во вложенных ConversationHandler) выполняется в
+    QueryScope с именем "bot:<имя функции>"; итоги - в get_query_stats().
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument(handler)
+
+
+def _instrument(handler):
+    if isinstance(handler, ConversationHandler):
+        for nested in chain(handler.entry_points, chain.from_iterable(handler.states.values()), handler.fallbacks):
+            _instrument(nested)
+        return
+    handler.callback = _tracked(handler.callback)
+
+
+def _tracked(callback):
+    name = f"bot:{callback.__name__}"
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with QueryScope(name):
+            return await callback(update, context)
+    return wrapper
@@ -3,7 +3,8 @@
 """
 from . import config
 from . import models
+from . import migrations
 from . import database
 from . import utils
 
-__all__ = ['config', 'models', 'database', 'utils']
+__all__ = ['config', 'models', 'migrations', 'database', 'utils']
@@ -0,0 +1,83 @@
+"""
+Счетчики версий кэшей процессов (таблица cache_versions)
+
+Бот, API и админ-панель работают в разных процессах, и у каждого свои кэши
+в памяти. Кэш регистрирует модели, от которых зависит, через track_models();
+любая запись этих моделей через ORM-сессию (объекты и массовые update/delete)
+увеличивает его счетчик в той же транзакции. Другие процессы сверяют счетчик
+не чаще раза в интервал опроса, а процесс-писатель сбрасывает кэш сразу
+после commit.
+"""
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from .models import CacheVersion
+
+# Зарегистрированные кэши: (имя счетчика, модели, кэш с методом invalidate())
+_tracked = []
+
+
+def track_models(name: str, models: tuple, cache):
+    """Увеличивать счетчик name при записи models и сбрасывать cache после commit"""
+    _tracked.append((name, tuple(models), cache))
+
+
+def get_cache_version(session, name: str):
+    """Текущая версия кэша в БД (None, если счетчика еще нет)"""
+    return session.execute(select(CacheVersion.version).where(CacheVersion.name == name)).scalar()
+
+
+def bump_cache_version(connection, name: str):
+    """Увеличить версию кэша в текущей транзакции"""
+    connection.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1, updated_at=datetime.utcnow())
+    )
+
+
+def _bump(session, names):
+    changed = session.info.setdefault('changed_caches', set())
+    for name in names:
+        if name not in changed:
+            bump_cache_version(session.connection(), name)
+            changed.add(name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    """Изменены объекты отслеживаемых моделей - увеличиваем версии в той же транзакции"""
+    objects = list(chain(session.new, session.dirty, session.deleted))
+    _bump(session, [
+        name for name, models, _ in _tracked
+        if any(isinstance(obj, models) for obj in objects)
+    ])
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_on_bulk_write(orm_execute_state):
+    """Массовые query(...).update()/delete() по отслеживаемым моделям"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    _bump(orm_execute_state.session, [
+        name for name, models, _ in _tracked if issubclass(mapper.class_, models)
+    ])
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    """Процесс-писатель видит свои изменения сразу, не дожидаясь опроса"""
+    changed = session.info.pop('changed_caches', None)
+    if changed:
+        for name, _, cache in _tracked:
+            if name in changed:
+                cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('changed_caches', None)
@@ -15,9 +15,155 @@ load_dotenv(dotenv_path=env_path)
 
 # Telegram Bot
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+# Адрес Bot API (локальный сервер Bot API или scripts/fake_bot_api.py); пусто - api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+# Получение обновлений: polling (getUpdates) или webhook. В режиме webhook встроенный
+# сервер PTB слушает BOT_WEBHOOK_LISTEN:BOT_WEBHOOK_PORT, путь BOT_WEBHOOK_PATH, а в
+# Telegram регистрируется BOT_WEBHOOK_URL/BOT_WEBHOOK_PATH; запросы без заголовка с
+# BOT_WEBHOOK_SECRET отклоняются. BOT_WEBHOOK_MAX_CONNECTIONS - одновременных соединений
+# Telegram, BOT_UPDATE_QUEUE_SIZE - наибольшая очередь необработанных обновлений
+# (0 - без ограничения; при заполненной очереди вебхук отвечает Telegram с задержкой)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+BOT_WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')
+BOT_WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '0.0.0.0')
+BOT_WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', 8443))
+BOT_WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', 'telegram')
+BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+BOT_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('BOT_WEBHOOK_MAX_CONNECTIONS', 40))
+BOT_UPDATE_QUEUE_SIZE = int(os.getenv('BOT_UPDATE_QUEUE_SIZE', 0))
+# Сколько обновлений бот обрабатывает одновременно (обновления одного пользователя -
+# по одному); 1 - последовательно. Не больше пула соединений БД бота (DB_POOL_*)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 8))
 
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///task_manager.db')
+# URL для асинхронного слоя бота; по умолчанию выводится из DATABASE_URL
+# (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg)
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', '')
+# URL только для чтения (отчеты, списки API, аналитика), например реплика PostgreSQL.
+# По умолчанию файловая SQLite открывается тем же файлом в режиме mode=ro,
+# а другие БД читаются через основной URL
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL', '')
+
+# Профиль движка БД (см. DATABASE_PROFILES ниже):
+#   multiprocess - один SQLite-файл используют бот, API и админ-панель одновременно
+#   default      - настройки драйвера по умолчанию, без PRAGMA и повторов
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'multiprocess')
+
+# PRAGMA для SQLite в профиле multiprocess.
+# WAL требует, чтобы все процессы видели каталог с базой целиком (файлы -wal и -shm),
+# поэтому в Docker монтируйте каталог, а не отдельный файл базы.
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16384))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+
+# Повтор транзакций при блокировке БД (ограниченный экспоненциальный backoff)
+DB_LOCK_RETRIES = int(os.getenv('DB_LOCK_RETRIES', 5))
+DB_LOCK_RETRY_BASE_DELAY = float(os.getenv('DB_LOCK_RETRY_BASE_DELAY', 0.05))
+DB_LOCK_RETRY_MAX_DELAY = float(os.getenv('DB_LOCK_RETRY_MAX_DELAY', 1.0))
+
+# Пул соединений (для PostgreSQL и файловой SQLite).
+# Процесс определяется переменной APP_PROCESS (bot, api, admin) - у каждого свои
+# значения по умолчанию; переменные DB_POOL_* переопределяют их для любого процесса.
+APP_PROCESS = os.getenv('APP_PROCESS', 'default')
+
+DB_POOL_DEFAULTS = {
+    # Бот: один event loop, немного параллельных запросов
+    'bot': {'pool_size': 5, 'max_overflow': 5, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    # API: потоки Flask, больше параллельных запросов
+    'api': {'pool_size': 10, 'max_overflow': 10, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    # Админ-панель: единичные пользователи
+    'admin': {'pool_size': 2, 'max_overflow': 3, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    'default': {'pool_size': 5, 'max_overflow': 10, 'pool_recycle': 1800, 'pool_pre_ping': True},
+}
+
+
+def _pool_settings(process: str) -> dict:
+    """Настройки пула для процесса с учетом переопределений из окружения"""
+    settings = dict(DB_POOL_DEFAULTS.get(process, DB_POOL_DEFAULTS['default']))
+    if os.getenv('DB_POOL_SIZE'):
+        settings['pool_size'] = int(os.getenv('DB_POOL_SIZE'))
+    if os.getenv('DB_MAX_OVERFLOW'):
+        settings['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW'))
+    if os.getenv('DB_POOL_RECYCLE'):
+        settings['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE'))
+    if os.getenv('DB_POOL_PRE_PING'):
+        settings['pool_pre_ping'] = os.getenv('DB_POOL_PRE_PING').lower() == 'true'
+    return settings
+
+
+DB_POOL_SETTINGS = _pool_settings(APP_PROCESS)
+
+DATABASE_PROFILES = {
+    'default': {
+        'sqlite_pragmas': {},
+        'lock_retries': 0,
+    },
+    'multiprocess': {
+        'sqlite_pragmas': {
+            'journal_mode': SQLITE_JOURNAL_MODE,
+            'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+            'synchronous': SQLITE_SYNCHRONOUS,
+            # Отрицательное значение cache_size задается в килобайтах
+            'cache_size': -SQLITE_CACHE_SIZE_KB,
+            'mmap_size': SQLITE_MMAP_SIZE,
+        },
+        'lock_retries': DB_LOCK_RETRIES,
+    },
+}
+
+# Кэш справочников (участки, оборудование, продукция): как часто каждый процесс
+# сверяет версию в таблице cache_versions, секунды
+REFERENCE_CACHE_POLL_SECONDS = float(os.getenv('REFERENCE_CACHE_POLL_SECONDS', 10))
+# Кэш пользователей (telegram_id -> id, роль, активность) для проверки прав в боте:
+# размер LRU, время жизни записи и интервал сверки версии, секунды
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv('IDENTITY_CACHE_TTL_SECONDS', 300))
+IDENTITY_CACHE_POLL_SECONDS = float(os.getenv('IDENTITY_CACHE_POLL_SECONDS', 10))
+# Наибольшее число заданий в одном массовом создании (план смены, POST /tasks/bulk)
+BULK_TASKS_MAX = int(os.getenv('BULK_TASKS_MAX', 1000))
+# Архив заданий: завершенные задания старше ARCHIVE_AFTER_DAYS дней переносятся
+# в tasks_archive пачками по ARCHIVE_BATCH_SIZE (scripts/archive_tasks.py)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+# Outbox сообщений Telegram: диспетчер бота забирает до OUTBOX_BATCH_SIZE сообщений
+# раз в OUTBOX_POLL_SECONDS; неудачная отправка повторяется с экспоненциальной
+# задержкой (от OUTBOX_RETRY_BASE_DELAY до OUTBOX_RETRY_MAX_DELAY секунд),
+# не больше OUTBOX_MAX_ATTEMPTS попыток
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 1.0))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv('OUTBOX_RETRY_BASE_DELAY', 2.0))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv('OUTBOX_RETRY_MAX_DELAY', 600))
+# Сколько секунд забранное диспетчером сообщение не видно другим процессам бота;
+# если процесс упал до отправки, сообщение отправится снова после этого срока
+OUTBOX_LEASE_SECONDS = float(os.getenv('OUTBOX_LEASE_SECONDS', 300))
+# Ограничение отправки сообщений ботом (token bucket): сообщений в секунду на бота
+# и в один чат, запас (burst) ведра чата и число повторов запроса после RetryAfter
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', 3))
+TELEGRAM_RETRY_AFTER_RETRIES = int(os.getenv('TELEGRAM_RETRY_AFTER_RETRIES', 3))
+# Отчеты бота строятся в пуле из REPORT_WORKERS процессов; в очереди ждут не
+# больше REPORT_QUEUE_MAX отчетов, остальным предлагается повторить позже
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+REPORT_QUEUE_MAX = int(os.getenv('REPORT_QUEUE_MAX', 20))
+# Состояние диалогов бота (user_data, шаги ConversationHandler) хранится в отдельной
+# SQLite-базе BOT_STATE_DB и записывается раз в BOT_STATE_FLUSH_SECONDS; диалог без
+# ответа BOT_CONVERSATION_TIMEOUT секунд завершается, состояние пользователя без
+# обновлений BOT_STATE_TTL_SECONDS удаляется, в памяти - не больше BOT_STATE_MAX_USERS
+BOT_STATE_DB = os.getenv('BOT_STATE_DB', 'bot_state.db')
+BOT_STATE_FLUSH_SECONDS = float(os.getenv('BOT_STATE_FLUSH_SECONDS', 10))
+BOT_CONVERSATION_TIMEOUT = float(os.getenv('BOT_CONVERSATION_TIMEOUT', 1800))
+BOT_STATE_TTL_SECONDS = float(os.getenv('BOT_STATE_TTL_SECONDS', 86400))
+BOT_STATE_MAX_USERS = int(os.getenv('BOT_STATE_MAX_USERS', 10000))
+# Учет SQL-запросов: запросы дольше SLOW_QUERY_MS пишутся в лог (отрицательное
+# значение отключает лог); бот отдает метрики на BOT_METRICS_PORT (0 - не отдает)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+BOT_METRICS_HOST = os.getenv('BOT_METRICS_HOST', '127.0.0.1')
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', 0))
 
 # Encryption
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '')
@@ -26,6 +172,8 @@ ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '')
 FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
 FLASK_PORT = int(os.getenv('FLASK_PORT', 5050))
 FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+# Наибольший размер страницы списка заданий (параметр limit)
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 500))
 
 # Admin Panel
 ADMIN_HOST = os.getenv('ADMIN_HOST', '0.0.0.0')
@@ -0,0 +1,153 @@
+"""
+Дневные итоги заданий (таблица task_daily_agg)
+
+Сводки за период читают по строке на день, смену, сотрудника, оборудование и
+продукцию вместо всех заданий. DatabaseManager обновляет итоги в транзакции
+записи задания: при создании прибавляет вклад новых строк tasks, при смене
+статуса или факта прибавляет разницу между строкой до и после UPDATE
+(change_select) - в PostgreSQL в той же команде, что и UPDATE (transition_ctes).
+rebuild() пересчитывает итоги из tasks и tasks_archive (миграция и
+scripts/rebuild_daily_agg.py).
+
+Прибавление - INSERT ... SELECT ... ON CONFLICT DO UPDATE (SQLite и PostgreSQL).
+"""
+from sqlalchemy import case, delete, func, insert, literal, select, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import Task, TaskArchive, TaskDailyAgg, TaskStatusEnum
+
+# Ключ строки итогов
+KEY_COLUMNS = ('task_date', 'shift', 'manager_id', 'employee_id', 'equipment_id', 'product_id')
+# Колонка итогов с числом заданий в каждом статусе
+STATUS_COLUMNS = {
+    TaskStatusEnum.CREATED: 'created_count',
+    TaskStatusEnum.RECEIVED: 'received_count',
+    TaskStatusEnum.COMPLETED: 'completed_count',
+    TaskStatusEnum.CLOSED: 'closed_count',
+}
+VALUE_COLUMNS = ('planned_sum', 'actual_sum', *STATUS_COLUMNS.values())
+
+
+def contribution_select(source, *where):
+    """SELECT вклада заданий source (tasks, tasks_archive или их объединение) в итоги
+
+    Строки сгруппированы по ключу итогов.
+    """
+    c = source.c
+    keys = [c[name] for name in KEY_COLUMNS]
+    return select(
+        *keys,
+        func.sum(c.planned_quantity).label('planned_sum'),
+        func.sum(func.coalesce(c.actual_quantity, 0)).label('actual_sum'),
+        *(func.sum(case((c.status == status, 1), else_=0)).label(column)
+          for status, column in STATUS_COLUMNS.items()),
+    ).where(*where).group_by(*keys)
+
+
+def _dialect_name(connection) -> str:
+    """Имя диалекта для Connection или Session"""
+    dialect = getattr(connection, 'dialect', None) or connection.get_bind().dialect
+    return dialect.name
+
+
+def change_select(old, new, *where):
+    """SELECT изменения итогов при переходе строки задания old -> new
+
+    old и new - колонки строки до и после UPDATE (new[name] - колонка или
+    значение). Ключ итогов при этом не меняется, поэтому изменение - одна
+    строка итогов с разницей значений.
+    """
+    def counted(row, status):
+        return case((row['status'] == status, 1), else_=0)
+
+    return select(
+        *(old[name] for name in KEY_COLUMNS),
+        (new['planned_quantity'] - old['planned_quantity']).label('planned_sum'),
+        (func.coalesce(new['actual_quantity'], 0) - func.coalesce(old['actual_quantity'], 0)).label('actual_sum'),
+        *((counted(new, status) - counted(old, status)).label(column) for status, column in STATUS_COLUMNS.items()),
+    ).where(*where)
+
+
+def _upsert(dialect_name: str, rows):
+    """INSERT строк rows в итоги, ON CONFLICT - прибавить к существующим"""
+    dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(TaskDailyAgg).from_select([*KEY_COLUMNS, *VALUE_COLUMNS], rows)
+    return stmt.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={name: TaskDailyAgg.__table__.c[name] + stmt.excluded[name] for name in VALUE_COLUMNS},
+    )
+
+
+def _check_values(values: dict):
+    """UPDATE заданий не должен менять ключ итогов (change_select его не переносит)"""
+    assert not set(values) & set(KEY_COLUMNS), f"Ключ дневных итогов не меняется при обновлении: {sorted(values)}"
+
+
+def add(connection, *where):
+    """Прибавить к итогам вклад заданий tasks, отобранных where"""
+    connection.execute(_upsert(_dialect_name(connection), contribution_select(Task.__table__, *where)))
+
+
+def add_change(connection, values: dict, *where):
+    """Прибавить к итогам изменение от UPDATE tasks SET values WHERE where
+
+    Выполняется до UPDATE в той же транзакции: значения после UPDATE берутся
+    из values, остальные колонки - из текущей строки.
+    """
+    _check_values(values)
+    old = Task.__table__.c
+    new = {
+        name: literal(values[name], old[name].type) if name in values else old[name]
+        for name in ('planned_quantity', 'actual_quantity', 'status')
+    }
+    connection.execute(_upsert(_dialect_name(connection), change_select(old, new, *where)))
+
+
+def transition_ctes(values: dict, *where):
+    """PostgreSQL: UPDATE tasks SET values WHERE where и изменение итогов одной командой
+
+    Возвращает (new, agg): CTE с обновленной строкой (UPDATE ... RETURNING) и
+    CTE с INSERT ... ON CONFLICT в итоги. Строка до UPDATE читается в CTE с
+    FOR UPDATE, поэтому параллельный UPDATE того же задания ждет и не учтет
+    переход дважды.
+    """
+    _check_values(values)
+    table = Task.__table__
+    old = select(table).where(*where).with_for_update().cte('old')
+    new = update(table).where(table.c.id == old.c.id).values(**values).returning(*table.c).cte('new')
+    agg = _upsert('postgresql', change_select(old.c, new.c, new.c.id == old.c.id)).cte('agg')
+    return new, agg
+
+
+def _history_select():
+    """Итоги, посчитанные заново по tasks и tasks_archive"""
+    columns = Task.__table__.columns
+    history = union_all(
+        select(*columns),
+        select(*(TaskArchive.__table__.c[column.name] for column in columns)),
+    ).subquery()
+    return contribution_select(history)
+
+
+def rebuild(connection) -> int:
+    """Пересчитать таблицу итогов целиком в текущей транзакции; число строк итогов"""
+    if _dialect_name(connection) == 'postgresql':
+        # Записи заданий ждут конца пересчета, иначе их вклад потеряется
+        connection.execute(text('LOCK TABLE tasks IN SHARE MODE'))
+    connection.execute(delete(TaskDailyAgg))
+    connection.execute(insert(TaskDailyAgg).from_select([*KEY_COLUMNS, *VALUE_COLUMNS], _history_select()))
+    return connection.scalar(select(func.count()).select_from(TaskDailyAgg))
+
+
+def mismatches(connection) -> list:
+    """Ключи итогов, которые расходятся с пересчетом по заданиям (пустой список - итоги верны)"""
+    def rows(stmt):
+        # Строки с нулевыми значениями остаются после переходов и равны отсутствующим
+        return {
+            tuple(row[:len(KEY_COLUMNS)]): tuple(round(value, 6) for value in row[len(KEY_COLUMNS):])
+            for row in connection.execute(stmt)
+            if any(row[len(KEY_COLUMNS):])
+        }
+    table = TaskDailyAgg.__table__.c
+    stored = rows(select(*(table[name] for name in (*KEY_COLUMNS, *VALUE_COLUMNS))))
+    expected = rows(_history_select())
+    return [key for key in stored.keys() | expected.keys() if stored.get(key) != expected.get(key)]
@@ -1,24 +1,562 @@
 """
 Модуль для работы с базой данных
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from .models import Base, User, Workshop, Equipment, Product, ProductEquipment, Task, Notification, RoleEnum, ShiftEnum, TaskStatusEnum
-from .config import DATABASE_URL
-from .utils import logger
-from datetime import datetime
+import asyncio
+import contextvars
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+from sqlalchemy import create_engine, event, and_, or_, func, select, union, union_all, update, insert, delete
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, sessionmaker, scoped_session, joinedload, selectinload, aliased
+from .models import (
+    Base, User, Workshop, Equipment, Product, ProductEquipment, Task, Notification, TaskArchive, NotificationArchive,
+    TaskDailyAgg, OutboxMessage, RoleEnum, ShiftEnum, TaskStatusEnum
+)
+from .config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, DATABASE_READ_URL, DATABASE_PROFILE, DATABASE_PROFILES, DB_POOL_SETTINGS,
+    DB_LOCK_RETRY_BASE_DELAY, DB_LOCK_RETRY_MAX_DELAY, BULK_TASKS_MAX, SHIFT_TIMES, SLOW_QUERY_MS,
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, OUTBOX_RETRY_BASE_DELAY, OUTBOX_RETRY_MAX_DELAY,
+    OUTBOX_LEASE_SECONDS
+)
+from .utils import logger, get_today_utc3
+from .migrations import run_migrations
+from .reference_cache import reference_cache
+from .identity_cache import identity_cache, employee_directory_cache
+from . import daily_agg
+from datetime import datetime, timedelta
+
+if DATABASE_PROFILE not in DATABASE_PROFILES:
+    raise ValueError(f"Неизвестный профиль БД: {DATABASE_PROFILE}. Доступные: {', '.join(DATABASE_PROFILES)}")
+ENGINE_PROFILE = DATABASE_PROFILES[DATABASE_PROFILE]
+
+
+# PRAGMA, которые меняют файл базы: соединениям только для чтения не нужны
+SQLITE_WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def _apply_sqlite_pragmas(dbapi_connection, skip=()):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in ENGINE_PROFILE['sqlite_pragmas'].items():
+            if name not in skip:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Установка PRAGMA профиля на каждом новом соединении SQLite"""
+    _apply_sqlite_pragmas(dbapi_connection)
+
+
+def _set_sqlite_read_pragmas(dbapi_connection, connection_record):
+    """PRAGMA профиля для соединения SQLite только для чтения (без PRAGMA записи)"""
+    _apply_sqlite_pragmas(dbapi_connection, skip=SQLITE_WRITE_PRAGMAS)
+
+
+def engine_options(url: str) -> dict:
+    """Параметры create_engine для URL: пул соединений для всех БД, кроме SQLite в памяти"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return {}
+    return dict(DB_POOL_SETTINGS)
+
+
+# Стратегии загрузки связей задания для списков и отчетов:
+#   joined   - один запрос с LEFT JOIN при любом числе заданий (списки и отчеты
+#              бота и API)
+#   selectin - по одному запросу WHERE id IN (...) на связь на каждые 500 заданий:
+#              число запросов растет с выборкой (1 + 3 * ceil(n / 500))
+TASK_LOAD_STRATEGIES = {
+    'joined': joinedload,
+    'selectin': selectinload,
+}
+# Связи, которые показываются в списках заданий и отчетах
+TASK_RELATIONS = (Task.employee, Task.equipment, Task.product)
+
+
+# Статусы заданий, которые переносятся в архив (tasks_archive)
+ARCHIVED_STATUSES = (TaskStatusEnum.COMPLETED, TaskStatusEnum.CLOSED)
+
+
+def archive_horizon() -> datetime:
+    """Граница архива: в tasks_archive только задания с task_date раньше нее"""
+    return datetime.combine(get_today_utc3() - timedelta(days=ARCHIVE_AFTER_DAYS), datetime.min.time())
+
+
+def reaches_archive(status: TaskStatusEnum = None, date_from=None) -> bool:
+    """Может ли выборка заданий (фильтр по статусу и началу периода) затронуть архив"""
+    if status is not None and status not in ARCHIVED_STATUSES:
+        return False
+    return date_from is None or datetime.combine(date_from, datetime.min.time()) < archive_horizon()
+
+
+def task_history():
+    """Task поверх tasks UNION ALL tasks_archive
+    
+    Фильтры, сортировка и загрузка связей пишутся так же, как для Task;
+    условия WHERE БД применяет к каждой части объединения по ее индексам.
+    """
+    columns = Task.__table__.columns
+    archive = TaskArchive.__table__.columns
+    history = union_all(
+        select(*columns),
+        select(*(archive[column.name] for column in columns)),
+    ).subquery('tasks_history')
+    return aliased(Task, history)
+
+
+# Формат даты в курсоре страницы заданий
+TASK_CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_task_cursor(task) -> str:
+    """Курсор страницы заданий: позиция (task_date, id) последнего задания страницы
+    
+    Строка короткая и без "_", поэтому помещается в callback_data кнопок бота.
+    """
+    return f"{task.task_date.strftime(TASK_CURSOR_DATE_FORMAT)}-{task.id}"
+
+
+def decode_task_cursor(cursor: str):
+    """Разобрать курсор страницы заданий в (task_date, id); ValueError при неверном формате"""
+    date_part, _, id_part = cursor.partition('-')
+    return datetime.strptime(date_part, TASK_CURSOR_DATE_FORMAT), int(id_part)
+
+
+def shift_name(shift: ShiftEnum) -> str:
+    """Название смены для сообщений, например "1-я смена (08:00-20:00)" """
+    times = SHIFT_TIMES[shift.value]
+    return f"{shift.value}-я смена ({times['start']}-{times['end']})"
+
+
+def task_assigned_message(task_id: int, equipment_name: str, product_name: str, planned_quantity: float,
+                          shift: ShiftEnum, task_date) -> str:
+    """Текст уведомления сотруднику о новом задании"""
+    return (
+        f"📋 Вам назначено новое задание №{task_id}\n\n"
+        f"Оборудование: {equipment_name}\n"
+        f"Продукция: {product_name}\n"
+        f"Количество: {planned_quantity}\n"
+        f"Смена: {shift_name(shift)}\n"
+        f"Дата: {task_date.strftime('%d.%m.%Y')}"
+    )
+
+
+# Заданий в одном сообщении сотруднику о массовом назначении (план смены)
+ASSIGNED_SUMMARY_LINES = 30
+
+
+def tasks_assigned_summary(tasks, refs) -> str:
+    """Текст одного сообщения сотруднику о нескольких новых заданиях
+    
+    tasks - строки с id, equipment_id, product_id, planned_quantity, shift, task_date;
+    задания сгруппированы по дате и смене.
+    """
+    tasks = sorted(tasks, key=lambda task: (task.task_date, task.shift.value, task.id))
+    lines = [f"📋 Вам назначено заданий: {len(tasks)}"]
+    section = None
+    for task in tasks[:ASSIGNED_SUMMARY_LINES]:
+        if (task.task_date, task.shift) != section:
+            section = (task.task_date, task.shift)
+            lines += ["", f"{task.task_date.strftime('%d.%m.%Y')}, {shift_name(task.shift)}"]
+        lines.append(
+            f"№{task.id}: {refs.get_equipment_by_id(task.equipment_id).name} - "
+            f"{refs.get_product_by_id(task.product_id).name}, {task.planned_quantity}"
+        )
+    if len(tasks) > ASSIGNED_SUMMARY_LINES:
+        lines.append(f"... и еще {len(tasks) - ASSIGNED_SUMMARY_LINES}")
+    return "\n".join(lines)
+
+
+def outbox_retry_delay(attempt: int) -> float:
+    """Задержка перед повтором отправки из outbox: экспонента с ограничением и разбросом"""
+    delay = min(OUTBOX_RETRY_BASE_DELAY * (2 ** attempt), OUTBOX_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class TaskValidationError(ValueError):
+    """Неверные строки массового создания заданий
+    
+    errors - список (номер строки с 0, описание ошибки).
+    """
+    
+    def __init__(self, errors):
+        self.errors = errors
+        shown = "; ".join(f"строка {index + 1}: {message}" for index, message in errors[:10])
+        more = f" (и еще {len(errors) - 10})" if len(errors) > 10 else ""
+        super().__init__(f"Задания не созданы: {shown}{more}")
+
+
+def create_db_engine(url: str, readonly: bool = False):
+    """Создать движок БД с настройками выбранного профиля и пула"""
+    db_engine = create_engine(url, echo=False, **engine_options(url))
+    if db_engine.dialect.name == 'sqlite' and ENGINE_PROFILE['sqlite_pragmas']:
+        event.listen(db_engine, 'connect', _set_sqlite_read_pragmas if readonly else _set_sqlite_pragmas)
+    return db_engine
+
+
+def to_readonly_url(url: str):
+    """URL чтения для основного URL, если DATABASE_READ_URL не задан
+    
+    Файловая SQLite открывается тем же файлом в режиме mode=ro (URI): такие
+    соединения не берут блокировок записи и не могут изменить базу. Для других
+    БД и SQLite в памяти - None (чтение через основной движок).
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite' or parsed.database in (None, '', ':memory:'):
+        return None
+    database = parsed.database
+    if not database.startswith('file:'):
+        database = f"file:{quote(os.path.abspath(database))}"
+    query = dict(parsed.query, mode='ro', uri='true')
+    return parsed.set(database=database, query=query).render_as_string(hide_password=False)
+
+
+def read_database_url():
+    """URL движка чтения или None, если чтение идет через основной движок"""
+    return DATABASE_READ_URL or to_readonly_url(DATABASE_URL)
+
+
+class LockMetrics:
+    """Счетчики ожидания блокировок БД (для мониторинга конкуренции процессов)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.lock_errors = 0       # сколько раз транзакция получила "database is locked"
+            self.retries = 0           # сколько повторов выполнено
+            self.gave_up = 0           # сколько транзакций завершились ошибкой после всех повторов
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+    
+    def record_retry(self, delay: float):
+        with self._lock:
+            self.lock_errors += 1
+            self.retries += 1
+            self.wait_seconds_total += delay
+            self.wait_seconds_max = max(self.wait_seconds_max, delay)
+    
+    def record_failure(self):
+        with self._lock:
+            self.lock_errors += 1
+            self.gave_up += 1
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'lock_errors': self.lock_errors,
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+            }
+
+
+lock_metrics = LockMetrics()
+
+
+def get_lock_metrics() -> dict:
+    """Текущие метрики ожидания блокировок БД в этом процессе"""
+    return lock_metrics.snapshot()
+
+
+# === Учет SQL-запросов по обработчикам бота и эндпоинтам API ===
+
+# Длина текста запроса в логе медленных запросов и в метриках
+SQL_TEXT_LIMIT = 500
+# Сколько параметров показывать в форме параметров (многострочный INSERT - тысячи)
+PARAMS_SHAPE_LIMIT = 20
+
+
+class QueryScope:
+    """Запросы одного вызова обработчика бота или запроса API
+    
+    Пока scope активен (with или start()/finish()), события курсора всех
+    движков процесса добавляют в него число запросов, время в БД и самый
+    медленный запрос; finish() передает итог в query_stats под именем name.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self._token = None
+        self._started = None
+    
+    def start(self):
+        self._token = _query_scope.set(self)
+        self._started = time.perf_counter()
+        return self
+    
+    def finish(self):
+        _query_scope.reset(self._token)
+        elapsed = time.perf_counter() - self._started
+        query_stats.record(self, elapsed)
+        logger.debug(f"{self.name}: запросов {self.queries}, в БД {self.db_seconds * 1000:.1f} мс "
+                     f"из {elapsed * 1000:.1f} мс")
+    
+    def add(self, seconds: float, statement: str):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+
+# QueryScope текущего обработчика/запроса (None - запросы не учитываются)
+_query_scope = contextvars.ContextVar('query_scope', default=None)
+
+
+class QueryStats:
+    """Накопленные по имени scope счетчики запросов (для /metrics)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self._scopes = {}
+    
+    def record(self, scope: QueryScope, elapsed: float):
+        with self._lock:
+            stats = self._scopes.get(scope.name)
+            if stats is None:
+                stats = self._scopes[scope.name] = {
+                    'calls': 0, 'queries': 0, 'queries_max': 0, 'db_seconds': 0.0, 'seconds': 0.0,
+                    'slowest_seconds': 0.0, 'slowest_statement': None,
+                }
+            stats['calls'] += 1
+            stats['queries'] += scope.queries
+            stats['queries_max'] = max(stats['queries_max'], scope.queries)
+            stats['db_seconds'] += scope.db_seconds
+            stats['seconds'] += elapsed
+            if scope.slowest_seconds > stats['slowest_seconds']:
+                stats['slowest_seconds'] = scope.slowest_seconds
+                stats['slowest_statement'] = ' '.join(scope.slowest_statement.split())[:SQL_TEXT_LIMIT]
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: dict(stats, db_seconds=round(stats['db_seconds'], 6), seconds=round(stats['seconds'], 6),
+                           slowest_seconds=round(stats['slowest_seconds'], 6))
+                for name, stats in sorted(self._scopes.items())
+            }
+
+
+query_stats = QueryStats()
+
+
+def get_query_stats() -> dict:
+    """Счетчики запросов по обработчикам бота и эндпоинтам API в этом процессе"""
+    return query_stats.snapshot()
+
+
+def params_shape(parameters, executemany: bool = False) -> str:
+    """Форма параметров запроса без значений (в логах не должно быть персональных данных)"""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {params_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        shown = ', '.join(type(value).__name__ for value in parameters[:PARAMS_SHAPE_LIMIT])
+        more = f", ... всего {len(parameters)}" if len(parameters) > PARAMS_SHAPE_LIMIT else ""
+        return f"({shown}{more})"
+    return type(parameters).__name__
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    """Учесть запрос в текущем scope и записать в лог, если он медленнее SLOW_QUERY_MS"""
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    scope = _query_scope.get()
+    if scope is not None:
+        scope.add(seconds, statement)
+    if SLOW_QUERY_MS >= 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            f"Медленный запрос {seconds * 1000:.1f} мс ({scope.name if scope else 'вне обработчика'}): "
+            f"{' '.join(statement.split())[:SQL_TEXT_LIMIT]} | параметры: {params_shape(parameters, executemany)}"
+        )
+
+
+def render_prometheus_metrics() -> str:
+    """Метрики запросов и блокировок БД в текстовом формате Prometheus"""
+    def label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"')
+    
+    scopes = get_query_stats()
+    series = [
+        ('db_scope_calls_total', 'counter', 'Вызовы обработчика/эндпоинта', 'calls'),
+        ('db_queries_total', 'counter', 'SQL-запросы обработчика/эндпоинта', 'queries'),
+        ('db_queries_max', 'gauge', 'Наибольшее число запросов за один вызов', 'queries_max'),
+        ('db_query_seconds_total', 'counter', 'Время в БД, секунды', 'db_seconds'),
+        ('db_scope_seconds_total', 'counter', 'Полное время вызовов, секунды', 'seconds'),
+        ('db_slowest_query_seconds', 'gauge', 'Самый медленный запрос, секунды', 'slowest_seconds'),
+    ]
+    lines = []
+    for metric, kind, help_text, key in series:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{scope="{label(name)}"}} {stats[key]}' for name, stats in scopes.items()]
+    for key, value in get_lock_metrics().items():
+        metric = f"db_lock_{key}"
+        lines += [f"# TYPE {metric} {'gauge' if key.endswith('_max') else 'counter'}", f"{metric} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """/metrics - формат Prometheus, /metrics/queries - JSON с самыми медленными запросами"""
+    
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = render_prometheus_metrics()
+            if self.server.extra_metrics:
+                body += self.server.extra_metrics()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/metrics/queries':
+            body, content_type = json.dumps(get_query_stats(), ensure_ascii=False), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int, extra_metrics=None):
+    """HTTP-сервер /metrics в фоновом потоке (для процессов без Flask, например бота)
+
+    extra_metrics - функция, возвращающая дополнительные метрики процесса в
+    формате Prometheus (например, очередь отправок бота).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.extra_metrics = extra_metrics
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Метрики БД: http://{host}:{port}/metrics")
+    return server
+
+
+# SQLSTATE PostgreSQL, при которых транзакцию имеет смысл повторить:
+# serialization_failure, deadlock_detected, lock_not_available
+RETRYABLE_PG_CODES = {'40001', '40P01', '55P03'}
+
+
+def is_lock_error(error: Exception) -> bool:
+    """Является ли ошибка следствием конкурентной блокировки БД"""
+    if not isinstance(error, DBAPIError):
+        return False
+    pgcode = getattr(error.orig, 'pgcode', None) or getattr(error.orig, 'sqlstate', None)
+    if pgcode in RETRYABLE_PG_CODES:
+        return True
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def lock_retry_delay(attempt: int) -> float:
+    """Задержка перед повтором: экспонента с ограничением и случайным разбросом"""
+    delay = min(DB_LOCK_RETRY_MAX_DELAY, DB_LOCK_RETRY_BASE_DELAY * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def retry_on_lock(method):
+    """Повторить пишущий метод DatabaseManager при блокировке БД
+
+    Транзакция откатывается и выполняется заново, не более lock_retries раз
+    (из профиля БД), с ограниченным экспоненциальным backoff. В режиме unit of
+    work повтор возможен, только пока в транзакции нет изменений других методов.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.retry_on_lock or has_pending_unit_of_work(self.db):
+            return method(self, *args, **kwargs)
+        attempt = 0
+        while True:
+            try:
+                return method(self, *args, **kwargs)
+            except DBAPIError as e:
+                if not is_lock_error(e):
+                    raise
+                self.db.rollback()
+                if attempt >= ENGINE_PROFILE['lock_retries']:
+                    lock_metrics.record_failure()
+                    logger.error(f"{method.__name__}: БД заблокирована, повторы исчерпаны ({attempt})")
+                    raise
+                delay = lock_retry_delay(attempt)
+                lock_metrics.record_retry(delay)
+                logger.warning(f"{method.__name__}: БД заблокирована, повтор через {delay:.3f} с")
+                time.sleep(delay)
+                attempt += 1
+    return wrapper
+
+
+# Ключ session.info: в unit of work уже есть записанные (flush), но не зафиксированные изменения
+UNIT_OF_WORK_PENDING = 'unit_of_work_pending'
+
+
+def has_pending_unit_of_work(session) -> bool:
+    """Есть ли в сессии изменения unit of work, которые потеряет откат"""
+    return session.info.get(UNIT_OF_WORK_PENDING, False)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_unit_of_work(session):
+    session.info.pop(UNIT_OF_WORK_PENDING, None)
+
 
 # Создание движка БД
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_db_engine(DATABASE_URL)
+
+# Движок чтения: отчеты, списки API и аналитика не занимают соединения основного
+# движка, которым пользуются записи (подтверждения, отчеты сотрудников)
+_read_url = read_database_url()
+read_engine = create_db_engine(_read_url, readonly=True) if _read_url else engine
 
 # Создание фабрики сессий
 SessionLocal = scoped_session(sessionmaker(bind=engine))
+ReadSessionLocal = scoped_session(sessionmaker(bind=read_engine))
 
 
 def init_db():
-    """Инициализация базы данных - создание всех таблиц"""
+    """Инициализация базы данных - создание всех таблиц и применение миграций"""
     try:
         Base.metadata.create_all(engine)
+        # create_all не меняет существующие таблицы - индексы и прочие
+        # изменения схемы для рабочих баз применяются версионными миграциями
+        run_migrations(engine)
         logger.info("База данных инициализирована успешно")
         return True
     except Exception as e:
@@ -35,29 +573,103 @@ def get_db():
         pass
 
 
+def get_read_db():
+    """Получение сессии БД только для чтения"""
+    return ReadSessionLocal()
+
+
 def close_db(db):
     """Закрытие сессии БД"""
     if db:
         db.close()
 
 
+def remove_sessions():
+    """Освободить сессии текущего потока (в конце запроса API и админ-панели)"""
+    SessionLocal.remove()
+    ReadSessionLocal.remove()
+
+
 class DatabaseManager:
-    """Менеджер для работы с базой данных"""
+    """Менеджер для работы с базой данных
     
-    def __init__(self):
-        self.db = get_db()
+    По умолчанию каждый пишущий метод фиксирует свою транзакцию. В режиме
+    unit_of_work методы только отправляют изменения в БД (flush), а commit
+    выполняется один раз: явным вызовом commit() или при выходе из with без
+    исключения (при исключении изменения откатываются).
+    
+    С readonly=True менеджер читает через движок чтения (DATABASE_READ_URL или
+    SQLite в режиме mode=ro) и не выполняет запись.
+    """
+    
+    def __init__(self, session=None, retry_on_lock: bool = True, unit_of_work: bool = False,
+                 readonly: bool = False):
+        """
+        Args:
+            session: готовая сессия (например, синхронная сторона AsyncSession);
+                по умолчанию используется SessionLocal (ReadSessionLocal при readonly)
+            retry_on_lock: повторять пишущие методы при блокировке БД
+                (AsyncDatabaseManager повторяет их сам, не блокируя event loop)
+            unit_of_work: одна транзакция на обработчик/запрос вместо commit в каждом методе
+            readonly: только чтение (отчеты, списки, аналитика)
+        """
+        if session is None:
+            session = get_read_db() if readonly else get_db()
+        self.db = session
+        self.retry_on_lock = retry_on_lock
+        self.unit_of_work = unit_of_work
+        self.readonly = readonly
     
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.db.close()
+        try:
+            if self.unit_of_work:
+                if exc_type is None:
+                    self.db.commit()
+                else:
+                    self.db.rollback()
+        finally:
+            self.db.close()
+    
+    def commit(self):
+        """Зафиксировать транзакцию (в режиме unit_of_work - все изменения обработчика)"""
+        self.db.commit()
+    
+    def _save(self, *objects):
+        """Завершить изменения пишущего метода
+        
+        Обычно - commit и перечитывание objects; в режиме unit_of_work - только
+        flush (первичные ключи уже известны), commit выполнит владелец транзакции.
+        """
+        if self.readonly:
+            raise RuntimeError("DatabaseManager(readonly=True) не выполняет запись")
+        if self.unit_of_work:
+            self.db.flush()
+            self.db.info[UNIT_OF_WORK_PENDING] = True
+            return
+        self.db.commit()
+        for obj in objects:
+            self.db.refresh(obj)
     
     # === User operations ===
     def get_user_by_telegram_id(self, telegram_id: int):
         """Получить пользователя по Telegram ID"""
         return self.db.query(User).filter(User.telegram_id == telegram_id).first()
     
+    def get_identity(self, telegram_id: int):
+        """Получить ID, роль и активность пользователя по Telegram ID из кэша процесса
+        
+        Для проверки прав и выборок по user.id; None, если пользователь не зарегистрирован.
+        """
+        return identity_cache.get(self.db, telegram_id)
+    
+    def get_user_by_id(self, user_id: int):
+        """Получить пользователя по ID"""
+        return self.db.query(User).filter(User.id == user_id).first()
+    
+    @retry_on_lock
     def create_user(self, telegram_id: int, username: str = None, full_name: str = None, role: RoleEnum = RoleEnum.EMPLOYEE):
         """Создать нового пользователя"""
         user = User(
@@ -67,8 +679,7 @@ class DatabaseManager:
             role=role
         )
         self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
+        self._save(user)
         logger.info(f"Создан пользователь: {user}")
         return user
     
@@ -79,6 +690,13 @@ class DatabaseManager:
             User.is_active == True
         ).all()
     
+    def get_employee_directory(self):
+        """Снимок активных сотрудников с поиском по имени из кэша процесса
+
+        Версия пользователей сверяется с БД не чаще раза в IDENTITY_CACHE_POLL_SECONDS.
+        """
+        return employee_directory_cache.get(self.db)
+    
     def get_all_managers(self):
         """Получить всех начальников"""
         return self.db.query(User).filter(
@@ -86,6 +704,15 @@ class DatabaseManager:
             User.is_active == True
         ).all()
     
+    # === Reference data ===
+    def get_reference_data(self):
+        """Снимок справочников (участки, оборудование, продукция) из кэша процесса
+        
+        Версия справочников сверяется с БД не чаще раза в REFERENCE_CACHE_POLL_SECONDS.
+        Возвращаемые записи неизменяемы и не привязаны к сессии.
+        """
+        return reference_cache.get(self.db)
+    
     # === Workshop operations ===
     def get_all_workshops(self):
         """Получить все участки"""
@@ -98,7 +725,8 @@ class DatabaseManager:
     # === Equipment operations ===
     def get_all_equipment(self, workshop_id: int = None):
         """Получить все оборудование, опционально отфильтровать по участку"""
-        query = self.db.query(Equipment).filter(Equipment.is_active == True)
+        # Участок нужен во всех списках оборудования - загружаем его тем же запросом
+        query = self.db.query(Equipment).options(joinedload(Equipment.workshop)).filter(Equipment.is_active == True)
         if workshop_id:
             query = query.filter(Equipment.workshop_id == workshop_id)
         return query.all()
@@ -136,7 +764,23 @@ class DatabaseManager:
         
         return self.db.query(Equipment).filter(Equipment.id.in_(equipment_ids)).all()
     
+    def get_products_for_equipment(self, equipment_id: int):
+        """Получить активную продукцию, доступную для оборудования (один запрос)
+        
+        Продукция доступна, если связана с оборудованием в product_equipment
+        или это оборудование указано для нее по умолчанию.
+        """
+        product_ids = union(
+            select(ProductEquipment.product_id).where(ProductEquipment.equipment_id == equipment_id),
+            select(Product.id).where(Product.default_equipment_id == equipment_id)
+        )
+        return self.db.query(Product).filter(
+            Product.is_active == True,
+            Product.id.in_(product_ids)
+        ).order_by(Product.id).all()
+    
     # === Task operations ===
+    @retry_on_lock
     def create_task(self, manager_id: int, employee_id: int, equipment_id: int, 
                    product_id: int, planned_quantity: float, shift: ShiftEnum, 
                    task_date: datetime, notes: str = None):
@@ -153,77 +797,576 @@ class DatabaseManager:
             status=TaskStatusEnum.CREATED
         )
         self.db.add(task)
-        self.db.commit()
-        self.db.refresh(task)
+        self.db.flush()
+        daily_agg.add(self.db, Task.id == task.id)
+        self._save(task)
         logger.info(f"Создано задание: {task}")
         return task
     
-    def get_task_by_id(self, task_id: int):
-        """Получить задание по ID"""
-        return self.db.query(Task).filter(Task.id == task_id).first()
+    def _validate_bulk_tasks(self, manager_id: int, tasks: list) -> tuple:
+        """Проверить все строки массового создания до записи
+        
+        Returns:
+            (строки для INSERT, {ID сотрудника: Telegram ID})
+        
+        Справочники проверяются по кэшу, сотрудники - одним запросом.
+        """
+        if not tasks:
+            raise TaskValidationError([(0, "нет заданий")])
+        if len(tasks) > BULK_TASKS_MAX:
+            raise TaskValidationError([(BULK_TASKS_MAX, f"не больше {BULK_TASKS_MAX} заданий за раз")])
+        
+        manager = self.get_user_by_id(manager_id)
+        if not manager or not manager.is_active or manager.role not in (RoleEnum.MANAGER, RoleEnum.ADMIN):
+            raise TaskValidationError([(0, f"начальник {manager_id} не найден")])
+        
+        refs = self.get_reference_data()
+        employee_ids = {task.get('employee_id') for task in tasks}
+        employees = dict(self.db.execute(select(User.id, User.telegram_id).where(
+            User.id.in_([e for e in employee_ids if isinstance(e, int)]),
+            User.role == RoleEnum.EMPLOYEE,
+            User.is_active == True
+        )).all())
+        
+        errors = []
+        rows = []
+        for index, task in enumerate(tasks):
+            missing = [key for key in ('employee_id', 'equipment_id', 'product_id', 'planned_quantity', 'shift', 'task_date')
+                       if task.get(key) is None]
+            if missing:
+                errors.append((index, f"не заполнены поля {', '.join(missing)}"))
+                continue
+            try:
+                shift = ShiftEnum(task['shift'])
+                task_date = task['task_date']
+                if isinstance(task_date, str):
+                    task_date = datetime.strptime(task_date, '%Y-%m-%d')
+                elif not isinstance(task_date, datetime):
+                    task_date = datetime.combine(task_date, datetime.min.time())
+                planned_quantity = float(task['planned_quantity'])
+            except (ValueError, TypeError) as e:
+                errors.append((index, f"неверное значение: {e}"))
+                continue
+            
+            equipment = refs.get_equipment_by_id(task['equipment_id'])
+            product = refs.get_product_by_id(task['product_id'])
+            if not math.isfinite(planned_quantity) or planned_quantity <= 0:
+                # float() принимает "nan" и "inf", а NaN не меньше и не больше нуля
+                errors.append((index, "количество должно быть конечным числом больше нуля"))
+            elif task['employee_id'] not in employees:
+                errors.append((index, f"сотрудник {task['employee_id']} не найден или неактивен"))
+            elif not equipment or not equipment.is_active:
+                errors.append((index, f"оборудование {task['equipment_id']} не найдено или неактивно"))
+            elif not product or not product.is_active:
+                errors.append((index, f"продукция {task['product_id']} не найдена или неактивна"))
+            elif product not in refs.get_products_for_equipment(equipment.id):
+                errors.append((index, f"продукция {product.name} недоступна для оборудования {equipment.name}"))
+            else:
+                rows.append({
+                    'manager_id': manager_id,
+                    'employee_id': task['employee_id'],
+                    'equipment_id': equipment.id,
+                    'product_id': product.id,
+                    'planned_quantity': planned_quantity,
+                    'shift': shift,
+                    'task_date': task_date,
+                    'notes': task.get('notes'),
+                    'status': TaskStatusEnum.CREATED,
+                })
+        if errors:
+            raise TaskValidationError(errors)
+        return rows, employees
     
-    def get_tasks_by_employee(self, employee_id: int, status: TaskStatusEnum = None):
-        """Получить задания сотрудника"""
-        query = self.db.query(Task).filter(Task.employee_id == employee_id)
+    @retry_on_lock
+    def create_tasks_bulk(self, manager_id: int, tasks: list, notify: bool = True) -> list:
+        """Создать много заданий одной транзакцией (план смены)
+        
+        Все строки проверяются до записи: при любой ошибке не создается ничего.
+        Задания вставляются многострочным INSERT, уведомления сотрудникам -
+        одним пакетом, и каждому сотруднику в outbox ставится одно сообщение
+        Telegram со всеми его заданиями.
+        
+        Args:
+            manager_id: ID начальника
+            tasks: словари с employee_id, equipment_id, product_id, planned_quantity,
+                shift, task_date (date/datetime или 'YYYY-MM-DD') и необязательным notes
+            notify: создать уведомления сотрудникам о новых заданиях
+        
+        Returns:
+            ID созданных заданий по возрастанию (в порядке tasks)
+        
+        Raises:
+            TaskValidationError: неверные строки (с номерами)
+        """
+        rows, telegram_ids = self._validate_bulk_tasks(manager_id, tasks)
+        # Уведомления строятся по возвращенным строкам: порядок RETURNING не гарантирован,
+        # а sort_by_parameter_order на SQLite превращает INSERT в построчный
+        created = self.db.execute(
+            insert(Task).returning(Task.id, Task.employee_id, Task.equipment_id, Task.product_id,
+                                   Task.planned_quantity, Task.shift, Task.task_date),
+            rows
+        ).all()
+        daily_agg.add(self.db, Task.id.in_([task.id for task in created]))
+        
+        if notify:
+            refs = self.get_reference_data()
+            self.db.execute(insert(Notification), [
+                {
+                    'user_id': task.employee_id,
+                    'task_id': task.id,
+                    'message': task_assigned_message(
+                        task.id, refs.get_equipment_by_id(task.equipment_id).name,
+                        refs.get_product_by_id(task.product_id).name,
+                        task.planned_quantity, task.shift, task.task_date
+                    ),
+                }
+                for task in created
+            ])
+            tasks_by_employee = {}
+            for task in created:
+                tasks_by_employee.setdefault(task.employee_id, []).append(task)
+            self.db.execute(insert(OutboxMessage), [
+                {'chat_id': telegram_ids[employee_id], 'text': f"🔔 {tasks_assigned_summary(employee_tasks, refs)}"}
+                for employee_id, employee_tasks in tasks_by_employee.items()
+            ])
+        self._save()
+        logger.info(f"Создано заданий: {len(created)} (начальник {manager_id})")
+        # ID выдаются по порядку строк INSERT
+        return sorted(task.id for task in created)
+    
+    def get_last_shift_plan(self, manager_id: int, shift: ShiftEnum, before):
+        """Задания начальника за последнюю дату до before с заданиями на ту же смену
+        
+        Returns:
+            (дата, список заданий); (None, []), если таких заданий нет
+        """
+        before = datetime.combine(before, datetime.min.time())
+        last_date = self.db.scalar(
+            select(func.max(Task.task_date)).where(
+                Task.manager_id == manager_id, Task.shift == shift, Task.task_date < before
+            )
+        )
+        if last_date is None:
+            return None, []
+        tasks = self.db.query(Task).filter(
+            Task.manager_id == manager_id, Task.shift == shift, Task.task_date == last_date
+        ).order_by(Task.id).all()
+        return last_date, tasks
+    
+    def get_task_by_id(self, task_id: int, include_archive: bool = True):
+        """Получить задание по ID (если в tasks его нет - из архива, только для чтения)
+        
+        include_archive=False - только задания, которые еще можно изменить.
+        """
+        task = self.db.query(Task).filter(Task.id == task_id).first()
+        if task is None and include_archive:
+            history = task_history()
+            task = self.db.query(history).filter(history.id == task_id).first()
+        return task
+    
+    def _tasks_query(self, load: str = None, entity=Task):
+        """Запрос заданий с выбранной стратегией загрузки связей (см. TASK_LOAD_STRATEGIES)
+        
+        entity - Task или task_history() для выборок, которые затрагивают архив.
+        """
+        query = self.db.query(entity)
+        if load:
+            if load not in TASK_LOAD_STRATEGIES:
+                raise ValueError(f"Неизвестная стратегия загрузки: {load}. Доступные: {', '.join(TASK_LOAD_STRATEGIES)}")
+            loader = TASK_LOAD_STRATEGIES[load]
+            query = query.options(*(loader(getattr(entity, relation.key)) for relation in TASK_RELATIONS))
+        return query
+    
+    def _tasks_page(self, build, limit: int, cursor: str = None, archive: bool = False):
+        """Страница заданий по ключу (task_date, id) от новых к старым
+        
+        build(entity) строит запрос с фильтрами для Task или task_history().
+        С archive=True страница, которая доходит до archive_horizon(), читается
+        вместе с архивом (UNION ALL). Более новые страницы архив не затрагивают:
+        в tasks_archive только задания старше горизонта.
+        
+        Returns:
+            (задания страницы, курсор следующей страницы или None)
+        """
+        assert limit >= 1, f"Размер страницы должен быть не меньше 1: {limit}"
+        position = decode_task_cursor(cursor) if cursor else None
+        horizon = archive_horizon() if archive else None
+        if not archive or position is None or position[0] >= horizon:
+            tasks = self._page_rows(build(Task), Task, limit, position)
+            if not archive or (len(tasks) > limit and tasks[limit - 1].task_date >= horizon):
+                return self._page_result(tasks, limit)
+        history = task_history()
+        return self._page_result(self._page_rows(build(history), history, limit, position), limit)
+    
+    @staticmethod
+    def _page_rows(query, entity, limit: int, position=None):
+        """До limit + 1 заданий после позиции (task_date, id): лишняя запись показывает, есть ли следующая страница"""
+        if position:
+            cursor_date, cursor_id = position
+            query = query.filter(or_(
+                entity.task_date < cursor_date,
+                and_(entity.task_date == cursor_date, entity.id < cursor_id)
+            ))
+        return query.order_by(entity.task_date.desc(), entity.id.desc()).limit(limit + 1).all()
+    
+    @staticmethod
+    def _page_result(tasks: list, limit: int):
+        """(задания страницы, курсор следующей страницы или None)"""
+        if len(tasks) > limit:
+            return tasks[:limit], encode_task_cursor(tasks[limit - 1])
+        return tasks, None
+    
+    def _employee_tasks_query(self, employee_id: int, status: TaskStatusEnum = None, load: str = None, entity=Task):
+        """Запрос заданий сотрудника с фильтрами (без сортировки)"""
+        query = self._tasks_query(load, entity).filter(entity.employee_id == employee_id)
         if status:
-            query = query.filter(Task.status == status)
-        return query.order_by(Task.task_date.desc()).all()
+            query = query.filter(entity.status == status)
+        return query
     
-    def get_tasks_by_manager(self, manager_id: int, status: TaskStatusEnum = None, date_from=None, date_to=None):
-        """Получить задания начальника
+    def get_tasks_by_employee(self, employee_id: int, status: TaskStatusEnum = None, load: str = None):
+        """Получить задания сотрудника (вместе с архивом, если статус может там быть)
         
         Args:
-            manager_id: ID начальника
+            employee_id: ID сотрудника
             status: фильтр по статусу (опционально)
-            date_from: дата начала периода (date, включительно)
-            date_to: дата окончания периода (date, включительно)
+            load: загрузка связей - 'joined', 'selectin' или None (ленивая)
+        """
+        entity = task_history() if reaches_archive(status) else Task
+        query = self._employee_tasks_query(employee_id, status, load, entity)
+        return query.order_by(entity.task_date.desc()).all()
+    
+    def get_tasks_page_by_employee(self, employee_id: int, status: TaskStatusEnum = None, limit: int = 15,
+                                   cursor: str = None, load: str = None):
+        """Получить страницу заданий сотрудника (от новых к старым, вместе с архивом, если статус может там быть)
+        
+        Args:
+            employee_id: ID сотрудника
+            status: фильтр по статусу (опционально)
+            limit: размер страницы
+            cursor: курсор из предыдущей страницы (None - первая страница)
+            load: загрузка связей - 'joined', 'selectin' или None (ленивая)
+        
+        Returns:
+            (задания страницы, курсор следующей страницы или None)
         """
-        query = self.db.query(Task).filter(Task.manager_id == manager_id)
+        return self._tasks_page(
+            lambda entity: self._employee_tasks_query(employee_id, status, load, entity),
+            limit, cursor, archive=reaches_archive(status),
+        )
+    
+    def _manager_tasks_query(self, manager_id: int, status: TaskStatusEnum = None, date_from=None, date_to=None,
+                             load: str = None, entity=Task):
+        """Запрос заданий начальника с фильтрами (без сортировки)"""
+        query = self._tasks_query(load, entity).filter(entity.manager_id == manager_id)
         if status:
-            query = query.filter(Task.status == status)
+            query = query.filter(entity.status == status)
         if date_from:
             # Фильтруем по дате (включая начало дня)
             date_from_dt = datetime.combine(date_from, datetime.min.time())
-            query = query.filter(Task.task_date >= date_from_dt)
+            query = query.filter(entity.task_date >= date_from_dt)
         if date_to:
             # Фильтруем по дате (включая конец дня)
             date_to_dt = datetime.combine(date_to, datetime.max.time())
-            query = query.filter(Task.task_date <= date_to_dt)
-        return query.order_by(Task.task_date.desc()).all()
+            query = query.filter(entity.task_date <= date_to_dt)
+        return query
     
-    def update_task_status(self, task_id: int, status: TaskStatusEnum):
-        """Обновить статус задания"""
-        task = self.get_task_by_id(task_id)
-        if not task:
-            return None
+    def get_tasks_by_manager(self, manager_id: int, status: TaskStatusEnum = None, date_from=None, date_to=None,
+                             load: str = None):
+        """Получить задания начальника (вместе с архивом, если период начинается раньше archive_horizon())
         
-        task.status = status
+        Args:
+            manager_id: ID начальника
+            status: фильтр по статусу (опционально)
+            date_from: дата начала периода (date, включительно)
+            date_to: дата окончания периода (date, включительно)
+            load: загрузка связей - 'joined', 'selectin' или None (ленивая)
+        """
+        entity = task_history() if reaches_archive(status, date_from) else Task
+        query = self._manager_tasks_query(manager_id, status, date_from, date_to, load, entity)
+        return query.order_by(entity.task_date.desc()).all()
+    
+    def get_tasks_page_by_manager(self, manager_id: int, status: TaskStatusEnum = None, limit: int = 15,
+                                  cursor: str = None, date_from=None, date_to=None, load: str = None):
+        """Получить страницу заданий начальника (от новых к старым, вместе с архивом, если период начинается раньше archive_horizon())
+        
+        Args:
+            manager_id: ID начальника
+            status: фильтр по статусу (опционально)
+            limit: размер страницы
+            cursor: курсор из предыдущей страницы (None - первая страница)
+            date_from: дата начала периода (date, включительно)
+            date_to: дата окончания периода (date, включительно)
+            load: загрузка связей - 'joined', 'selectin' или None (ленивая)
+        
+        Returns:
+            (задания страницы, курсор следующей страницы или None)
+        """
+        return self._tasks_page(
+            lambda entity: self._manager_tasks_query(manager_id, status, date_from, date_to, load, entity),
+            limit, cursor, archive=reaches_archive(status, date_from),
+        )
+    
+    def count_tasks_by_status(self, user_id: int, role) -> dict:
+        """Количество заданий пользователя по статусам вместе с архивом (один запрос GROUP BY)
+        
+        Args:
+            user_id: ID пользователя
+            role: роль, в которой считаются задания (RoleEnum или строка): для
+                сотрудника - назначенные ему, для начальника и администратора - созданные им
+        
+        Returns:
+            {TaskStatusEnum: количество} по всем статусам, включая нулевые
+        """
+        history = task_history()
+        column = history.employee_id if RoleEnum(role) == RoleEnum.EMPLOYEE else history.manager_id
+        rows = self.db.query(history.status, func.count(history.id)).filter(column == user_id).group_by(history.status).all()
+        counts = {status: 0 for status in TaskStatusEnum}
+        counts.update(rows)
+        return counts
+    
+    def _update_task(self, task_id: int, expected_status: TaskStatusEnum = None, **values):
+        """Условно обновить задание одним UPDATE и вернуть новую строку
+        
+        UPDATE ... WHERE id = :task_id [AND status = :expected_status] RETURNING *.
+        Если задания нет или его статус уже не expected_status (например, два
+        быстрых нажатия "Подтвердить"), ничего не меняется и возвращается None.
+        Без поддержки RETURNING (старые SQLite) строка перечитывается отдельным SELECT.
+        
+        Дневные итоги меняются в той же транзакции: в PostgreSQL UPDATE и итоги -
+        одна команда (daily_agg.transition_ctes), в SQLite - две: INSERT ... ON
+        CONFLICT с изменением итогов и UPDATE.
+        """
+        where = [Task.id == task_id]
+        if expected_status is not None:
+            where.append(Task.status == expected_status)
+        dialect = self.db.get_bind().dialect
+        
+        if dialect.name == 'postgresql':
+            new, agg = daily_agg.transition_ctes(values, *where)
+            task = self.db.scalars(
+                select(aliased(Task, new)).add_cte(agg), execution_options={'populate_existing': True}
+            ).first()
+            self._save()
+            return task
+        
+        # SQLite пропускает только одного писателя: первая команда берет блокировку
+        # записи, и строка не изменится между изменением итогов и UPDATE
+        daily_agg.add_change(self.db, values, *where)
+        stmt = update(Task).where(*where).values(**values)
+        if dialect.update_returning:
+            task = self.db.scalars(
+                stmt.returning(Task), execution_options={'populate_existing': True}
+            ).first()
+        else:
+            result = self.db.execute(stmt, execution_options={'synchronize_session': False})
+            task = self.db.get(Task, task_id, populate_existing=True) if result.rowcount else None
+        self._save()
+        return task
+    
+    @retry_on_lock
+    def update_task_status(self, task_id: int, status: TaskStatusEnum, expected_status: TaskStatusEnum = None):
+        """Обновить статус задания
+        
+        Args:
+            expected_status: обновить, только если текущий статус такой (иначе вернуть None)
+        """
+        values = {'status': status}
         if status == TaskStatusEnum.RECEIVED:
-            task.received_at = datetime.utcnow()
+            values['received_at'] = datetime.utcnow()
         elif status == TaskStatusEnum.COMPLETED:
-            task.completed_at = datetime.utcnow()
+            values['completed_at'] = datetime.utcnow()
         
-        self.db.commit()
-        self.db.refresh(task)
-        logger.info(f"Обновлен статус задания {task_id}: {status.value}")
+        task = self._update_task(task_id, expected_status, **values)
+        if task:
+            logger.info(f"Обновлен статус задания {task_id}: {status.value}")
+        return task
+    
+    @retry_on_lock
+    def update_task_actual_quantity(self, task_id: int, actual_quantity: float,
+                                    expected_status: TaskStatusEnum = None):
+        """Обновить фактическое количество выполненной продукции и завершить задание
+        
+        Args:
+            expected_status: обновить, только если текущий статус такой (иначе вернуть None)
+        """
+        task = self._update_task(
+            task_id, expected_status,
+            actual_quantity=actual_quantity,
+            status=TaskStatusEnum.COMPLETED,
+            completed_at=datetime.utcnow()
+        )
+        if task:
+            logger.info(f"Обновлено фактическое количество для задания {task_id}: {actual_quantity}")
         return task
     
-    def update_task_actual_quantity(self, task_id: int, actual_quantity: float):
-        """Обновить фактическое количество выполненной продукции"""
-        task = self.get_task_by_id(task_id)
-        if not task:
-            return None
+    def get_daily_summary(self, manager_id: int, date_from=None, date_to=None, group_by=('task_date',)):
+        """Сводка начальника за период из дневных итогов (task_daily_agg)
         
-        task.actual_quantity = actual_quantity
-        task.status = TaskStatusEnum.COMPLETED
-        task.completed_at = datetime.utcnow()
+        Args:
+            manager_id: ID начальника
+            date_from: дата начала периода (date, включительно)
+            date_to: дата окончания периода (date, включительно)
+            group_by: колонки ключа итогов (daily_agg.KEY_COLUMNS), по которым
+                группируется сводка; по умолчанию - по дням
         
+        Returns:
+            строки с колонками group_by, planned_sum, actual_sum и *_count по статусам
+        """
+        unknown = set(group_by) - set(daily_agg.KEY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные колонки группировки: {', '.join(sorted(unknown))}")
+        keys = [getattr(TaskDailyAgg, name) for name in group_by]
+        query = self.db.query(
+            *keys, *(func.sum(getattr(TaskDailyAgg, name)).label(name) for name in daily_agg.VALUE_COLUMNS)
+        ).filter(TaskDailyAgg.manager_id == manager_id)
+        if date_from:
+            query = query.filter(TaskDailyAgg.task_date >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            query = query.filter(TaskDailyAgg.task_date <= datetime.combine(date_to, datetime.max.time()))
+        return query.group_by(*keys).order_by(*keys).all()
+    
+    @retry_on_lock
+    def rebuild_daily_agg(self) -> int:
+        """Пересчитать дневные итоги по tasks и tasks_archive; число строк итогов"""
+        if self.readonly:
+            raise RuntimeError("DatabaseManager(readonly=True) не выполняет запись")
+        rows = daily_agg.rebuild(self.db)
         self.db.commit()
-        self.db.refresh(task)
-        logger.info(f"Обновлено фактическое количество для задания {task_id}: {actual_quantity}")
-        return task
+        return rows
+    
+    # === Outbox ===
+    @retry_on_lock
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: str = None):
+        """Поставить сообщение Telegram в outbox (отправит диспетчер бота)"""
+        message = OutboxMessage(chat_id=chat_id, text=text, parse_mode=parse_mode)
+        self.db.add(message)
+        self._save(message)
+        return message
+    
+    def _due_messages_query(self, now: datetime):
+        return self.db.query(OutboxMessage).filter(
+            OutboxMessage.failed_at.is_(None),
+            OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+    
+    def get_due_messages(self, limit: int):
+        """Сообщения outbox, которые пора отправить (по времени следующей попытки), без захвата"""
+        return self._due_messages_query(datetime.utcnow()).limit(limit).all()
+    
+    @retry_on_lock
+    def claim_due_messages(self, limit: int, lease_seconds: float = OUTBOX_LEASE_SECONDS):
+        """Забрать сообщения outbox, которые пора отправить, для отправки этим процессом
+        
+        Одним UPDATE сообщения переносятся на now + lease_seconds, поэтому
+        диспетчеры других процессов бота их не увидят, пока не выйдет срок
+        (complete_messages удаляет отправленные или назначает следующую попытку).
+        В PostgreSQL строки выбираются с FOR UPDATE SKIP LOCKED, SQLite
+        пропускает только одного писателя.
+        """
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=lease_seconds)
+        due_ids = self._due_messages_query(now).with_entities(OutboxMessage.id).limit(limit) \
+            .with_for_update(skip_locked=True).scalar_subquery()
+        stmt = update(OutboxMessage).where(
+            OutboxMessage.id.in_(due_ids),
+            OutboxMessage.failed_at.is_(None),
+            OutboxMessage.next_attempt_at <= now,
+        ).values(next_attempt_at=lease_until)
+        if self.db.get_bind().dialect.update_returning:
+            messages = self.db.scalars(
+                stmt.returning(OutboxMessage), execution_options={'populate_existing': True}
+            ).all()
+        else:
+            claimed = [message_id for (message_id,) in self._due_messages_query(now)
+                       .with_entities(OutboxMessage.id).limit(limit)]
+            self.db.execute(stmt.where(OutboxMessage.id.in_(claimed)), execution_options={'synchronize_session': False})
+            messages = self.db.query(OutboxMessage).filter(
+                OutboxMessage.id.in_(claimed), OutboxMessage.next_attempt_at == lease_until
+            ).populate_existing().all()
+        self._save()
+        return sorted(messages, key=lambda message: message.id)
+    
+    @retry_on_lock
+    def complete_messages(self, sent_ids: list, failures: list = ()):
+        """Записать итоги отправки пачки outbox одной транзакцией
+        
+        Args:
+            sent_ids: ID отправленных сообщений (удаляются)
+            failures: (ID, ошибка, время следующей попытки или None - больше не отправлять)
+        """
+        if sent_ids:
+            self.db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids)),
+                            execution_options={'synchronize_session': False})
+        for message_id, error, retry_at in failures:
+            values = {'attempts': OutboxMessage.attempts + 1, 'last_error': str(error)[:500]}
+            if retry_at is None:
+                values['failed_at'] = datetime.utcnow()
+            else:
+                values['next_attempt_at'] = retry_at
+            self.db.execute(update(OutboxMessage).where(OutboxMessage.id == message_id).values(**values),
+                            execution_options={'synchronize_session': False})
+        self._save()
+    
+    # === Archive ===
+    def archive_tasks(self, before: datetime = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> tuple:
+        """Перенести завершенные задания с task_date раньше before и их уведомления в архив
+        
+        Каждая пачка из batch_size заданий - отдельная короткая транзакция
+        (INSERT ... SELECT в архив и DELETE), поэтому бот и API не ждут всю архивацию.
+        
+        Args:
+            before: граница (по умолчанию archive_horizon()); позже горизонта нельзя -
+                списки и счетчики добавляют архив только для дат раньше него
+            batch_size: заданий в одной транзакции
+        
+        Returns:
+            (перенесено заданий, перенесено уведомлений)
+        """
+        if self.readonly:
+            raise RuntimeError("DatabaseManager(readonly=True) не выполняет запись")
+        horizon = archive_horizon()
+        if before is not None and before > horizon:
+            raise ValueError(f"Граница архивации {before:%d.%m.%Y} позже горизонта архива {horizon:%d.%m.%Y}")
+        before = before or horizon
+        tasks = notifications = 0
+        while True:
+            moved_tasks, moved_notifications = self._archive_batch(before, batch_size)
+            if not moved_tasks:
+                return tasks, notifications
+            tasks += moved_tasks
+            notifications += moved_notifications
+            logger.info(f"Архивация: перенесено заданий {tasks}, уведомлений {notifications}")
+    
+    @retry_on_lock
+    def _archive_batch(self, before: datetime, batch_size: int) -> tuple:
+        """Одна пачка архивации (одна транзакция)"""
+        ids = self.db.scalars(
+            select(Task.id).where(
+                Task.task_date < before,
+                Task.status.in_(ARCHIVED_STATUSES),
+            ).order_by(Task.id).limit(batch_size)
+        ).all()
+        if not ids:
+            self.db.rollback()
+            return 0, 0
+        
+        task_columns = Task.__table__.columns
+        notification_columns = Notification.__table__.columns
+        self.db.execute(insert(TaskArchive).from_select(
+            [column.name for column in task_columns], select(*task_columns).where(Task.id.in_(ids))
+        ))
+        moved_notifications = self.db.execute(insert(NotificationArchive).from_select(
+            [column.name for column in notification_columns],
+            select(*notification_columns).where(Notification.task_id.in_(ids))
+        )).rowcount
+        self.db.execute(delete(Notification).where(Notification.task_id.in_(ids)),
+                        execution_options={'synchronize_session': False})
+        self.db.execute(delete(Task).where(Task.id.in_(ids)), execution_options={'synchronize_session': False})
+        self.db.commit()
+        return len(ids), moved_notifications
     
     # === Notification operations ===
+    @retry_on_lock
     def create_notification(self, user_id: int, task_id: int, message: str):
         """Создать уведомление"""
         notification = Notification(
@@ -232,11 +1375,27 @@ class DatabaseManager:
             message=message
         )
         self.db.add(notification)
-        self.db.commit()
-        self.db.refresh(notification)
+        self._save(notification)
         logger.info(f"Создано уведомление для пользователя {user_id}")
         return notification
     
+    @retry_on_lock
+    def notify_user(self, user, task_id: int, message: str):
+        """Уведомление пользователю: запись в notifications и сообщение Telegram в outbox
+        
+        Обе строки пишутся в текущей транзакции (в unit of work - вместе с
+        изменением задания); сообщение отправит диспетчер бота.
+        
+        Args:
+            user: пользователь (нужны id и telegram_id)
+        """
+        notification = Notification(user_id=user.id, task_id=task_id, message=message)
+        self.db.add(notification)
+        self.db.add(OutboxMessage(chat_id=user.telegram_id, text=f"🔔 {message}", parse_mode='HTML'))
+        self._save(notification)
+        logger.info(f"Создано уведомление для пользователя {user.id}")
+        return notification
+    
     def get_unread_notifications(self, user_id: int):
         """Получить непрочитанные уведомления пользователя"""
         return self.db.query(Notification).filter(
@@ -244,15 +1403,202 @@ class DatabaseManager:
             Notification.is_read == False
         ).order_by(Notification.created_at.desc()).all()
     
+    @retry_on_lock
     def mark_notification_read(self, notification_id: int):
         """Отметить уведомление как прочитанное"""
         notification = self.db.query(Notification).filter(Notification.id == notification_id).first()
         if notification:
             notification.is_read = True
-            self.db.commit()
+            self._save()
         return notification
 
 
+# === Асинхронный слой (обработчики Telegram-бота) ===
+
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    'sqlite': 'aiosqlite',
+    'postgresql': 'asyncpg',
+}
+
+
+def to_async_url(url: str) -> str:
+    """Преобразовать URL БД в URL с асинхронным драйвером"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет асинхронного драйвера для БД {backend}. Задайте ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_engine():
+    """Асинхронный движок БД (создается при первом обращении, нужен только боту)"""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = ASYNC_DATABASE_URL or to_async_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, echo=False, **engine_options(url))
+        if _async_engine.dialect.name == 'sqlite' and ENGINE_PROFILE['sqlite_pragmas']:
+            event.listen(_async_engine.sync_engine, 'connect', _set_sqlite_pragmas)
+        # Обработчики в основном читают: объекты используются после commit вне
+        # сессии, и сессия обновления фиксируется после каждого менеджера -
+        # атрибуты не сбрасываем, чтобы не перечитывать их запросами
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
+
+def get_async_session():
+    """Новая AsyncSession"""
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+_async_read_sessionmaker = None
+
+
+def get_async_read_session():
+    """Новая AsyncSession только для чтения (движок чтения, см. read_database_url)"""
+    global _async_read_sessionmaker
+    if _async_read_sessionmaker is None:
+        get_async_engine()
+        url = read_database_url()
+        if url:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            async_read_engine = create_async_engine(to_async_url(url), echo=False, **engine_options(url))
+            if async_read_engine.dialect.name == 'sqlite' and ENGINE_PROFILE['sqlite_pragmas']:
+                event.listen(async_read_engine.sync_engine, 'connect', _set_sqlite_read_pragmas)
+            _async_read_sessionmaker = async_sessionmaker(async_read_engine, expire_on_commit=False)
+        else:
+            _async_read_sessionmaker = _async_sessionmaker
+    return _async_read_sessionmaker()
+
+
+# AsyncSession текущего обновления бота (см. update_session_scope)
+_update_session = contextvars.ContextVar('update_session', default=None)
+
+
+@asynccontextmanager
+async def update_session_scope():
+    """Одна AsyncSession на обновление бота
+    
+    Все AsyncDatabaseManager внутри scope используют эту сессию: проверка прав
+    и обработчик берут одно соединение из пула и делят карту идентичности.
+    При выходе сессия закрывается, и ее объекты освобождаются вместе с
+    обновлением. Вложенный scope использует внешнюю сессию.
+    """
+    session = _update_session.get()
+    if session is not None:
+        yield session
+        return
+    session = get_async_session()
+    token = _update_session.set(session)
+    try:
+        yield session
+    finally:
+        _update_session.reset(token)
+        await session.close()
+
+
+class AsyncDatabaseManager:
+    """Асинхронный менеджер БД для обработчиков бота
+
+    Содержит те же методы, что и DatabaseManager, но они awaitable. Каждый метод
+    выполняет синхронную реализацию DatabaseManager через AsyncSession.run_sync,
+    а ввод-вывод идет через асинхронный драйвер (aiosqlite/asyncpg), поэтому
+    запросы не блокируют event loop.
+
+    Ленивая загрузка связей (task.employee и т.п.) работает только внутри
+    run_sync: связи запрашиваются заранее (load= у выборок заданий) или код
+    выполняется через run().
+
+    С unit_of_work=True изменения всех методов фиксируются одним commit():
+    явным (например, перед отправкой сообщений в Telegram) или при выходе из
+    async with без исключения.
+
+    Внутри update_session_scope() менеджер использует сессию обновления и при
+    выходе только завершает свою транзакцию, а закрывает сессию scope.
+    С readonly=True у менеджера всегда своя сессия движка чтения (отчеты).
+    """
+    
+    def __init__(self, unit_of_work: bool = False, readonly: bool = False):
+        scoped = None if readonly else _update_session.get()
+        if scoped is not None:
+            self.session = scoped
+        else:
+            self.session = get_async_read_session() if readonly else get_async_session()
+        self.owns_session = scoped is None
+        self.unit_of_work = unit_of_work
+        self.readonly = readonly
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Транзакция чтения в сессии обновления тоже завершается: следующий
+            # менеджер увидит свежие данные, а SQLite не держит снимок WAL.
+            # Чужой незафиксированный unit of work не трогаем
+            if self.unit_of_work or not (self.owns_session or has_pending_unit_of_work(self.session.sync_session)):
+                if exc_type is None:
+                    await self.session.commit()
+                else:
+                    await self.session.rollback()
+        finally:
+            if self.owns_session:
+                await self.session.close()
+    
+    async def commit(self):
+        """Зафиксировать транзакцию (в режиме unit_of_work - все изменения обработчика)"""
+        await self.session.commit()
+    
+    def _sync_manager(self, sync_session):
+        return DatabaseManager(
+            session=sync_session, retry_on_lock=False, unit_of_work=self.unit_of_work, readonly=self.readonly
+        )
+    
+    async def run(self, fn, *args, **kwargs):
+        """Выполнить fn(db, *args, **kwargs) с синхронным DatabaseManager этой сессии"""
+        return await self.session.run_sync(lambda sync_session: fn(self._sync_manager(sync_session), *args, **kwargs))
+    
+    async def _call(self, name: str, args, kwargs):
+        """Вызвать метод DatabaseManager с повтором при блокировке через asyncio.sleep"""
+        attempt = 0
+        while True:
+            try:
+                return await self.run(lambda db: getattr(db, name)(*args, **kwargs))
+            except DBAPIError as e:
+                # Откат потерял бы изменения предыдущих методов unit of work
+                if not is_lock_error(e) or has_pending_unit_of_work(self.session.sync_session):
+                    raise
+                await self.session.rollback()
+                if attempt >= ENGINE_PROFILE['lock_retries']:
+                    lock_metrics.record_failure()
+                    logger.error(f"{name}: БД заблокирована, повторы исчерпаны ({attempt})")
+                    raise
+                delay = lock_retry_delay(attempt)
+                lock_metrics.record_retry(delay)
+                logger.warning(f"{name}: БД заблокирована, повтор через {delay:.3f} с")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def _async_method(name: str):
+    """Асинхронная обертка метода DatabaseManager с тем же именем и docstring"""
+    @functools.wraps(getattr(DatabaseManager, name))
+    async def method(self, *args, **kwargs):
+        return await self._call(name, args, kwargs)
+    return method
+
+
+for _name, _member in list(vars(DatabaseManager).items()):
+    if callable(_member) and not _name.startswith('_') and _name not in vars(AsyncDatabaseManager):
+        setattr(AsyncDatabaseManager, _name, _async_method(_name))
+
+
 def init_sample_data():
     """Инициализация тестовых данных (для разработки)"""
     db = get_db()
@@ -0,0 +1,177 @@
+"""
+Кэш пользователей бота: telegram_id -> (id, роль, активность)
+
+Каждое обновление бота проверяет права пользователя (role_required), а
+обработчики затем снова ищут его по Telegram ID. Записи кэша живут
+IDENTITY_CACHE_TTL_SECONDS, размер ограничен IDENTITY_CACHE_SIZE (LRU).
+Изменение пользователей (смена роли или деактивация в админ-панели)
+увеличивает счетчик 'users' в cache_versions; процессы сверяют его не чаще
+раза в IDENTITY_CACHE_POLL_SECONDS и при изменении очищают кэш целиком.
+Неизвестные пользователи не кэшируются.
+
+EmployeeDirectoryCache держит по тому же счетчику снимок активных сотрудников
+с префиксным индексом имен - список для выбора сотрудника в боте.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from sqlalchemy import select
+from .models import User, RoleEnum
+from .cache_versions import track_models, get_cache_version
+from .config import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_POLL_SECONDS
+from .prefix_index import PrefixIndex, normalize
+from .utils import logger
+
+# Имя счетчика в cache_versions
+USERS_VERSION_KEY = 'users'
+
+
+@dataclass(frozen=True, slots=True)
+class Identity:
+    """Пользователь в кэше: достаточно для проверки прав и выборок по user.id"""
+    id: int
+    role: RoleEnum
+    is_active: bool
+
+
+class IdentityCache:
+    """LRU-кэш пользователей с временем жизни записей и сверкой версии в БД
+
+    Блокировка защищает только словарь в памяти и не удерживается во время
+    запросов к БД (в боте get() выполняется в event loop через run_sync).
+    """
+
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL_SECONDS,
+                 poll_interval: float = IDENTITY_CACHE_POLL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict()  # telegram_id -> (Identity, истекает)
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self, session, telegram_id: int):
+        """Identity по Telegram ID или None, если пользователь не зарегистрирован"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.poll_interval:
+            self._check_version(session, now)
+
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(telegram_id)
+                return entry[0]
+
+        row = session.execute(
+            select(User.id, User.role, User.is_active).where(User.telegram_id == telegram_id)
+        ).first()
+        with self._lock:
+            if row is None:
+                self._entries.pop(telegram_id, None)
+                return None
+            identity = Identity(row.id, row.role, bool(row.is_active))
+            self._entries[telegram_id] = (identity, now + self.ttl)
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return identity
+
+    def _check_version(self, session, now):
+        """Очистить кэш, если версия пользователей в БД изменилась"""
+        self._checked_at = now
+        try:
+            version = get_cache_version(session, USERS_VERSION_KEY)
+        except Exception:
+            self._checked_at = 0.0
+            raise
+        if version != self._version:
+            with self._lock:
+                self._entries.clear()
+            self._version = version
+
+    def invalidate(self):
+        """Сверить версию при следующем обращении"""
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@dataclass(frozen=True, slots=True)
+class EmployeeRef:
+    """Сотрудник в справочнике сотрудников"""
+    id: int
+    telegram_id: int
+    full_name: str
+
+    @property
+    def display_name(self) -> str:
+        return self.full_name or f"ID: {self.telegram_id}"
+
+
+class EmployeeDirectory:
+    """Неизменяемый снимок активных сотрудников, по алфавиту, с поиском по началу слов имени"""
+
+    def __init__(self, version, employees):
+        self.version = version
+        self.employees = tuple(sorted(employees, key=lambda e: (normalize(e.full_name), e.id)))
+        self._index = PrefixIndex(self.employees, lambda e: (e.full_name,))
+
+    @classmethod
+    def load(cls, session, version):
+        """Загрузить снимок одним запросом"""
+        rows = session.execute(
+            select(User.id, User.telegram_id, User.full_name)
+            .where(User.role == RoleEnum.EMPLOYEE, User.is_active == True)
+        )
+        return cls(version, [EmployeeRef(r.id, r.telegram_id, r.full_name or '') for r in rows])
+
+    def search(self, query: str = ''):
+        """Сотрудники, имя которых подходит под запрос; пустой запрос - все"""
+        return self._index.search(query)
+
+    def __len__(self):
+        return len(self.employees)
+
+
+class EmployeeDirectoryCache:
+    """Снимок сотрудников процесса с проверкой версии 'users' раз в poll_interval секунд
+
+    Как и ReferenceCache, без блокировки вокруг запросов: при одновременном
+    устаревании снимок может загрузиться дважды.
+    """
+
+    def __init__(self, poll_interval: float = IDENTITY_CACHE_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._data = None
+        self._checked_at = 0.0
+
+    def get(self, session) -> EmployeeDirectory:
+        """Снимок сотрудников; при необходимости сверяет версию через session"""
+        data = self._data
+        now = time.monotonic()
+        if data is not None and now - self._checked_at < self.poll_interval:
+            return data
+        self._checked_at = now
+        try:
+            version = get_cache_version(session, USERS_VERSION_KEY)
+            if data is None or data.version != version:
+                data = EmployeeDirectory.load(session, version)
+                self._data = data
+                logger.info(f"Загружен справочник сотрудников (версия {version}): {len(data)}")
+        except Exception:
+            self._checked_at = 0.0
+            raise
+        return data
+
+    def invalidate(self):
+        """Сверить версию при следующем обращении"""
+        self._checked_at = 0.0
+
+
+identity_cache = IdentityCache()
+track_models(USERS_VERSION_KEY, (User,), identity_cache)
+employee_directory_cache = EmployeeDirectoryCache()
+track_models(USERS_VERSION_KEY, (User,), employee_directory_cache)
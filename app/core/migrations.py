@@ -0,0 +1,169 @@
+"""
+Версионные миграции схемы БД
+
+`Base.metadata.create_all` создает только отсутствующие таблицы и не трогает
+уже существующие, поэтому изменения схемы (например, новые индексы) для
+рабочих баз выполняются здесь. Каждая миграция применяется один раз,
+номер версии фиксируется в таблице schema_migrations.
+"""
+from datetime import datetime
+from sqlalchemy import select, func, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.exc import IntegrityError
+from .models import (
+    Base, SchemaMigration, CacheVersion, TaskDailyAgg,
+    Task, TaskArchive, Notification, NotificationArchive,
+)
+from .utils import logger
+from . import daily_agg
+
+
+def _create_indexes(*index_names):
+    """Миграция, создающая индексы, описанные в моделях, если их еще нет"""
+    def migrate(conn):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in index_names:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+                    logger.info(f"Проверен индекс {index.name} на таблице {table.name}")
+    return migrate
+
+
+def _seed_cache_versions(*names):
+    """Миграция, создающая счетчики версий кэшей (таблица cache_versions)"""
+    def migrate(conn):
+        CacheVersion.__table__.create(conn, checkfirst=True)
+        existing = set(conn.execute(select(CacheVersion.name)).scalars())
+        for name in names:
+            if name not in existing:
+                conn.execute(CacheVersion.__table__.insert().values(
+                    name=name,
+                    version=1,
+                    updated_at=datetime.utcnow()
+                ))
+                logger.info(f"Создан счетчик версии кэша {name}")
+    return migrate
+
+
+def _build_daily_agg(conn):
+    """Миграция, заполняющая дневные итоги по уже существующим заданиям"""
+    TaskDailyAgg.__table__.create(conn, checkfirst=True)
+    logger.info(f"Дневные итоги заданий пересчитаны: {daily_agg.rebuild(conn)} строк")
+
+
+def _rebuild_sqlite_autoincrement(conn, table):
+    """Пересоздать таблицу SQLite с AUTOINCREMENT, сохранив строки и индексы"""
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': table.name},
+    ).scalar()
+    if 'AUTOINCREMENT' in (sql or '').upper():
+        return
+    existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+    columns = ', '.join(f'"{column.name}"' for column in table.columns if column.name in existing)
+    rebuilt = table.to_metadata(Base.metadata, name=f'{table.name}_rebuild')
+    try:
+        conn.execute(CreateTable(rebuilt))
+    finally:
+        Base.metadata.remove(rebuilt)
+    conn.exec_driver_sql(
+        f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"'
+    )
+    # Старая таблица удаляется, а не переименовывается: при переименовании
+    # SQLite переписал бы на нее внешние ключи других таблиц
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"')
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    logger.info(f"Таблица {table.name} пересоздана с AUTOINCREMENT")
+
+
+def _monotonic_ids(conn):
+    """Миграция: id заданий и уведомлений не выдаются повторно
+
+    Без AUTOINCREMENT SQLite выдает новой строке max(id) + 1, и после
+    архивации новые задания получили бы id архивных. Счетчик id (sqlite_sequence,
+    последовательность в PostgreSQL) поднимается до наибольшего id вместе с архивом.
+    """
+    for model, archive in ((Task, TaskArchive), (Notification, NotificationArchive)):
+        table = model.__table__
+        last_id = max(
+            conn.execute(select(func.max(model.id))).scalar() or 0,
+            conn.execute(select(func.max(archive.id))).scalar() or 0,
+        )
+        if conn.dialect.name == 'sqlite':
+            _rebuild_sqlite_autoincrement(conn, table)
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': table.name})
+            conn.execute(
+                text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                {'name': table.name, 'seq': last_id},
+            )
+        elif conn.dialect.name == 'postgresql' and last_id:
+            conn.execute(
+                text("SELECT setval(pg_get_serial_sequence(:name, 'id'), :seq)"),
+                {'name': table.name, 'seq': last_id},
+            )
+        logger.info(f"Счетчик id таблицы {table.name}: {last_id}")
+
+
+def _bigint_telegram_ids(conn):
+    """Миграция: users.telegram_id - BIGINT (Telegram ID бывают больше 2^31)
+
+    В SQLite INTEGER и так 64-битный, менять нечего; в PostgreSQL столбец,
+    созданный до перехода модели на BigInteger, расширяется.
+    """
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT'))
+        logger.info("Столбец users.telegram_id расширен до BIGINT")
+
+
+# Список миграций: (версия, название, функция(conn)).
+# Новые миграции добавляются только в конец списка с увеличением версии.
+MIGRATIONS = [
+    (1, 'composite indexes for tasks and notifications', _create_indexes(
+        'ix_tasks_manager_date',
+        'ix_tasks_employee_status_date',
+        'ix_notifications_user_unread',
+    )),
+    (2, 'product_equipment index by equipment', _create_indexes(
+        'ix_product_equipment_equipment_product',
+    )),
+    (3, 'reference data cache version', _seed_cache_versions('reference')),
+    (4, 'identity cache version', _seed_cache_versions('users')),
+    (5, 'daily task aggregates', _build_daily_agg),
+    (6, 'monotonic task and notification ids', _monotonic_ids),
+    (7, 'bigint telegram ids', _bigint_telegram_ids),
+]
+
+
+def get_applied_versions(engine):
+    """Получить множество уже примененных версий миграций"""
+    with engine.connect() as conn:
+        rows = conn.execute(SchemaMigration.__table__.select()).fetchall()
+    return {row.version for row in rows}
+
+
+def run_migrations(engine):
+    """Применить все еще не примененные миграции
+
+    Каждая миграция выполняется в отдельной транзакции вместе с записью
+    своей версии. Если несколько процессов стартуют одновременно, проигравший
+    гонку процесс получит IntegrityError на вставке версии и просто пропустит ее.
+    """
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    applied = get_applied_versions(engine)
+
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=version,
+                    name=name,
+                    applied_at=datetime.utcnow()
+                ))
+            logger.info(f"Применена миграция {version}: {name}")
+        except IntegrityError:
+            logger.info(f"Миграция {version} уже применена другим процессом")
@@ -1,7 +1,7 @@
 """
 Модели данных для базы данных
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Boolean, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Float, Boolean, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -33,7 +33,8 @@ class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False, index=True)
+    # Telegram ID давно вышли за пределы 32 бит (INTEGER в PostgreSQL)
+    telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
     username = Column(String(100))
     full_name = Column(String(200))
     role = Column(Enum(RoleEnum), nullable=False, default=RoleEnum.EMPLOYEE)
@@ -107,6 +108,10 @@ class Product(Base):
 class ProductEquipment(Base):
     """Модель связи продукции и оборудования (многие ко многим)"""
     __tablename__ = 'product_equipment'
+    __table_args__ = (
+        # Выбор продукции для станка: equipment_id -> product_id без чтения таблицы
+        Index('ix_product_equipment_equipment_product', 'equipment_id', 'product_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
@@ -123,6 +128,14 @@ class ProductEquipment(Base):
 class Task(Base):
     """Модель задания"""
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Списки и отчеты начальника: manager_id + диапазон/сортировка по task_date
+        Index('ix_tasks_manager_date', 'manager_id', 'task_date'),
+        # Списки сотрудника: employee_id + status, сортировка по task_date
+        Index('ix_tasks_employee_status_date', 'employee_id', 'status', 'task_date'),
+        # id не выдаются повторно: архивные задания сохраняют свои id
+        {'sqlite_autoincrement': True},
+    )
     
     id = Column(Integer, primary_key=True)
     manager_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -152,6 +165,11 @@ class Task(Base):
 class Notification(Base):
     """Модель уведомлений"""
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Непрочитанные уведомления пользователя, сортировка по created_at
+        Index('ix_notifications_user_unread', 'user_id', 'is_read', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -166,3 +184,134 @@ class Notification(Base):
     
     def __repr__(self):
         return f"<Notification(id={self.id}, user_id={self.user_id}, is_read={self.is_read})>"
+
+
+class OutboxMessage(Base):
+    """Исходящее сообщение Telegram (outbox)
+    
+    Записывается в транзакции изменения (задание, уведомление, смена роли) из
+    бота, API или админ-панели; отправляет диспетчер в процессе бота
+    (app/bot/outbox.py). Отправленные строки удаляются, неотправляемые
+    (пользователь заблокировал бота, исчерпаны попытки) остаются с failed_at.
+    """
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        # Очередь диспетчера: неотправленные по времени следующей попытки
+        Index('ix_outbox_due', 'failed_at', 'next_attempt_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(String(4096), nullable=False)
+    parse_mode = Column(String(20))
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String(500))
+    failed_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, chat_id={self.chat_id}, attempts={self.attempts})>"
+
+
+class TaskArchive(Base):
+    """Архив заданий: завершенные задания старше ARCHIVE_AFTER_DAYS
+    
+    Колонки совпадают с tasks (id сохраняется), строки переносит
+    DatabaseManager.archive_tasks.
+    """
+    __tablename__ = 'tasks_archive'
+    __table_args__ = (
+        Index('ix_tasks_archive_manager_date', 'manager_id', 'task_date'),
+        Index('ix_tasks_archive_employee_status_date', 'employee_id', 'status', 'task_date'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    manager_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    employee_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    equipment_id = Column(Integer, ForeignKey('equipment.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    planned_quantity = Column(Float, nullable=False)
+    actual_quantity = Column(Float, default=0.0)
+    shift = Column(Enum(ShiftEnum), nullable=False)
+    task_date = Column(DateTime, nullable=False)
+    status = Column(Enum(TaskStatusEnum), default=TaskStatusEnum.CREATED)
+    received_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    notes = Column(String(1000))
+    
+    def __repr__(self):
+        return f"<TaskArchive(id={self.id}, status={self.status.value}, planned={self.planned_quantity})>"
+
+
+class NotificationArchive(Base):
+    """Архив уведомлений заданий из tasks_archive"""
+    __tablename__ = 'notifications_archive'
+    __table_args__ = (
+        Index('ix_notifications_archive_task', 'task_id'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    task_id = Column(Integer, ForeignKey('tasks_archive.id'), nullable=False)
+    message = Column(String(500), nullable=False)
+    is_read = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<NotificationArchive(id={self.id}, task_id={self.task_id})>"
+
+
+class TaskDailyAgg(Base):
+    """Дневные итоги заданий: сумма плана и факта, число заданий по статусам
+    
+    Ключ - день задания, смена, начальник, сотрудник, оборудование и продукция.
+    Поддерживается при записи заданий (см. app/core/daily_agg.py), архивация
+    итоги не меняет.
+    """
+    __tablename__ = 'task_daily_agg'
+    __table_args__ = (
+        # Сводки начальника за период
+        Index('ix_task_daily_agg_manager_date', 'manager_id', 'task_date'),
+    )
+    
+    task_date = Column(DateTime, primary_key=True)
+    shift = Column(Enum(ShiftEnum), primary_key=True)
+    manager_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    employee_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    equipment_id = Column(Integer, ForeignKey('equipment.id'), primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    planned_sum = Column(Float, nullable=False, default=0.0)
+    actual_sum = Column(Float, nullable=False, default=0.0)
+    created_count = Column(Integer, nullable=False, default=0)
+    received_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    closed_count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<TaskDailyAgg(task_date={self.task_date}, manager_id={self.manager_id}, planned={self.planned_sum})>"
+
+
+class SchemaMigration(Base):
+    """Примененные версионные миграции схемы (см. app/core/migrations.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, name={self.name})>"
+
+
+class CacheVersion(Base):
+    """Версии кэшей процессов: запись данных увеличивает версию, процессы сбрасывают кэш"""
+    __tablename__ = 'cache_versions'
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CacheVersion(name={self.name}, version={self.version})>"
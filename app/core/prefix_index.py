@@ -0,0 +1,65 @@
+"""
+Префиксный индекс для поиска по названиям в кэшах процесса
+
+Слова названий (и кодов) записей хранятся в отсортированном списке, и
+поиск по началу слова - два bisect по этому списку, без запросов к БД и без
+перебора всех записей. Запрос из нескольких слов находит записи, у которых
+для каждого слова запроса есть слово, начинающееся с него ("ст 2" найдет
+"Станок №2"). Регистр и ё/е не различаются.
+"""
+import re
+from bisect import bisect_left
+
+_WORD = re.compile(r'\w+')
+# Больше любого символа: верхняя граница слов с заданным началом
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(text: str) -> str:
+    """Текст для сравнения: нижний регистр, ё -> е"""
+    return (text or '').lower().replace('ё', 'е')
+
+
+def split_words(text: str) -> list:
+    """Слова текста для индекса и запроса"""
+    return _WORD.findall(normalize(text))
+
+
+class PrefixIndex:
+    """Неизменяемый индекс записей по началу слов
+
+    fields(item) возвращает тексты записи для поиска (название, код).
+    search() возвращает записи в исходном порядке items.
+    """
+
+    def __init__(self, items, fields):
+        self.items = tuple(items)
+        tokens = sorted(
+            (word, position)
+            for position, item in enumerate(self.items)
+            for text in fields(item)
+            for word in split_words(text)
+        )
+        self._words = [word for word, _ in tokens]
+        self._positions = [position for _, position in tokens]
+
+    def _match(self, prefix: str) -> set:
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + _MAX_CHAR, start)
+        return set(self._positions[start:end])
+
+    def search(self, query: str) -> list:
+        """Записи, подходящие под запрос; пустой запрос - все записи"""
+        words = split_words(query)
+        if not words:
+            return list(self.items)
+        positions = None
+        for word in words:
+            matched = self._match(word)
+            positions = matched if positions is None else positions & matched
+            if not positions:
+                return []
+        return [self.items[position] for position in sorted(positions)]
+
+    def __len__(self):
+        return len(self.items)
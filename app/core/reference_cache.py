@@ -0,0 +1,222 @@
+"""
+Кэш справочников: участки, оборудование, продукция и их совместимость
+
+Справочники меняются через админ-панель несколько раз в неделю, а читаются
+в каждом диалоге бота, в API и в формах админ-панели. Каждый процесс держит
+их неизменяемый снимок в памяти (ReferenceData) и не чаще раза в
+REFERENCE_CACHE_POLL_SECONDS сверяет номер версии в таблице cache_versions.
+
+Любая запись справочников через ORM-сессию увеличивает версию в той же
+транзакции (см. cache_versions), поэтому бот, API и админ-панель видят
+изменения не позже чем через интервал опроса, а процесс-писатель - сразу.
+
+Снимок содержит префиксные индексы оборудования и продукции (по словам
+названия и кода) для поиска в боте без запросов к БД.
+"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import select
+from .models import Workshop, Equipment, Product, ProductEquipment
+from .prefix_index import PrefixIndex
+from .cache_versions import track_models, get_cache_version
+from .config import REFERENCE_CACHE_POLL_SECONDS
+from .utils import logger
+
+# Имя счетчика в cache_versions
+REFERENCE_VERSION_KEY = 'reference'
+# Модели, изменение которых сбрасывает кэш
+REFERENCE_MODELS = (Workshop, Equipment, Product, ProductEquipment)
+
+
+@dataclass(frozen=True, slots=True)
+class WorkshopRef:
+    """Участок в кэше справочников"""
+    id: int
+    name: str
+    description: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class EquipmentRef:
+    """Оборудование в кэше справочников"""
+    id: int
+    name: str
+    code: Optional[str]
+    workshop_id: Optional[int]
+    is_active: bool
+    workshop: Optional[WorkshopRef]
+
+
+@dataclass(frozen=True, slots=True)
+class ProductRef:
+    """Продукция в кэше справочников"""
+    id: int
+    name: str
+    code: Optional[str]
+    default_equipment_id: Optional[int]
+    is_active: bool
+    equipment_ids: tuple  # оборудование из product_equipment
+
+
+class ReferenceData:
+    """Неизменяемый снимок справочников с индексами по ID
+
+    Методы повторяют одноименные методы DatabaseManager, но возвращают
+    записи снимка (WorkshopRef, EquipmentRef, ProductRef) без запросов к БД.
+    """
+
+    def __init__(self, version, workshops, equipment, products):
+        self.version = version
+        self.workshops = tuple(workshops)
+        self.equipment = tuple(equipment)
+        self.products = tuple(products)
+        self._workshop_by_id = {w.id: w for w in self.workshops}
+        self._equipment_by_id = {e.id: e for e in self.equipment}
+        self._product_by_id = {p.id: p for p in self.products}
+        self._active_equipment = tuple(e for e in self.equipment if e.is_active)
+        self._active_products = tuple(p for p in self.products if p.is_active)
+        # Совместимость: связи product_equipment плюс оборудование по умолчанию
+        products_by_equipment = {}
+        for product in self._active_products:
+            for equipment_id in sorted(set(product.equipment_ids) | {product.default_equipment_id} - {None}):
+                products_by_equipment.setdefault(equipment_id, []).append(product)
+        self._products_by_equipment = {k: tuple(v) for k, v in products_by_equipment.items()}
+        # Активное оборудование по участкам (None - без участка)
+        equipment_by_workshop = {}
+        for equipment in self._active_equipment:
+            equipment_by_workshop.setdefault(equipment.workshop_id, []).append(equipment)
+        self._equipment_by_workshop = {k: tuple(v) for k, v in equipment_by_workshop.items()}
+        # Поиск по началу слов названия и кода
+        self._equipment_index = PrefixIndex(self._active_equipment, lambda e: (e.name, e.code))
+        self._product_index = PrefixIndex(self._active_products, lambda p: (p.name, p.code))
+
+    @classmethod
+    def load(cls, session, version):
+        """Загрузить снимок четырьмя запросами"""
+        workshops = [
+            WorkshopRef(w.id, w.name, w.description)
+            for w in session.execute(select(Workshop.id, Workshop.name, Workshop.description).order_by(Workshop.id))
+        ]
+        workshop_by_id = {w.id: w for w in workshops}
+        equipment = [
+            EquipmentRef(e.id, e.name, e.code, e.workshop_id, bool(e.is_active), workshop_by_id.get(e.workshop_id))
+            for e in session.execute(select(
+                Equipment.id, Equipment.name, Equipment.code, Equipment.workshop_id, Equipment.is_active
+            ).order_by(Equipment.id))
+        ]
+        links = {}
+        for product_id, equipment_id in session.execute(
+            select(ProductEquipment.product_id, ProductEquipment.equipment_id).order_by(ProductEquipment.id)
+        ):
+            links.setdefault(product_id, []).append(equipment_id)
+        products = [
+            ProductRef(p.id, p.name, p.code, p.default_equipment_id, bool(p.is_active), tuple(links.get(p.id, ())))
+            for p in session.execute(select(
+                Product.id, Product.name, Product.code, Product.default_equipment_id, Product.is_active
+            ).order_by(Product.id))
+        ]
+        return cls(version, workshops, equipment, products)
+
+    def get_all_workshops(self):
+        """Все участки"""
+        return list(self.workshops)
+
+    def get_workshop_by_id(self, workshop_id: int):
+        """Участок по ID"""
+        return self._workshop_by_id.get(workshop_id)
+
+    def get_all_equipment(self, workshop_id: int = None):
+        """Активное оборудование, опционально на участке"""
+        if workshop_id:
+            return list(self._equipment_by_workshop.get(workshop_id, ()))
+        return list(self._active_equipment)
+
+    def get_equipment_groups(self):
+        """Участки с активным оборудованием: [(WorkshopRef или None, число единиц)]
+
+        Участки - в порядке снимка, оборудование без участка (None) - последним.
+        """
+        groups = [(w, len(self._equipment_by_workshop[w.id])) for w in self.workshops
+                  if w.id in self._equipment_by_workshop]
+        if None in self._equipment_by_workshop:
+            groups.append((None, len(self._equipment_by_workshop[None])))
+        return groups
+
+    def search_equipment(self, query: str = '', workshop_id: int = None):
+        """Активное оборудование по началу слов названия или кода
+
+        workshop_id ограничивает участком (0 - оборудование без участка).
+        """
+        found = self._equipment_index.search(query)
+        if workshop_id is not None:
+            found = [e for e in found if (e.workshop_id or 0) == workshop_id]
+        return found
+
+    def get_equipment_by_id(self, equipment_id: int):
+        """Оборудование по ID (в том числе неактивное)"""
+        return self._equipment_by_id.get(equipment_id)
+
+    def get_all_products(self):
+        """Активная продукция"""
+        return list(self._active_products)
+
+    def get_product_by_id(self, product_id: int):
+        """Продукция по ID (в том числе неактивная)"""
+        return self._product_by_id.get(product_id)
+
+    def get_products_for_equipment(self, equipment_id: int):
+        """Активная продукция, доступная для оборудования"""
+        return list(self._products_by_equipment.get(equipment_id, ()))
+
+    def search_products(self, query: str = '', equipment_id: int = None):
+        """Активная продукция по началу слов названия или кода, опционально для оборудования"""
+        if equipment_id is None:
+            return self._product_index.search(query)
+        if not query.strip():
+            return self.get_products_for_equipment(equipment_id)
+        available = {p.id for p in self._products_by_equipment.get(equipment_id, ())}
+        return [p for p in self._product_index.search(query) if p.id in available]
+
+
+class ReferenceCache:
+    """Снимок справочников процесса с проверкой версии раз в poll_interval секунд
+
+    Блокировки вокруг запросов к БД нет намеренно: в боте get() выполняется
+    в event loop (через run_sync), и ожидание блокировки остановило бы loop.
+    При одновременном устаревании снимок может загрузиться дважды - это безопасно.
+    """
+
+    def __init__(self, poll_interval: float = REFERENCE_CACHE_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._data = None
+        self._checked_at = 0.0
+
+    def get(self, session) -> ReferenceData:
+        """Снимок справочников; при необходимости сверяет версию через session"""
+        data = self._data
+        now = time.monotonic()
+        if data is not None and now - self._checked_at < self.poll_interval:
+            return data
+        # Пока идет проверка, остальные вызовы используют текущий снимок
+        self._checked_at = now
+        try:
+            version = get_cache_version(session, REFERENCE_VERSION_KEY)
+            if data is None or data.version != version:
+                data = ReferenceData.load(session, version)
+                self._data = data
+                logger.info(f"Загружены справочники (версия {version}): "
+                            f"{len(data.workshops)} участков, {len(data.equipment)} ед. оборудования, "
+                            f"{len(data.products)} видов продукции")
+        except Exception:
+            self._checked_at = 0.0
+            raise
+        return data
+
+    def invalidate(self):
+        """Сверить версию при следующем обращении"""
+        self._checked_at = 0.0
+
+
+reference_cache = ReferenceCache()
+track_models(REFERENCE_VERSION_KEY, REFERENCE_MODELS, reference_cache)
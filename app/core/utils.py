@@ -505,3 +505,29 @@ def generate_pdf_report(tasks, output_path='reports/report.pdf', title='Отче
     
     logger.info(f"PDF отчет сохранен: {output_path}")
     return output_path
+
+
+def task_report_row(task) -> dict:
+    """
+    Строка отчета по заданию (словарь для generate_csv_report и generate_pdf_report)
+    
+    Словарь не связан с сессией БД и передается в процесс пула отчетов.
+    """
+    return {
+        'id': task.id,
+        'task_date': task.task_date.strftime('%d.%m.%Y') if task.task_date else '',
+        'shift': '1-я' if task.shift.value == 1 else '2-я',
+        'employee': task.employee.full_name if task.employee else f"ID: {task.employee_id}",
+        'equipment': task.equipment.name if task.equipment else f"ID: {task.equipment_id}",
+        'product': task.product.name if task.product else f"ID: {task.product_id}",
+        'planned_quantity': task.planned_quantity,
+        'actual_quantity': task.actual_quantity,
+        'status': task.status.value,
+    }
+
+
+def render_report(format_type, rows, output_path, title='Отчет по заданиям', period_from=None, period_to=None):
+    """Построить отчет 'pdf' или 'csv' по строкам task_report_row; путь к файлу (выполняется в пуле процессов)"""
+    if format_type == 'pdf':
+        return generate_pdf_report(rows, output_path, title=title, period_from=period_from, period_to=period_to)
+    return generate_csv_report(rows, output_path, period_from=period_from, period_to=period_to)
@@ -0,0 +1,48 @@
+"""
+Архивация заданий: завершенные задания старше горизонта переносятся в tasks_archive
+
+Задания со статусом "выполнено" или "закрыто" и датой раньше, чем
+ARCHIVE_AFTER_DAYS дней назад, вместе с уведомлениями переносятся в таблицы
+tasks_archive и notifications_archive пачками по ARCHIVE_BATCH_SIZE (каждая
+пачка - отдельная транзакция). Отчеты и get_tasks_by_* читают архив, когда
+период начинается раньше горизонта.
+
+Запуск (например, раз в сутки из cron):
+    python scripts/archive_tasks.py
+    python scripts/archive_tasks.py --dry-run
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func
+
+from app.core.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from app.core.database import DatabaseManager, init_db, archive_horizon, ARCHIVED_STATUSES
+from app.core.models import Task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='заданий в одной транзакции')
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать задания для переноса')
+    args = parser.parse_args()
+
+    init_db()
+    before = archive_horizon()
+    print(f"Горизонт архива: {before:%d.%m.%Y} ({ARCHIVE_AFTER_DAYS} дн.)")
+    with DatabaseManager() as db:
+        if args.dry_run:
+            count = db.db.query(func.count(Task.id)).filter(
+                Task.task_date < before, Task.status.in_(ARCHIVED_STATUSES)
+            ).scalar()
+            print(f"Заданий для переноса: {count}")
+            return
+        tasks, notifications = db.archive_tasks(before, args.batch_size)
+    print(f"Перенесено в архив: заданий {tasks}, уведомлений {notifications}")
+
+
+if __name__ == '__main__':
+    main()
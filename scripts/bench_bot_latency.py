@@ -0,0 +1,182 @@
+"""
+Бенчмарк задержки обработки обновлений бота: синхронный и асинхронный слой БД
+
+Имитирует N одновременных пользователей. Каждое "обновление" выполняется как
+обработчик бота: поиск пользователя, выборка его заданий, запись уведомления
+и ответ в Telegram (имитируется asyncio.sleep). Параллельно отдельный процесс
+(как API или админ-панель) периодически держит транзакцию записи в той же
+базе. Сравниваются:
+    sync  - DatabaseManager внутри async-обработчика (блокирует event loop)
+    async - AsyncDatabaseManager (запросы через aiosqlite/asyncpg)
+Печатает p50/p95/p99 задержки обновления и максимальную задержку event loop.
+
+Запуск:
+    python scripts/bench_bot_latency.py
+    python scripts/bench_bot_latency.py --users 200 --updates 5 --tasks 20000
+    python scripts/bench_bot_latency.py --lock-hold 0     # без конкурирующего процесса
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+def prepare(db_path, users, tasks):
+    """Создание базы с пользователями и заданиями"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    from sqlalchemy import create_engine, insert
+    from app.core.models import Base, User, Workshop, Equipment, Product, Task, RoleEnum, ShiftEnum, TaskStatusEnum
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    statuses = list(TaskStatusEnum)
+    start = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Workshop), [{'name': 'Участок'}])
+        conn.execute(insert(Equipment), [{'name': 'Станок', 'code': 'EQ-1', 'workshop_id': 1}])
+        conn.execute(insert(Product), [{'name': 'Изделие', 'code': 'PRD-1'}])
+        conn.execute(insert(User), [{'telegram_id': 1, 'full_name': 'Начальник', 'role': RoleEnum.MANAGER}] + [
+            {'telegram_id': 1000 + i, 'full_name': f'Сотрудник {i}', 'role': RoleEnum.EMPLOYEE}
+            for i in range(users)
+        ])
+        conn.execute(insert(Task), [
+            {
+                'manager_id': 1, 'employee_id': 2 + i % users, 'equipment_id': 1, 'product_id': 1,
+                'planned_quantity': 10, 'shift': ShiftEnum.FIRST, 'status': statuses[i % len(statuses)],
+                'task_date': start + timedelta(days=i % 365),
+            }
+            for i in range(tasks)
+        ])
+    engine.dispose()
+
+
+def background_writer(db_path, hold, pause, stop_event):
+    """Процесс-писатель: держит транзакцию записи hold секунд каждые pause секунд"""
+    import sqlite3
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    while not stop_event.is_set():
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("UPDATE tasks SET notes = 'bench' WHERE id = 1")
+        time.sleep(hold)
+        conn.execute('COMMIT')
+        time.sleep(pause)
+    conn.close()
+
+
+async def handle_sync(telegram_id, reply_delay):
+    from app.core.database import DatabaseManager, TaskStatusEnum
+    with DatabaseManager() as db:
+        user = db.get_user_by_telegram_id(telegram_id)
+        tasks = db.get_tasks_by_employee(user.id, TaskStatusEnum.CREATED)
+    await asyncio.sleep(reply_delay)
+    with DatabaseManager() as db:
+        db.create_notification(user.id, 1, f"Заданий: {len(tasks)}")
+
+
+async def handle_async(telegram_id, reply_delay):
+    from app.core.database import AsyncDatabaseManager, TaskStatusEnum
+    async with AsyncDatabaseManager() as db:
+        user = await db.get_user_by_telegram_id(telegram_id)
+        tasks = await db.get_tasks_by_employee(user.id, TaskStatusEnum.CREATED)
+    await asyncio.sleep(reply_delay)
+    async with AsyncDatabaseManager() as db:
+        await db.create_notification(user.id, 1, f"Заданий: {len(tasks)}")
+
+
+async def user_session(handler, telegram_id, updates, args, latencies):
+    for _ in range(updates):
+        # Пауза между сообщениями пользователя
+        await asyncio.sleep(random.uniform(0, args.think))
+        started = time.perf_counter()
+        await handler(telegram_id, args.reply_delay)
+        latencies.append(time.perf_counter() - started)
+
+
+async def loop_lag_monitor(stop, lags, interval=0.01):
+    """Задержка срабатывания таймера event loop относительно ожидаемого"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_mode(mode, args):
+    handler = handle_sync if mode == 'sync' else handle_async
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(stop, lags))
+    random.seed(42)
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        user_session(handler, 1000 + i, args.updates, args, latencies) for i in range(args.users)
+    ])
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+    if mode == 'async':
+        from app.core.database import get_async_engine
+        await get_async_engine().dispose()
+    return latencies, lags, wall
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='одновременных пользователей')
+    parser.add_argument('--updates', type=int, default=5, help='обновлений на пользователя')
+    parser.add_argument('--tasks', type=int, default=20000, help='заданий в базе')
+    parser.add_argument('--think', type=float, default=10.0, help='макс. пауза между сообщениями, с')
+    parser.add_argument('--reply-delay', type=float, default=0.05, help='имитация ответа Telegram, с')
+    parser.add_argument('--lock-hold', type=float, default=0.1, help='сколько другой процесс держит запись, с (0 - без него)')
+    parser.add_argument('--lock-pause', type=float, default=0.3, help='пауза между транзакциями другого процесса, с')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], help='режимы слоя БД')
+    parser.add_argument('--db', default='bench_bot_latency.db', help='путь к файлу базы')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['APP_PROCESS'] = 'bot'
+    os.environ['LOG_LEVEL'] = 'ERROR'
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import logging
+    logging.disable(logging.WARNING)
+
+    print(f"Подготовка базы: {args.users} пользователей, {args.tasks} заданий...")
+    prepare(db_path, args.users, args.tasks)
+
+    for mode in args.modes:
+        writer = None
+        if args.lock_hold > 0:
+            ctx = multiprocessing.get_context('spawn')
+            stop_event = ctx.Event()
+            writer = ctx.Process(target=background_writer, args=(db_path, args.lock_hold, args.lock_pause, stop_event))
+            writer.start()
+        latencies, lags, wall = asyncio.run(run_mode(mode, args))
+        if writer:
+            stop_event.set()
+            writer.join()
+        print(f"\n=== {mode} ===")
+        print(f"обновлений: {len(latencies)} за {wall:.2f} с ({len(latencies) / wall:.1f} в секунду)")
+        print(f"задержка обновления: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+              f"p95 {percentile(latencies, 95) * 1000:.1f} мс, p99 {percentile(latencies, 99) * 1000:.1f} мс, "
+              f"среднее {statistics.mean(latencies) * 1000:.1f} мс")
+        print(f"задержка event loop: p99 {percentile(lags, 99) * 1000:.1f} мс, макс. {max(lags) * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Бенчмарк составных индексов tasks/notifications (scan -> seek)
+
+Создает отдельную SQLite-базу, заполняет ее заданиями и уведомлениями,
+затем выполняет горячие запросы DatabaseManager без индексов и после
+применения миграций. Для каждого запроса печатается план (EXPLAIN QUERY PLAN)
+и среднее время выполнения.
+
+Запуск:
+    python scripts/bench_indexes.py                  # 1 000 000 заданий
+    python scripts/bench_indexes.py --tasks 100000 --db /tmp/bench.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--tasks', type=int, default=1_000_000, help='количество заданий')
+parser.add_argument('--users', type=int, default=200, help='количество сотрудников')
+parser.add_argument('--managers', type=int, default=20, help='количество начальников')
+parser.add_argument('--repeat', type=int, default=20, help='повторов каждого запроса')
+parser.add_argument('--db', default='bench_indexes.db', help='путь к файлу базы')
+args = parser.parse_args()
+
+# Бенчмарк работает с отдельной базой, а не с task_manager.db
+os.environ['DATABASE_URL'] = f'sqlite:///{args.db}'
+
+from sqlalchemy import create_engine, insert, select, text
+from app.core.models import Base, User, Workshop, Equipment, Product, Task, Notification, RoleEnum, ShiftEnum, TaskStatusEnum
+from app.core.migrations import run_migrations
+
+BATCH = 50_000
+START = datetime(2025, 1, 1)
+INDEXES = ['ix_tasks_manager_date', 'ix_tasks_employee_status_date', 'ix_notifications_user_unread']
+
+
+def seed(engine):
+    """Заполнение базы тестовыми данными"""
+    random.seed(42)
+    statuses = list(TaskStatusEnum)
+    with engine.begin() as conn:
+        conn.execute(insert(Workshop), [{'name': 'Участок'}])
+        conn.execute(insert(Equipment), [{'name': f'Станок {i}', 'code': f'EQ-{i}', 'workshop_id': 1} for i in range(50)])
+        conn.execute(insert(Product), [{'name': f'Изделие {i}', 'code': f'PRD-{i}'} for i in range(50)])
+        conn.execute(insert(User), [
+            {'telegram_id': 1000 + i, 'full_name': f'Начальник {i}', 'role': RoleEnum.MANAGER}
+            for i in range(args.managers)
+        ] + [
+            {'telegram_id': 100000 + i, 'full_name': f'Сотрудник {i}', 'role': RoleEnum.EMPLOYEE}
+            for i in range(args.users)
+        ])
+
+    manager_ids = range(1, args.managers + 1)
+    employee_ids = range(args.managers + 1, args.managers + args.users + 1)
+    done = 0
+    while done < args.tasks:
+        size = min(BATCH, args.tasks - done)
+        tasks = []
+        notifications = []
+        for i in range(size):
+            task_id = done + i + 1
+            employee_id = random.choice(employee_ids)
+            tasks.append({
+                'id': task_id,
+                'manager_id': random.choice(manager_ids),
+                'employee_id': employee_id,
+                'equipment_id': random.randint(1, 50),
+                'product_id': random.randint(1, 50),
+                'planned_quantity': 100.0,
+                'shift': random.choice([ShiftEnum.FIRST, ShiftEnum.SECOND]),
+                'task_date': START + timedelta(minutes=task_id // 4),
+                'status': random.choice(statuses),
+            })
+            notifications.append({
+                'user_id': employee_id,
+                'task_id': task_id,
+                'message': 'Новое задание',
+                'is_read': random.random() < 0.95,
+                'created_at': START + timedelta(minutes=task_id // 4),
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Task), tasks)
+            conn.execute(insert(Notification), notifications)
+        done += size
+        print(f"  заполнено {done}/{args.tasks}")
+
+
+def hot_queries():
+    """Горячие запросы в том виде, в котором их строит DatabaseManager"""
+    manager_id = 1
+    employee_id = args.managers + 1
+    # Месячное окно в середине заполненного диапазона дат
+    date_from = START + timedelta(minutes=args.tasks // 8)
+    date_to = date_from + timedelta(days=30)
+    return {
+        'get_tasks_by_manager(период)': select(Task.id).where(
+            Task.manager_id == manager_id, Task.task_date >= date_from, Task.task_date <= date_to
+        ).order_by(Task.task_date.desc()),
+        'get_tasks_by_employee(status)': select(Task.id).where(
+            Task.employee_id == employee_id, Task.status == TaskStatusEnum.CREATED
+        ).order_by(Task.task_date.desc()),
+        'get_unread_notifications': select(Notification.id).where(
+            Notification.user_id == employee_id, Notification.is_read == False
+        ).order_by(Notification.created_at.desc()),
+    }
+
+
+def measure(engine, label):
+    print(f"\n=== {label} ===")
+    results = {}
+    with engine.connect() as conn:
+        for name, query in hot_queries().items():
+            compiled = query.compile(engine, compile_kwargs={'literal_binds': True})
+            plan = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).fetchall()
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = conn.execute(query).fetchall()
+            elapsed = (time.perf_counter() - started) / args.repeat * 1000
+            results[name] = elapsed
+            print(f"{name}: {elapsed:.2f} мс, строк: {len(rows)}")
+            for row in plan:
+                print(f"    {row[-1]}")
+    return results
+
+
+def main():
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine(f'sqlite:///{args.db}')
+    # Создаем таблицы без новых индексов - как в базе, созданной до миграции
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    print(f"Заполнение {args.db}: {args.tasks} заданий...")
+    seed(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    before = measure(engine, "без индексов (full scan)")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    after = measure(engine, "после миграции (index seek)")
+
+    print("\n=== Итог ===")
+    for name in before:
+        print(f"{name}: {before[name]:.2f} мс -> {after[name]:.2f} мс (x{before[name] / max(after[name], 1e-6):.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Бенчмарк задержки обновлений бота во время построения отчетов PDF
+
+Пять руководителей одновременно запрашивают месячный отчет PDF, а остальные
+пользователи в это время продолжают работать с ботом: каждое "обновление" -
+поиск пользователя и выборка его заданий через AsyncDatabaseManager.
+Сравниваются:
+    inline - отчет строится прямо в обработчике (блокирует event loop)
+    pool   - отчет строится в ReportPool (процессы, очередь)
+Печатает время построения отчетов, p50/p95/p99 задержки обновлений других
+пользователей и максимальную задержку event loop.
+
+Запуск:
+    python scripts/bench_report_pool.py
+    python scripts/bench_report_pool.py --reports 5 --tasks-per-report 3000 --workers 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+def prepare(db_path, users, tasks):
+    """Создание базы: руководитель и сотрудники с заданиями за один месяц"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    from sqlalchemy import create_engine, insert
+    from app.core.models import Base, User, Workshop, Equipment, Product, Task, RoleEnum, ShiftEnum, TaskStatusEnum
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    statuses = list(TaskStatusEnum)
+    start = date(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Workshop), [{'name': 'Участок'}])
+        conn.execute(insert(Equipment), [{'name': 'Станок', 'code': 'EQ-1', 'workshop_id': 1}])
+        conn.execute(insert(Product), [{'name': 'Изделие', 'code': 'PRD-1'}])
+        conn.execute(insert(User), [{'telegram_id': 1, 'full_name': 'Начальник', 'role': RoleEnum.MANAGER}] + [
+            {'telegram_id': 1000 + i, 'full_name': f'Сотрудник {i}', 'role': RoleEnum.EMPLOYEE}
+            for i in range(users)
+        ])
+        conn.execute(insert(Task), [
+            {
+                'manager_id': 1, 'employee_id': 2 + i % users, 'equipment_id': 1, 'product_id': 1,
+                'planned_quantity': 10, 'shift': ShiftEnum.FIRST, 'status': statuses[i % len(statuses)],
+                'task_date': start + timedelta(days=i % 31),
+            }
+            for i in range(tasks)
+        ])
+    engine.dispose()
+
+
+def load_rows():
+    """Строки месячного отчета руководителя"""
+    from app.core.database import DatabaseManager
+    from app.core.utils import task_report_row
+    with DatabaseManager(readonly=True) as db:
+        tasks = db.get_tasks_by_manager(1, date_from=date(2026, 1, 1), date_to=date(2026, 1, 31), load='selectin')
+        return [task_report_row(task) for task in tasks]
+
+
+async def handle_update(telegram_id):
+    from app.core.database import AsyncDatabaseManager, TaskStatusEnum
+    async with AsyncDatabaseManager() as db:
+        user = await db.get_identity(telegram_id)
+        await db.get_tasks_by_employee(user.id, TaskStatusEnum.CREATED)
+
+
+async def user_session(telegram_id, think, stop, latencies):
+    while not stop.is_set():
+        delay = random.uniform(0, think)
+        # Задержка считается от момента, когда обновление пришло бы в бот:
+        # пока event loop занят отчетом, ожидание тоже входит в задержку
+        arrived = time.perf_counter() + delay
+        await asyncio.sleep(delay)
+        await handle_update(telegram_id)
+        latencies.append(time.perf_counter() - arrived)
+
+
+async def loop_lag_monitor(stop, lags, interval=0.01):
+    """Задержка срабатывания таймера event loop относительно ожидаемого"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def build_report(mode, pool, rows, output_dir, index, positions):
+    from app.core.utils import render_report
+    output_path = os.path.join(output_dir, f'{mode}_{index}.pdf')
+    started = time.perf_counter()
+    if mode == 'inline':
+        await asyncio.sleep(0)
+        render_report('pdf', rows, output_path, period_from=date(2026, 1, 1), period_to=date(2026, 1, 31))
+    else:
+        async def on_position(position):
+            if position:
+                positions.append(position)
+        await pool.render('pdf', rows, output_path, on_position=on_position,
+                          period_from=date(2026, 1, 1), period_to=date(2026, 1, 31))
+    return time.perf_counter() - started
+
+
+async def run_mode(mode, rows, args, output_dir):
+    from app.bot.report_pool import ReportPool
+    pool = ReportPool(workers=args.workers, queue_max=args.reports)
+    latencies, lags, positions = [], [], []
+    stop = asyncio.Event()
+    random.seed(42)
+    background = [asyncio.create_task(loop_lag_monitor(stop, lags))] + [
+        asyncio.create_task(user_session(1000 + i, args.think, stop, latencies)) for i in range(args.users)
+    ]
+    # Пользователи уже работают, когда запрашиваются отчеты
+    await asyncio.sleep(0.5)
+    started = time.perf_counter()
+    durations = await asyncio.gather(*[
+        build_report(mode, pool, rows, output_dir, i, positions) for i in range(args.reports)
+    ])
+    wall = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*background)
+    pool.shutdown()
+    from app.core.database import get_async_engine
+    await get_async_engine().dispose()
+    return durations, wall, latencies, lags, positions
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=5, help='одновременных отчетов PDF')
+    parser.add_argument('--tasks-per-report', type=int, default=3000, help='заданий в месячном отчете')
+    parser.add_argument('--workers', type=int, default=2, help='процессов в пуле отчетов')
+    parser.add_argument('--users', type=int, default=20, help='других пользователей бота')
+    parser.add_argument('--think', type=float, default=1.0, help='макс. пауза между сообщениями пользователя, с')
+    parser.add_argument('--modes', nargs='+', default=['inline', 'pool'], help='режимы построения отчетов')
+    parser.add_argument('--db', default='bench_report_pool.db', help='путь к файлу базы')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['APP_PROCESS'] = 'bot'
+    os.environ['LOG_LEVEL'] = 'ERROR'
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import logging
+    logging.disable(logging.WARNING)
+
+    print(f"Подготовка базы: {args.users} пользователей, {args.tasks_per_report} заданий за месяц...")
+    prepare(db_path, args.users, args.tasks_per_report)
+    rows = load_rows()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for mode in args.modes:
+            durations, wall, latencies, lags, positions = asyncio.run(run_mode(mode, rows, args, output_dir))
+            print(f"\n=== {mode} ===")
+            print(f"отчетов: {len(durations)} за {wall:.2f} с, "
+                  f"ожидание отчета: среднее {statistics.mean(durations):.2f} с, макс. {max(durations):.2f} с")
+            if positions:
+                print(f"наибольшее место в очереди: {max(positions)}")
+            print(f"обновлений других пользователей: {len(latencies)} "
+                  f"({len(latencies) / wall:.1f} в секунду во время отчетов)")
+            print(f"задержка обновления: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+                  f"p95 {percentile(latencies, 95) * 1000:.1f} мс, p99 {percentile(latencies, 99) * 1000:.1f} мс, "
+                  f"макс. {max(latencies) * 1000:.1f} мс")
+            print(f"задержка event loop: p99 {percentile(lags, 99) * 1000:.1f} мс, макс. {max(lags) * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
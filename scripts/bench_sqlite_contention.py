@@ -0,0 +1,129 @@
+"""
+Бенчмарк конкурентной записи нескольких процессов в один SQLite-файл
+
+Имитирует docker-compose: несколько процессов (бот, API, админ-панель)
+одновременно создают задания и уведомления через DatabaseManager в одной базе.
+Запускается для каждого профиля движка, печатает пропускную способность,
+число ошибок "database is locked" и метрики ожидания блокировок.
+
+Запуск:
+    python scripts/bench_sqlite_contention.py
+    python scripts/bench_sqlite_contention.py --processes 6 --writes 500 --profiles multiprocess
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+def worker(db_path, profile, writes, start_event, results):
+    """Процесс-писатель: создает задания и уведомления, считает ошибки"""
+    # Профиль и база выбираются до импорта app.core (конфиг читается при импорте)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['DATABASE_PROFILE'] = profile
+    os.environ['LOG_LEVEL'] = 'ERROR'
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+    import logging
+    logging.disable(logging.WARNING)
+    from sqlalchemy.exc import OperationalError
+    from app.core.database import DatabaseManager, ShiftEnum, get_lock_metrics
+
+    start_event.wait()
+    ok = 0
+    failed = 0
+    started = time.perf_counter()
+    for _ in range(writes):
+        try:
+            with DatabaseManager() as db:
+                task = db.create_task(
+                    manager_id=1, employee_id=2, equipment_id=1, product_id=1,
+                    planned_quantity=10, shift=ShiftEnum.FIRST, task_date=datetime(2026, 1, 1)
+                )
+                db.create_notification(2, task.id, f"Задание №{task.id}")
+            ok += 1
+        except OperationalError:
+            failed += 1
+    results.put({
+        'ok': ok,
+        'failed': failed,
+        'elapsed': time.perf_counter() - started,
+        'locks': get_lock_metrics(),
+    })
+
+
+def prepare(db_path, profile):
+    """Создание чистой базы со справочниками для бенчмарка"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['DATABASE_PROFILE'] = profile
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from sqlalchemy import create_engine, insert
+    from app.core.models import Base, User, Workshop, Equipment, Product, RoleEnum
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Workshop), [{'name': 'Участок'}])
+        conn.execute(insert(Equipment), [{'name': 'Станок', 'code': 'EQ-1', 'workshop_id': 1}])
+        conn.execute(insert(Product), [{'name': 'Изделие', 'code': 'PRD-1'}])
+        conn.execute(insert(User), [
+            {'telegram_id': 1, 'full_name': 'Начальник', 'role': RoleEnum.MANAGER},
+            {'telegram_id': 2, 'full_name': 'Сотрудник', 'role': RoleEnum.EMPLOYEE},
+        ])
+    engine.dispose()
+
+
+def run(profile, args):
+    db_path = os.path.abspath(args.db)
+    prepare(db_path, profile)
+
+    ctx = multiprocessing.get_context('spawn')
+    start_event = ctx.Event()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(db_path, profile, args.writes, start_event, results))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    # Даем процессам импортировать модули, затем стартуем одновременно
+    time.sleep(2)
+    wall_started = time.perf_counter()
+    start_event.set()
+    collected = [results.get() for _ in processes]
+    wall = time.perf_counter() - wall_started
+    for process in processes:
+        process.join()
+
+    ok = sum(r['ok'] for r in collected)
+    failed = sum(r['failed'] for r in collected)
+    retries = sum(r['locks']['retries'] for r in collected)
+    wait_total = sum(r['locks']['wait_seconds_total'] for r in collected)
+    wait_max = max(r['locks']['wait_seconds_max'] for r in collected)
+    print(f"\n=== профиль: {profile} ===")
+    print(f"процессов: {args.processes}, операций на процесс: {args.writes}")
+    print(f"успешно: {ok}, ошибок 'database is locked': {failed}")
+    print(f"пропускная способность: {ok / wall:.1f} операций/с (время {wall:.2f} с)")
+    print(f"повторов после блокировки: {retries}, ожидание в backoff: {wait_total:.3f} с (макс. {wait_max:.3f} с)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=3, help='количество процессов-писателей')
+    parser.add_argument('--writes', type=int, default=300, help='операций на процесс')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'multiprocess'], help='профили движка')
+    parser.add_argument('--db', default='bench_contention.db', help='путь к файлу базы')
+    args = parser.parse_args()
+    for profile in args.profiles:
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
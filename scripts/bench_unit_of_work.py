@@ -0,0 +1,130 @@
+"""
+Бенчмарк unit of work: commit в каждом методе против одной транзакции на операцию
+
+Создает отдельную SQLite-базу с профилем multiprocess и выполняет бизнес-операции
+бота так же, как обработчики: создание задания с уведомлением сотруднику,
+подтверждение получения и отчет (каждое - с уведомлением начальнику).
+Для каждого режима DatabaseManager печатается число commit на операцию
+(событие commit движка) и пропускная способность записи.
+
+Запуск:
+    python scripts/bench_unit_of_work.py
+    python scripts/bench_unit_of_work.py --tasks 2000 --synchronous FULL
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--tasks', type=int, default=1000, help='заданий (операций каждого вида) на режим')
+parser.add_argument('--synchronous', default=None, help='PRAGMA synchronous (по умолчанию - из профиля, NORMAL)')
+parser.add_argument('--db', default=None, help='путь к файлу базы (по умолчанию - во временном каталоге)')
+args = parser.parse_args()
+
+# Бенчмарк работает с отдельной базой, а не с task_manager.db
+db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_uow_'), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+os.environ['DATABASE_PROFILE'] = 'multiprocess'
+os.environ['LOG_LEVEL'] = 'ERROR'
+if args.synchronous:
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+
+import logging
+logging.disable(logging.WARNING)
+
+from sqlalchemy import event, insert
+from app.core.database import DatabaseManager, engine, init_db, ENGINE_PROFILE
+from app.core.models import User, Workshop, Equipment, Product, RoleEnum, ShiftEnum, TaskStatusEnum
+
+
+class CommitCounter:
+    """Число commit на соединениях движка"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_commit(self, conn):
+        self.count += 1
+
+
+def seed():
+    """Справочники и пользователи для заданий"""
+    with engine.begin() as conn:
+        conn.execute(insert(Workshop), [{'id': 1, 'name': 'Участок'}])
+        conn.execute(insert(Equipment), [{'id': 1, 'name': 'Станок', 'code': 'EQ-1', 'workshop_id': 1}])
+        conn.execute(insert(Product), [{'id': 1, 'name': 'Изделие', 'code': 'PRD-1', 'default_equipment_id': 1}])
+        conn.execute(insert(User), [
+            {'id': 1, 'telegram_id': 1, 'full_name': 'Начальник', 'role': RoleEnum.MANAGER},
+            {'id': 2, 'telegram_id': 2, 'full_name': 'Сотрудник', 'role': RoleEnum.EMPLOYEE},
+        ])
+
+
+def create_task(db):
+    task = db.create_task(
+        manager_id=1, employee_id=2, equipment_id=1, product_id=1, planned_quantity=100,
+        shift=ShiftEnum.FIRST, task_date=datetime.combine(datetime.now().date(), datetime.min.time())
+    )
+    db.create_notification(2, task.id, f"Вам назначено новое задание №{task.id}")
+    return task.id
+
+
+def confirm_task(db, task_id):
+    task = db.update_task_status(task_id, TaskStatusEnum.RECEIVED, expected_status=TaskStatusEnum.CREATED)
+    db.create_notification(1, task.id, f"Сотрудник подтвердил получение задания №{task.id}")
+
+
+def report_task(db, task_id):
+    task = db.update_task_actual_quantity(task_id, 95, expected_status=TaskStatusEnum.RECEIVED)
+    db.create_notification(1, task.id, f"Сотрудник отчитался по заданию №{task.id}")
+
+
+def run(unit_of_work: bool, counter: CommitCounter):
+    """Выполнить все операции в режиме; {операция: (commit на операцию, операций/с)}"""
+    results = {}
+    task_ids = []
+    operations = [
+        ('создание задания', lambda db, i: task_ids.append(create_task(db))),
+        ('подтверждение', lambda db, i: confirm_task(db, task_ids[i])),
+        ('отчет', lambda db, i: report_task(db, task_ids[i])),
+    ]
+    for name, operation in operations:
+        counter.count = 0
+        started = time.perf_counter()
+        for i in range(args.tasks):
+            with DatabaseManager(unit_of_work=unit_of_work) as db:
+                operation(db, i)
+        elapsed = time.perf_counter() - started
+        results[name] = (counter.count / args.tasks, args.tasks / elapsed)
+    return results
+
+
+def main():
+    init_db()
+    seed()
+    counter = CommitCounter()
+    pragmas = ENGINE_PROFILE['sqlite_pragmas']
+    print(f"База: {db_path} (journal_mode={pragmas.get('journal_mode')}, synchronous={pragmas.get('synchronous')})")
+    print(f"Операций каждого вида: {args.tasks}\n")
+
+    modes = {'commit в каждом методе': False, 'unit of work': True}
+    results = {mode: run(unit_of_work, counter) for mode, unit_of_work in modes.items()}
+
+    print(f"{'операция':<18} {'режим':<24} {'commit/оп':>10} {'оп/с':>10}")
+    for operation in results['unit of work']:
+        for mode in modes:
+            commits, throughput = results[mode][operation]
+            print(f"{operation:<18} {mode:<24} {commits:>10.2f} {throughput:>10.0f}")
+        before = results['commit в каждом методе'][operation][1]
+        after = results['unit of work'][operation][1]
+        print(f"{'':<18} {'ускорение':<24} {'':>10} {after / before:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
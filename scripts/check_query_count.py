@@ -0,0 +1,183 @@
+"""
+Проверка числа SQL-запросов в списках заданий и отчетах
+
+Заполняет временную базу заданиями (мало и много), выбирает их через
+get_tasks_by_manager / get_tasks_by_employee с каждой стратегией загрузки
+связей, обращается к сотруднику, оборудованию и продукции каждого задания
+и строит CSV-отчет. Списки и отчеты бота и API загружают связи через joined -
+всегда один запрос, и это число не должно зависеть от количества заданий.
+selectin не постоянен: один запрос на связь на каждые 500 заданий (размер
+пакета IN в SQLAlchemy), до 1 + 3 * ceil(n / 500) (одинаковые связанные
+записи запрашиваются один раз) - проверяется эта граница, а число печатается как рост. Для сравнения печатается число запросов при ленивой загрузке (N+1).
+Повторная проверка пользователя по Telegram ID (get_identity), справочники
+(get_reference_data) и справочник сотрудников (get_employee_directory) вместе
+с поиском и страницами выбора в боте не должны обращаться к БД совсем. Переход статуса
+задания в SQLite - две команды (INSERT ... ON CONFLICT с изменением дневных итогов и
+UPDATE ... RETURNING), в PostgreSQL - одна команда с CTE (проверяется ее SQL).
+
+Запуск:
+    python scripts/check_query_count.py
+    python scripts/check_query_count.py --small 10 --large 5000
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# Размер пакета первичных ключей в запросе selectinload
+SELECTIN_BATCH = 500
+
+
+def check(condition, message):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+class QueryCounter:
+    """Счетчик запросов к движку через событие before_cursor_execute"""
+
+    def __init__(self, engine):
+        self.count = 0
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def seed(engine, tasks):
+    """Пересоздать задания: tasks штук на разных сотрудниках, оборудовании и продукции"""
+    from sqlalchemy import delete, insert
+    from app.core.models import Task, User, Workshop, Equipment, Product, RoleEnum, ShiftEnum
+    with engine.begin() as conn:
+        for model in (Task, User, Equipment, Product, Workshop):
+            conn.execute(delete(model))
+        conn.execute(insert(Workshop), [{'id': 1, 'name': 'Участок'}])
+        # Связанных объектов столько же, сколько заданий: лениво каждая связь - отдельный запрос
+        conn.execute(insert(User), [{'id': 1, 'telegram_id': 1, 'full_name': 'Начальник', 'role': RoleEnum.MANAGER}] + [
+            {'id': 2 + i, 'telegram_id': 2 + i, 'full_name': f'Сотрудник {i}', 'role': RoleEnum.EMPLOYEE}
+            for i in range(tasks)
+        ])
+        conn.execute(insert(Equipment), [
+            {'id': 1 + i, 'name': f'Станок {i}', 'code': f'EQ-{i}', 'workshop_id': 1} for i in range(tasks)
+        ])
+        conn.execute(insert(Product), [{'id': 1 + i, 'name': f'Изделие {i}', 'code': f'PRD-{i}'} for i in range(tasks)])
+        conn.execute(insert(Task), [
+            {
+                # Половина заданий у сотрудника 2 (выборка сотрудника), остальные - у разных сотрудников
+                'manager_id': 1, 'employee_id': 2 if i % 2 == 0 else 2 + i, 'equipment_id': 1 + i, 'product_id': 1 + i,
+                'planned_quantity': 10, 'shift': ShiftEnum.FIRST,
+                'task_date': datetime(2026, 1, 1) + timedelta(days=i % 28),
+            }
+            for i in range(tasks)
+        ])
+
+
+def count_queries(counter, fetch, report_dir):
+    """Число запросов на выборку, обход связей и построение CSV-отчета"""
+    from app.core.database import DatabaseManager
+    from app.core.utils import generate_csv_report
+    with DatabaseManager() as db:
+        counter.count = 0
+        tasks = fetch(db)
+        for task in tasks:
+            task.employee.full_name, task.equipment.name, task.product.name
+        generate_csv_report(tasks, os.path.join(report_dir, 'report.csv'))
+        return counter.count, len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small', type=int, default=10, help='заданий в малом наборе')
+    parser.add_argument('--large', type=int, default=1000, help='заданий в большом наборе')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='check_query_count_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'check.db')}"
+    os.environ['LOG_LEVEL'] = 'ERROR'
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import logging
+    logging.disable(logging.WARNING)
+    from app.core.database import engine, init_db, TASK_LOAD_STRATEGIES, TASK_RELATIONS
+
+    init_db()
+    counter = QueryCounter(engine)
+    fetchers = {
+        'get_tasks_by_manager': lambda load: (lambda db: db.get_tasks_by_manager(1, load=load)),
+        'get_tasks_by_employee': lambda load: (lambda db: db.get_tasks_by_employee(2, load=load)),
+    }
+
+    results = {}
+    for size in (args.small, args.large):
+        seed(engine, size)
+        for name, fetcher in fetchers.items():
+            for load in (None, *TASK_LOAD_STRATEGIES):
+                results[name, load, size] = count_queries(counter, fetcher(load), workdir)
+
+    for name in fetchers:
+        (lazy_small, small_rows), (lazy_large, large_rows) = results[name, None, args.small], results[name, None, args.large]
+        print(f"\n{name}: лениво {lazy_small} запросов на {small_rows} заданий, {lazy_large} на {large_rows}")
+        (small, small_rows), (large, large_rows) = results[name, 'joined', args.small], results[name, 'joined', args.large]
+        check(small_rows < large_rows and small == large == 1,
+              f"load='joined' (списки и отчеты): {small} запрос на {small_rows} заданий, {large} на {large_rows}")
+        (small, small_rows), (large, large_rows) = results[name, 'selectin', args.small], results[name, 'selectin', args.large]
+        expected = lambda rows: 1 + len(TASK_RELATIONS) * math.ceil(rows / SELECTIN_BATCH)
+        check(small <= expected(small_rows) and large <= expected(large_rows),
+              f"load='selectin' растет с числом заданий (до 1 + {len(TASK_RELATIONS)} * ceil(n / {SELECTIN_BATCH})): "
+              f"{small} запросов на {small_rows} заданий, {large} на {large_rows}")
+
+    print()
+    from app.core.database import DatabaseManager
+    with DatabaseManager() as db:
+        db.get_identity(1), db.get_reference_data()
+        counter.count = 0
+        for _ in range(100):
+            identity = db.get_identity(1)
+            db.get_reference_data().get_all_equipment()
+        check(identity is not None and counter.count == 0,
+              f"get_identity и get_reference_data из кэша: {counter.count} запросов на 100 вызовов")
+
+        from app.bot.picker import picker_keyboard
+        db.get_employee_directory()
+        counter.count = 0
+        for page in range(100):
+            refs = db.get_reference_data()
+            employees = db.get_employee_directory().search('сотр 1')
+            equipment = refs.search_equipment('ст 1')
+            picker_keyboard('emp', [(e.id, e.display_name) for e in employees], page)
+        check(employees and equipment and counter.count == 0,
+              f"поиск и страницы выбора сотрудника и оборудования: {counter.count} запросов на 100 страниц")
+
+        from app.core.models import TaskStatusEnum
+        task_id = db.get_tasks_by_employee(2)[0].id
+        counter.count = 0
+        task = db.update_task_status(task_id, TaskStatusEnum.RECEIVED, expected_status=TaskStatusEnum.CREATED)
+        received = counter.count
+        counter.count = 0
+        repeated = db.update_task_status(task_id, TaskStatusEnum.RECEIVED, expected_status=TaskStatusEnum.CREATED)
+        # INSERT ... ON CONFLICT с изменением дневных итогов и UPDATE задания; отклоненный
+        # переход выполняет те же две команды, которые ничего не меняют
+        check(task is not None and repeated is None and received == 2 and counter.count == 2,
+              f"переход статуса: {received} запроса, повторный переход отклонен за {counter.count}")
+
+        from sqlalchemy import select
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.orm import aliased
+        from app.core import daily_agg
+        from app.core.models import Task
+        new, agg = daily_agg.transition_ctes({'status': TaskStatusEnum.RECEIVED}, Task.id == task_id)
+        sql = str(select(aliased(Task, new)).add_cte(agg).compile(dialect=postgresql.dialect()))
+        check(all(part in sql for part in ('FOR UPDATE', 'UPDATE tasks', 'INSERT INTO task_daily_agg')),
+              "переход статуса в PostgreSQL: UPDATE и дневные итоги одной командой")
+
+    print("\nГотово: нет N+1 запросов к связям заданий")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Локальная замена Bot API для проверки бота без сети
+
+HTTP-сервер отвечает на запросы /bot<token>/<метод> так, как Bot API:
+getMe, setWebhook, deleteWebhook, getWebhookInfo, getUpdates (пустой ответ),
+sendMessage, editMessageText, sendDocument, answerCallbackQuery и другие
+(для остальных методов - true). Запросы считаются по методам, параметры
+setWebhook (адрес и секрет) запоминаются. --delay задает задержку ответа, как
+у настоящего Bot API.
+
+Бот направляется на сервер переменной TELEGRAM_API_URL. Нагрузочная проверка
+вебхука - scripts/load_webhook.py.
+
+Запуск:
+    python scripts/fake_bot_api.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=1:fake python -m app.bot.bot
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+
+class FakeBotAPI:
+    """Сервер Bot API в фоновом потоке"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0):
+        self.delay = delay
+        self.calls = Counter()
+        self.webhook = {}
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.server = _Server((host, port), _Handler)
+        self.server.api = self
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, *methods) -> int:
+        with self._lock:
+            return sum(self.calls[method] for method in methods)
+
+    def handle(self, method: str, params: dict):
+        """Результат метода Bot API"""
+        with self._lock:
+            self.calls[method] += 1
+            self._message_id += 1
+            message_id = self._message_id
+        if self.delay:
+            time.sleep(self.delay)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            self.webhook = params
+            return True
+        if method == 'getWebhookInfo':
+            return {'url': self.webhook.get('url', ''), 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getUpdates':
+            # Как long polling без обновлений, но без долгого ожидания
+            time.sleep(min(float(params.get('timeout') or 0), 1.0))
+            return []
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            chat_id = int(params.get('chat_id') or 0)
+            return {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text') or params.get('caption') or '',
+            }
+        return True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение (например, бот остановлен во время getUpdates)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _params(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        # multipart (sendDocument): параметры ответу не нужны
+        return {}
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        result = self.server.api.handle(parts[1], self._params())
+        self._reply(200, {'ok': True, 'result': result})
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='адрес сервера')
+    parser.add_argument('--port', type=int, default=8081, help='порт сервера')
+    parser.add_argument('--delay', type=float, default=0.0, help='задержка ответа Bot API, с')
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.host, args.port, args.delay).start()
+    print(f"Bot API: {api.url} (TELEGRAM_API_URL={api.url}), Ctrl+C - остановка")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"запросов: {dict(api.calls)}")
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Нагрузочная проверка бота в режиме webhook без сети
+
+Запускает локальный Bot API (scripts/fake_bot_api.py) и бот отдельным
+процессом (python -m app.bot.bot, BOT_MODE=webhook) с отдельной SQLite-базой,
+затем отправляет на вебхук обновления от сотрудников (/start и уведомления),
+как Telegram. Проверяется:
+    - бот регистрирует вебхук с секретом (setWebhook);
+    - запросы без секрета и с неверным секретом отклоняются (403);
+    - все обновления приняты (200) и обработаны (бот ответил на каждое).
+Печатает время ответа вебхука и число принятых и обработанных обновлений в
+секунду. Лимиты частоты Telegram в прогоне отключены. С несколькими значениями
+--concurrent-updates бот запускается для каждого (BOT_CONCURRENT_UPDATES), и
+печатается, как пропускная способность растет с числом одновременных
+обновлений; --api-delay задает время ответа Bot API, как у настоящего Telegram.
+
+Запуск:
+    python scripts/load_webhook.py
+    python scripts/load_webhook.py --updates 5000 --concurrency 40 --queue-size 100
+    python scripts/load_webhook.py --updates 500 --api-delay 0.1 --concurrent-updates 1 4 8
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from fake_bot_api import FakeBotAPI
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SECRET = 'load-test-secret'
+EMPLOYEE_TELEGRAM_ID = 9_100_000_000
+
+
+def check(condition, message):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(employees):
+    """Начальник и сотрудники с заданиями (в базе из DATABASE_URL)"""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from app.core.database import DatabaseManager, init_db, init_sample_data, RoleEnum, ShiftEnum
+    init_db()
+    init_sample_data()
+    with DatabaseManager() as db:
+        manager = db.create_user(9_000_000_000, 'manager', 'Начальник', RoleEnum.MANAGER)
+        refs = db.get_reference_data()
+        equipment = refs.get_all_equipment()[0]
+        product = refs.get_products_for_equipment(equipment.id)[0]
+        rows = []
+        for i in range(employees):
+            employee = db.create_user(EMPLOYEE_TELEGRAM_ID + i, f'employee{i}', f'Сотрудник {i}', RoleEnum.EMPLOYEE)
+            rows += [
+                {'employee_id': employee.id, 'equipment_id': equipment.id, 'product_id': product.id,
+                 'planned_quantity': 10 + n, 'shift': ShiftEnum.FIRST, 'task_date': datetime(2026, 1, 1 + n)}
+                for n in range(5)
+            ]
+        # Без сообщений в outbox: ответы бота считаются по sendMessage
+        db.create_tasks_bulk(manager.id, rows, notify=False)
+
+
+def make_update(update_id, telegram_id, text):
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'User'}
+    message = {
+        'message_id': update_id, 'date': int(time.time()),
+        'chat': {'id': telegram_id, 'type': 'private'}, 'from': user, 'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def post_updates(url, args):
+    """Отправить обновления с --concurrency одновременными соединениями; времена ответа"""
+    queue = asyncio.Queue()
+    for update_id in range(1, args.updates + 1):
+        telegram_id = EMPLOYEE_TELEGRAM_ID + update_id % args.employees
+        text = '🔔 Уведомления' if update_id % 2 else '/start'
+        queue.put_nowait(make_update(update_id, telegram_id, text))
+    latencies, statuses = [], []
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+
+    async def worker(client):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(url, json=update, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(response.status_code)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    return latencies, statuses
+
+
+def wait_for(condition, timeout, interval=0.1) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def run_bot(args, api, env, workdir, concurrent):
+    """Прогон обновлений через бот с BOT_CONCURRENT_UPDATES=concurrent; итоги прогона"""
+    port = free_port()
+    webhook_url = f"http://127.0.0.1:{port}/telegram"
+    env = dict(
+        env,
+        TELEGRAM_BOT_TOKEN='123456:load-test',
+        TELEGRAM_API_URL=api.url,
+        BOT_MODE='webhook',
+        BOT_WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        BOT_WEBHOOK_LISTEN='127.0.0.1',
+        BOT_WEBHOOK_PORT=str(port),
+        BOT_WEBHOOK_PATH='telegram',
+        BOT_WEBHOOK_SECRET=SECRET,
+        BOT_UPDATE_QUEUE_SIZE=str(args.queue_size),
+        BOT_CONCURRENT_UPDATES=str(concurrent),
+        # Прогон измеряет вебхук и обработку, а не лимиты Telegram
+        TELEGRAM_GLOBAL_RATE='1000000', TELEGRAM_CHAT_RATE='1000000', TELEGRAM_CHAT_BURST='1000000',
+    )
+    api.webhook = {}
+    # Вывод бота - в файл, чтобы не смешивался с отчетом прогона
+    bot_log_path = os.path.join(workdir, f'bot_{concurrent}.log')
+    bot_log = open(bot_log_path, 'w')
+    bot = subprocess.Popen([sys.executable, '-m', 'app.bot.bot'], cwd=PROJECT_ROOT, env=env,
+                           stdout=bot_log, stderr=subprocess.STDOUT)
+    print(f"\n=== BOT_CONCURRENT_UPDATES={concurrent} (вывод бота: {bot_log_path}) ===")
+    try:
+        check(wait_for(lambda: api.webhook, 30), "бот зарегистрировал вебхук (setWebhook)")
+        check(api.webhook.get('url') == webhook_url and api.webhook.get('secret_token') == SECRET,
+              "адрес и секрет вебхука переданы в setWebhook")
+        check(wait_for(lambda: httpx.get(f"http://127.0.0.1:{port}/").status_code > 0, 10), "вебхук принимает соединения")
+
+        probe = make_update(0, EMPLOYEE_TELEGRAM_ID, '🔔 Уведомления')
+        no_secret = httpx.post(webhook_url, json=probe)
+        wrong_secret = httpx.post(webhook_url, json=probe, headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+        check(no_secret.status_code == 403 and wrong_secret.status_code == 403,
+              "запросы без секрета и с неверным секретом отклонены (403)")
+
+        replies_before = api.count('sendMessage')
+        started = time.perf_counter()
+        latencies, statuses = asyncio.run(post_updates(webhook_url, args))
+        accepted = time.perf_counter() - started
+        check(statuses.count(200) == args.updates, f"вебхук принял все обновления ({statuses.count(200)}/{args.updates})")
+        processed = wait_for(lambda: api.count('sendMessage') - replies_before >= args.updates, 300)
+        done = time.perf_counter() - started
+        check(processed, f"бот ответил на все обновления ({api.count('sendMessage') - replies_before}/{args.updates})")
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            bot.wait(30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        bot_log.close()
+
+    print(f"ответ вебхука: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} мс, p99 {percentile(latencies, 99) * 1000:.1f} мс")
+    print(f"принято: {args.updates / accepted:.0f} обновлений в секунду, "
+          f"обработано: {args.updates / done:.0f} обновлений в секунду")
+    return args.updates / done, percentile(latencies, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000, help='число обновлений')
+    parser.add_argument('--employees', type=int, default=200, help='число сотрудников (разных чатов)')
+    parser.add_argument('--concurrency', type=int, default=20, help='одновременных запросов к вебхуку')
+    parser.add_argument('--queue-size', type=int, default=0, help='BOT_UPDATE_QUEUE_SIZE бота (0 - без ограничения)')
+    parser.add_argument('--concurrent-updates', type=int, nargs='+', default=[8],
+                        help='значения BOT_CONCURRENT_UPDATES бота, прогон для каждого')
+    parser.add_argument('--api-delay', type=float, default=0.0, help='задержка ответа Bot API, с')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load_webhook_')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bot.db')}",
+        BOT_STATE_DB=os.path.join(workdir, 'bot_state.db'),
+        LOG_LEVEL='WARNING',
+    )
+    os.environ.update(env)
+    import logging
+    logging.disable(logging.WARNING)
+    print(f"База: {env['DATABASE_URL']}, сотрудников: {args.employees}")
+    seed(args.employees)
+
+    api = FakeBotAPI(delay=args.api_delay).start()
+    results = {}
+    try:
+        for concurrent in args.concurrent_updates:
+            results[concurrent] = run_bot(args, api, env, workdir, concurrent)
+    finally:
+        api.stop()
+
+    print(f"\nобновлений: {args.updates}, одновременных запросов: {args.concurrency}, "
+          f"очередь бота: {args.queue_size or 'без ограничения'}, задержка Bot API: {args.api_delay * 1000:.0f} мс")
+    print(f"{'BOT_CONCURRENT_UPDATES':>22} {'обработано/с':>13} {'p50 вебхука, мс':>16}")
+    for concurrent, (throughput, p50) in results.items():
+        print(f"{concurrent:>22} {throughput:>13.0f} {p50 * 1000:>16.1f}")
+    print(f"запросов к Bot API: {dict(api.calls)}")
+
+
+if __name__ == '__main__':
+    main()
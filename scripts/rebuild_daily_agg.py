@@ -0,0 +1,41 @@
+"""
+Пересчет дневных итогов заданий (таблица task_daily_agg)
+
+Итоги обновляются при каждой записи задания; пересчет нужен после ручных
+правок таблицы tasks или восстановления из резервной копии. С --check
+итоги только сверяются с заданиями (tasks и tasks_archive) без записи.
+
+Запуск:
+    python scripts/rebuild_daily_agg.py
+    python scripts/rebuild_daily_agg.py --check
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core import daily_agg
+from app.core.database import DatabaseManager, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='только сверить итоги с заданиями')
+    args = parser.parse_args()
+
+    init_db()
+    with DatabaseManager() as db:
+        if args.check:
+            wrong = daily_agg.mismatches(db.db)
+            if wrong:
+                print(f"❌ Итоги расходятся с заданиями: {len(wrong)} строк")
+                sys.exit(1)
+            print("✅ Итоги совпадают с заданиями")
+            return
+        rows = db.rebuild_daily_agg()
+    print(f"Дневные итоги пересчитаны: {rows} строк")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Нагрузочный прогон бота: память процесса на длинной серии обновлений
+
+Создает отдельную SQLite-базу с начальником, сотрудниками и заданиями и
+прогоняет через Application с обработчиками бота (без сети: методы Bot API
+ничего не отправляют) серию обновлений, как от пользователей: списки заданий
+начальника и сотрудников, уведомления, /start. Каждое обновление проходит
+через процессор обновлений так же, как при run_polling.
+
+Печатается RSS процесса и число живых сессий SQLAlchemy; проверка требует,
+чтобы после прогрева RSS не рос больше --max-growth-mb, а сессий обновлений
+не оставалось.
+
+Запуск:
+    python scripts/soak_bot_sessions.py
+    python scripts/soak_bot_sessions.py --updates 10000 --processor simple
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--updates', type=int, default=100_000, help='число обновлений')
+parser.add_argument('--employees', type=int, default=50, help='число сотрудников')
+parser.add_argument('--processor', choices=['session', 'simple'], default='session',
+                    help='session - SessionUpdateProcessor бота, simple - без сессии на обновление (для сравнения)')
+parser.add_argument('--max-growth-mb', type=float, default=5.0, help='допустимый рост RSS после прогрева, МБ')
+parser.add_argument('--db', default=None, help='путь к файлу базы (по умолчанию - во временном каталоге)')
+args = parser.parse_args()
+
+# Прогон работает с отдельной базой, а не с task_manager.db
+db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='soak_bot_'), 'soak.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+os.environ['LOG_LEVEL'] = 'ERROR'
+
+import logging
+import warnings
+logging.disable(logging.WARNING)
+
+from sqlalchemy.orm import Session
+from telegram import Bot, Update, User
+from telegram.ext import Application, SimpleUpdateProcessor
+from telegram.warnings import PTBUserWarning
+from app.core.database import DatabaseManager, init_db, init_sample_data, RoleEnum, ShiftEnum
+from app.bot.bot import register_handlers
+from app.bot.update_processor import SessionUpdateProcessor
+
+# Предупреждения PTB о per_message в ConversationHandler бота к прогону не относятся
+warnings.filterwarnings('ignore', category=PTBUserWarning)
+
+MANAGER_TELEGRAM_ID = 9_000_000_000
+EMPLOYEE_TELEGRAM_ID = 9_100_000_000
+TASKS_PER_EMPLOYEE = 40
+
+
+class OfflineBot(Bot):
+    """Bot без сети: вызовы Bot API только считаются"""
+
+    sent = 0
+
+    async def initialize(self):
+        self._bot_user = User(id=1, first_name='Offline', is_bot=True, username='offline_bot')
+
+    async def shutdown(self):
+        pass
+
+    async def _offline(self, *args, **kwargs):
+        OfflineBot.sent += 1
+        return True
+
+    send_message = edit_message_text = answer_callback_query = send_document = _offline
+
+
+def seed():
+    """Начальник, сотрудники и задания на них"""
+    init_db()
+    init_sample_data()
+    with DatabaseManager() as db:
+        manager = db.create_user(MANAGER_TELEGRAM_ID, 'manager', 'Начальник', RoleEnum.MANAGER)
+        refs = db.get_reference_data()
+        equipment = refs.get_all_equipment()[0]
+        product = refs.get_products_for_equipment(equipment.id)[0]
+        rows = []
+        for i in range(args.employees):
+            employee = db.create_user(EMPLOYEE_TELEGRAM_ID + i, f'employee{i}', f'Сотрудник {i}', RoleEnum.EMPLOYEE)
+            rows += [
+                {'employee_id': employee.id, 'equipment_id': equipment.id, 'product_id': product.id,
+                 'planned_quantity': 10 + n, 'shift': ShiftEnum.FIRST,
+                 'task_date': datetime(2026, 1, 1 + n % 28)}
+                for n in range(TASKS_PER_EMPLOYEE)
+            ]
+        for start in range(0, len(rows), 1000):
+            db.create_tasks_bulk(manager.id, rows[start:start + 1000])
+
+
+def make_update(update_id, telegram_id, text=None, data=None):
+    """Update в формате Bot API: сообщение с текстом или нажатие inline-кнопки"""
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'User', 'username': f'u{telegram_id}'}
+    message = {
+        'message_id': update_id, 'date': int(time.time()),
+        'chat': {'id': telegram_id, 'type': 'private'}, 'from': user, 'text': text or '',
+    }
+    if text is not None:
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return {'update_id': update_id, 'message': message}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': str(telegram_id), 'data': data, 'message': message,
+    }}
+
+
+def script():
+    """Бесконечная последовательность (telegram_id, текст, callback_data) - действия пользователей"""
+    i = 0
+    while True:
+        employee = EMPLOYEE_TELEGRAM_ID + i % args.employees
+        yield employee, '📋 Мои задания', None
+        yield employee, None, 'status_all'
+        yield employee, '🔔 Уведомления', None
+        yield MANAGER_TELEGRAM_ID, '📊 Мои задания', None
+        yield MANAGER_TELEGRAM_ID, None, 'mgr_status_all'
+        if i % 10 == 0:
+            yield employee, '/start', None
+        i += 1
+
+
+def rss_mb():
+    """Текущий RSS процесса, МБ"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def live_sessions():
+    gc.collect()
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, Session))
+
+
+errors = []
+
+
+async def count_error(update, context):
+    errors.append(context.error)
+
+
+def check(condition, message):
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+async def run():
+    processor = SessionUpdateProcessor(1) if args.processor == 'session' else SimpleUpdateProcessor(1)
+    bot = OfflineBot('0:offline')
+    application = Application.builder().bot(bot).updater(None).concurrent_updates(processor).build()
+    register_handlers(application)
+    application.add_error_handler(count_error)
+    await application.initialize()
+
+    checkpoint = max(args.updates // 10, 1)
+    samples = []
+    actions = script()
+    started = time.perf_counter()
+    print(f"{'обновлений':>10} {'RSS, МБ':>9} {'сессий':>7} {'обн/с':>8}")
+    for update_id in range(1, args.updates + 1):
+        telegram_id, text, data = next(actions)
+        update = Update.de_json(make_update(update_id, telegram_id, text, data), bot)
+        # Так же, как Application при run_polling: процессор и process_update
+        await processor.process_update(update, application.process_update(update))
+        if update_id % checkpoint == 0:
+            samples.append((rss_mb(), live_sessions()))
+            print(f"{update_id:>10} {samples[-1][0]:>9.1f} {samples[-1][1]:>7} "
+                  f"{update_id / (time.perf_counter() - started):>8.0f}")
+    await application.shutdown()
+    return samples
+
+
+def main():
+    seed()
+    print(f"База: {db_path}, процессор: {args.processor}, сотрудников: {args.employees}\n")
+    samples = asyncio.run(run())
+
+    # Первая точка - после прогрева (пулы, кэши, импорт модулей обработчиков)
+    growth = samples[-1][0] - samples[0][0]
+    print(f"\nВызовов Bot API: {OfflineBot.sent}, рост RSS после прогрева: {growth:+.1f} МБ")
+    check(growth <= args.max_growth_mb, f"RSS не растет больше {args.max_growth_mb} МБ")
+    check(not errors, f"обновления обработаны без ошибок ({len(errors)})")
+    check(samples[-1][1] <= 1, "сессии обновлений закрыты")
+
+
+if __name__ == '__main__':
+    main()